@@ -1,6 +1,5 @@
 # app/__init__.py
 from flask import Flask
-from werkzeug.security import generate_password_hash
 from .config import Config
 from .extensions import db, login_manager, mail
 import os
@@ -29,13 +28,33 @@ def create_app():
     # ================================================
     # ⭐ REGISTER SOCKET.IO WITH THE APP
     # ================================================
-    socketio.init_app(app, cors_allowed_origins="*")   # <--- REQUIRED
+    from .utils.socket_bus import socketio_bus_options
+    async_mode = app.config["SOCKETIO_ASYNC_MODE"]
+    socketio.init_app(
+        app,
+        cors_allowed_origins="*",
+        async_mode=None if async_mode in (None, "auto") else async_mode,
+        **socketio_bus_options(app.config)
+    )   # <--- REQUIRED
     # ================================================
 
     # Login redirect setup
     login_manager.login_view = "auth.login"
     login_manager.login_message_category = "info"
 
+    from .utils.identity import configure_identity_cache
+    from .utils.passwords import configure_password_hashing
+    from .utils.throttle import configure_login_throttle
+    from .utils.metrics import configure_metrics
+    from .utils.mailer import configure_notifications
+    from .utils.pregen import configure_pregen
+    configure_identity_cache(app)
+    configure_password_hashing(app, socketio.async_mode)
+    configure_login_throttle(app)
+    configure_metrics(app)
+    configure_notifications(app)
+    configure_pregen(app)
+
     # Register Blueprints
     from app.routes.auth import auth_bp
     app.register_blueprint(auth_bp)
@@ -49,29 +68,14 @@ def create_app():
     app.register_blueprint(patient_bp)
     app.register_blueprint(device_api_bp)
 
-    # Create database tables and default admin
-    with app.app_context():
-        from .models import User
-        db.create_all()
-
-        admin_username = "admin"
-        admin = User.query.filter_by(username=admin_username).first()
+    # Socket.IO event handlers (room membership)
+    from app.routes import sockets  # noqa: F401
 
-        if not admin:
-            admin_user = User(
-                username=admin_username,
-                name="Super Admin",
-                email=None,
-                password_hash=generate_password_hash("admin123"),
-                role="admin",
-                approved=True
-            )
-            db.session.add(admin_user)
-            db.session.commit()
-            print("✅ Default admin created:")
-            print("   Username: admin")
-            print("   Password: admin123")
+    # Schema + default admin are created by `flask init-db`
+    # (once per deploy), not on every worker boot
+    from .commands import register_commands
+    register_commands(app)
 
-        print("🚀 Smart Pill Dispenser Portal Initialized Successfully")
+    print("🚀 Smart Pill Dispenser Portal Initialized Successfully")
 
     return app
@@ -0,0 +1,230 @@
+# app/commands.py
+
+import os
+import re
+import subprocess
+import sys
+
+import click
+from flask import current_app
+from werkzeug.security import generate_password_hash
+
+from app.extensions import db
+
+
+# =========================================================
+# ONE-TIME DATABASE SET-UP
+# =========================================================
+def init_db():
+    """
+    Create / upgrade the schema and the default admin.
+    Run once per deploy (flask init-db), not on every worker boot.
+    """
+    from app.models import User
+    from app.utils.schema import ensure_schema
+
+    ensure_schema()
+
+    admin_username = "admin"
+    admin = User.query.filter_by(username=admin_username).first()
+
+    if not admin:
+        admin_user = User(
+            username=admin_username,
+            name="Super Admin",
+            email=None,
+            password_hash=generate_password_hash(
+                "admin123", current_app.config["PASSWORD_HASH_METHOD"]
+            ),
+            role="admin",
+            approved=True
+        )
+        db.session.add(admin_user)
+        db.session.commit()
+        print("✅ Default admin created:")
+        print("   Username: admin")
+        print("   Password: admin123")
+
+
+# =========================================================
+# START-UP PROFILE
+# =========================================================
+# Modules that must not load while a worker boots; they are
+# imported on first use (see device_sync.audio_stack).
+LAZY_MODULES = ("gtts", "pydub", "numpy", "miniaudio")
+
+# Most of a boot is Flask / SQLAlchemy / Socket.IO importing
+# themselves, which depends on the machine. The framework floor is
+# timed on its own, so the app's share (its modules, models, routes
+# and create_app) gets a budget that means the same on a laptop and
+# a slow CI box (tests/test_startup.py).
+APP_BOOT_BUDGET = 0.3              # seconds on top of the framework floor
+
+_BOOT = (
+    "import time; t = time.perf_counter(); "
+    "from app import create_app; create_app(); "
+    "print('BOOT_SECONDS', time.perf_counter() - t)"
+)
+
+_FLOOR = (
+    "import time; t = time.perf_counter(); "
+    "import flask, flask_login, flask_mail, flask_socketio, flask_sqlalchemy, sqlalchemy.orm; "
+    "print('FLOOR_SECONDS', time.perf_counter() - t)"
+)
+
+
+def framework_floor(runs=3):
+    """
+    Fastest of RUNS fresh-interpreter imports of the framework alone
+    (under -X importtime too, like profile_startup, so the two compare).
+    """
+    times = []
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", _FLOOR],
+                              capture_output=True, text=True)
+        if proc.returncode:
+            raise click.ClickException(proc.stderr[-2000:])
+        times.append(float(re.search(r"FLOOR_SECONDS ([\d.]+)", proc.stdout).group(1)))
+    return min(times)
+
+
+def profile_startup(async_mode="threading"):
+    """
+    Boot the app in a fresh interpreter under -X importtime.
+    Returns (seconds, {module: cumulative_us}, lazy modules that loaded).
+    """
+    env = dict(os.environ, SOCKETIO_ASYNC_MODE=async_mode)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _BOOT],
+        capture_output=True, text=True, env=env
+    )
+    if proc.returncode:
+        raise click.ClickException(proc.stderr[-2000:])
+
+    seconds = float(re.search(r"BOOT_SECONDS ([\d.]+)", proc.stdout).group(1))
+
+    modules, loaded = {}, set()
+    for line in proc.stderr.splitlines():
+        m = re.match(r"import time:\s+\d+ \|\s+(\d+) \| ( *)(\S+)$", line)
+        if not m:
+            continue
+        cumulative, indent, name = int(m.group(1)), m.group(2), m.group(3)
+        if not indent:
+            modules[name] = cumulative
+        if name.split(".")[0] in LAZY_MODULES:
+            loaded.add(name.split(".")[0])
+
+    return seconds, modules, sorted(loaded)
+
+
+def register_commands(app):
+
+    @app.cli.command("init-db")
+    def init_db_command():
+        """Create tables, indexes, the log search index and the default admin."""
+        init_db()
+        print("🚀 Database ready")
+
+    @app.cli.command("provision-devices")
+    @click.argument("path", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--format", "fmt", type=click.Choice(["csv", "json"]), help="default: from the file")
+    @click.option("--dry-run", is_flag=True, help="validate only, write nothing")
+    @click.option("--report", "report_path", type=click.Path(dir_okay=False),
+                  help="write the full per-row report as JSON")
+    def provision_devices_command(path, fmt, dry_run, report_path):
+        """Bulk-add devices from a CSV / JSON file (see app/utils/provisioning.py)."""
+        import json
+        import time
+        from app.utils.provisioning import parse_rows, provision_devices, ProvisioningError
+
+        with open(path, "rb") as f:
+            data = f.read()
+        fmt = fmt or (path.rsplit(".", 1)[-1].lower() if "." in path else None)
+
+        started = time.perf_counter()
+        try:
+            report = provision_devices(parse_rows(data, fmt), dry_run=dry_run)
+        except ProvisioningError as e:
+            raise click.ClickException(str(e))
+
+        for entry in report["rows"]:
+            if entry["errors"]:
+                print(f"  row {entry['row']:>6}  {entry['device_code'] or '-':<20} "
+                      f"{entry['status']:<10} {'; '.join(entry['errors'])}")
+
+        if report_path:
+            with open(report_path, "w") as f:
+                json.dump(report, f, indent=2)
+
+        verb = "Valid" if dry_run else "Created"
+        print(f"{'🧪' if dry_run else '✅'} {verb}: {report['valid']}  duplicates: {report['duplicates']}  "
+              f"errors: {report['errors']}  ({time.perf_counter() - started:.2f}s)")
+        if report["duplicates"] or report["errors"]:
+            sys.exit(1)
+
+    @app.cli.command("broadcast-command")
+    @click.argument("command")
+    @click.option("--data", help="JSON object passed with the command")
+    @click.option("--owner", "owner_ids", type=int, multiple=True, help="owner (patient) id; repeatable")
+    @click.option("--language", help="only devices set to this language code")
+    @click.option("--doctor", "doctor_id", type=int, help="only devices of this doctor's patients")
+    @click.option("--rate", type=int, help="devices released per minute (default BROADCAST_RATE_PER_MINUTE)")
+    def broadcast_command_cli(command, data, owner_ids, language, doctor_id, rate):
+        """Queue a command for many devices, released gradually via heartbeats."""
+        import json
+        from app.utils.broadcast import broadcast_command, BroadcastError
+
+        try:
+            summary = broadcast_command(
+                command, data=json.loads(data) if data else None,
+                owner_ids=list(owner_ids), language=language,
+                doctor_id=doctor_id, rate_per_minute=rate
+            )
+        except (BroadcastError, ValueError) as e:
+            raise click.ClickException(str(e))
+        print(json.dumps(summary, indent=2))
+
+    @app.cli.command("gc-audio-packs")
+    @click.option("--grace", type=int, help="seconds (default PACK_GC_GRACE)")
+    def gc_audio_packs_command(grace):
+        """Delete audio packs and legacy clips that no manifest references."""
+        from app.utils.audio_packs import collect_all
+        from app.utils.device_sync import BASE_AUDIO_DIR
+
+        if grace is None:
+            grace = current_app.config["PACK_GC_GRACE"]
+        removed = collect_all(BASE_AUDIO_DIR, grace)
+        print(f"🧹 Removed {removed} unreferenced packs / legacy entries")
+
+    @app.cli.command("startup-profile")
+    @click.option("--budget", default=1.0, show_default=True, help="max boot seconds")
+    @click.option("--app-budget", default=APP_BOOT_BUDGET, show_default=True,
+                  help="max seconds the app adds on top of the framework imports")
+    @click.option("--runs", default=3, show_default=True, help="boots to time (fastest counts)")
+    @click.option("--top", default=10, show_default=True, help="slowest top-level imports to list")
+    def startup_profile_command(budget, app_budget, runs, top):
+        """Check worker boot time and that the audio stack stays lazy."""
+        profiles = [profile_startup() for _ in range(max(runs, 1))]
+        seconds, modules, loaded = min(profiles, key=lambda p: p[0])
+        floor = framework_floor(runs)
+        share = seconds - floor
+
+        print(f"Boot (import + create_app): {seconds:.3f}s (budget {budget:.2f}s)")
+        print(f"  framework imports {floor:.3f}s, app {share:.3f}s (budget {app_budget:.2f}s)")
+        for name, us in sorted(modules.items(), key=lambda kv: -kv[1])[:top]:
+            print(f"  {us / 1000:8.1f} ms  {name}")
+
+        failed = False
+        if loaded:
+            print(f"❌ Loaded at start-up but should be lazy: {', '.join(loaded)}")
+            failed = True
+        if seconds > budget:
+            print(f"❌ Boot took {seconds:.3f}s, over the {budget:.2f}s budget")
+            failed = True
+        if share > app_budget:
+            print(f"❌ The app adds {share:.3f}s to boot, over the {app_budget:.2f}s budget")
+            failed = True
+
+        if failed:
+            sys.exit(1)
+        print("✅ Start-up profile OK")
@@ -6,13 +6,94 @@ BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 
 class Config:
     SECRET_KEY = os.environ.get("SECRET_KEY") or "super-secret-key"
-    SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(BASE_DIR, "smartpill.db")
+    SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URL") or \
+        "sqlite:///" + os.path.join(BASE_DIR, "smartpill.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
-    # Email config (for admin approvals)
-    MAIL_SERVER = "smtp.gmail.com"
-    MAIL_PORT = 587
-    MAIL_USE_TLS = True
+    # Email config (for admin approvals and alert digests)
+    MAIL_SERVER = os.environ.get("MAIL_SERVER") or "smtp.gmail.com"
+    MAIL_PORT = int(os.environ.get("MAIL_PORT") or 587)
+    MAIL_USE_TLS = os.environ.get("MAIL_USE_TLS", "1") == "1"
     MAIL_USERNAME = os.environ.get("MAIL_USERNAME")
     MAIL_PASSWORD = os.environ.get("MAIL_PASSWORD")
     MAIL_DEFAULT_SENDER = MAIL_USERNAME
+
+    # Dose history page (keyset pagination)
+    HISTORY_PAGE_SIZE = 50
+
+    # Admin dashboard tables
+    ADMIN_PAGE_SIZE = 50
+
+    # Flask-Login identity cache (per process)
+    IDENTITY_CACHE_SIZE = 10000
+    IDENTITY_CACHE_TTL = 60          # seconds; bounds cross-worker staleness
+    IDENTITY_IN_SESSION = os.environ.get("IDENTITY_IN_SESSION") == "1"
+
+    # Password hashing (bounded off-request pool)
+    PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD") or "scrypt"   # werkzeug's default
+    PASSWORD_HASH_WORKERS = 2
+    PASSWORD_HASH_MAX_PENDING = 8     # in flight + queued; beyond this → "busy"
+    PASSWORD_HASH_TIMEOUT = 10        # seconds
+
+    # Login / signup throttling (checked before any hashing)
+    LOGIN_MAX_PER_IP = 30             # failed logins + signups
+    LOGIN_IP_WINDOW = 60              # seconds
+    LOGIN_MAX_FAILURES_PER_USER = 5
+    LOGIN_USER_WINDOW = 300           # seconds
+
+    # Socket.IO inter-worker bus: unset = in-process,
+    # "local://127.0.0.1:5099" = bundled broker, or a redis:// / amqp:// URL
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get("SOCKETIO_MESSAGE_QUEUE")
+    SOCKETIO_BROKER_KEY = os.environ.get("SOCKETIO_BROKER_KEY") or SECRET_KEY
+
+    # Request / SQL metrics (served on /metrics, Prometheus format)
+    METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+    METRICS_TOKEN = os.environ.get("METRICS_TOKEN")   # unset → localhost scrapes only
+    METRICS_SLOW_QUERY_MS = 100
+    METRICS_N_PLUS_ONE = 20           # queries per request before it is flagged
+
+    # Outbound alert notifications (app/utils/mailer.py)
+    NOTIFY_ENABLED = os.environ.get("NOTIFY_ENABLED", "1") == "1"
+    NOTIFY_CHANNELS = os.environ.get("NOTIFY_CHANNELS") or ""   # opt-in: email,socketio,webhook
+    NOTIFY_BATCH_WINDOW = 2.0         # seconds alerts are gathered into one digest
+    NOTIFY_BATCH_SIZE = 500           # alerts per batch, at most
+    NOTIFY_QUEUE_SIZE = 10000         # beyond this, new alerts are dropped (and counted)
+    NOTIFY_MAX_ATTEMPTS = 5           # per digest and channel
+    NOTIFY_RETRY_BASE = 2.0           # seconds; doubles each attempt
+    NOTIFY_WEBHOOK_URL = os.environ.get("NOTIFY_WEBHOOK_URL")
+    NOTIFY_WEBHOOK_SECRET = os.environ.get("NOTIFY_WEBHOOK_SECRET")
+    NOTIFY_WEBHOOK_TIMEOUT = 5        # seconds
+
+    # Fleet broadcast commands: devices released per minute through heartbeats
+    BROADCAST_RATE_PER_MINUTE = int(os.environ.get("BROADCAST_RATE_PER_MINUTE") or 600)
+
+    # Text-to-speech: "gtts" (Google, needs network + ffmpeg) or
+    # "stub" (short local tone per clip; for load tests and offline dev)
+    TTS_BACKEND = os.environ.get("TTS_BACKEND") or "gtts"
+
+    # Shared phrase-fragment cache (content-addressed, safe to delete)
+    AUDIO_FRAGMENT_DIR = os.environ.get("AUDIO_FRAGMENT_DIR") or os.path.join(BASE_DIR, "audio_fragments")
+
+    # Audio packs nobody holds are deleted this long after their last release
+    PACK_GC_GRACE = int(os.environ.get("PACK_GC_GRACE") or 3600)   # seconds
+
+    # Build a patient's pack in the background after medication / language
+    # edits, once no further edit has arrived for AUDIO_PREGEN_DELAY seconds
+    AUDIO_PREGEN_ENABLED = os.environ.get("AUDIO_PREGEN_ENABLED", "1") == "1"
+    AUDIO_PREGEN_DELAY = float(os.environ.get("AUDIO_PREGEN_DELAY") or 5)
+
+    # Sync bundles written as files and served behind signed URLs
+    # (sync_files). SYNC_FILE_SERVING: send_file / x-sendfile / x-accel
+    SYNC_FILE_DIR = os.environ.get("SYNC_FILE_DIR") or os.path.join(BASE_DIR, "sync_data")
+    SYNC_FILE_SERVING = os.environ.get("SYNC_FILE_SERVING") or "send_file"
+    SYNC_FILE_ACCEL_PREFIX = os.environ.get("SYNC_FILE_ACCEL_PREFIX") or "/_sync_data/"
+    SYNC_URL_TTL = int(os.environ.get("SYNC_URL_TTL") or 900)    # seconds
+
+    # Production server (serve.py)
+    SOCKETIO_ASYNC_MODE = os.environ.get("SOCKETIO_ASYNC_MODE")   # gevent / eventlet / threading / auto
+    SERVER_HOST = os.environ.get("SERVER_HOST") or "0.0.0.0"
+    SERVER_PORT = int(os.environ.get("SERVER_PORT") or 5000)
+    SERVER_WORKERS = int(os.environ.get("SERVER_WORKERS") or 1)
+    SERVER_MAX_CONNECTIONS = int(os.environ.get("SERVER_MAX_CONNECTIONS") or 5000)   # per worker
+    SERVER_KEEPALIVE = 75            # seconds an idle keep-alive connection is held (eventlet)
+    SERVER_SHUTDOWN_GRACE = 20       # seconds to let in-flight requests finish
@@ -10,7 +10,9 @@ from .extensions import db, login_manager
 # ------------------------------------------------------
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    # Served from the per-process identity cache (see utils/identity.py)
+    from .utils.identity import load_identity
+    return load_identity(int(user_id))
 
 
 # ------------------------------------------------------
@@ -26,7 +28,7 @@ class User(UserMixin, db.Model):
     password_hash = db.Column(db.String(200), nullable=False)
     role = db.Column(db.String(20), nullable=False)  # patient / doctor / admin
     approved = db.Column(db.Boolean, default=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
     # Relationships
     devices = db.relationship(
@@ -86,14 +88,21 @@ class Device(db.Model):
     total_compartments = db.Column(db.Integer, default=8)
 
     data_dirty = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
     states = db.relationship("DeviceState", backref="device", lazy=True)
     logs = db.relationship("Log", backref="device", lazy=True)
+    sync_snapshot = db.relationship(
+        "DeviceSyncSnapshot", backref="device", uselist=False,
+        cascade="all, delete-orphan"
+    )
+
+    ONLINE_SECONDS = 120
 
     def is_online(self):
         if not self.last_heartbeat:
             return False
-        return (datetime.utcnow() - self.last_heartbeat).total_seconds() < 120
+        return (datetime.utcnow() - self.last_heartbeat).total_seconds() < self.ONLINE_SECONDS
 
     def __repr__(self):
         return f"<Device {self.device_code}>"
@@ -204,6 +213,15 @@ class Log(db.Model):
     pill_sensor = db.Column(db.Boolean, default=False)
     dustbin_sensor = db.Column(db.Boolean, default=False)
 
+    __table_args__ = (
+        # history + analytics: a patient's meds, newest first
+        db.Index("ix_log_med_time", "med_id", "taken_time"),
+    )
+
+    @property
+    def missed(self):
+        return self.status == "missed"
+
     def __repr__(self):
         return f"<Log {self.med_name} {self.status} ({self.taken_time})>"
 
@@ -241,6 +259,14 @@ class DeviceCommandQueue(db.Model):
     processed = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Broadcasts stagger delivery: held back until this time (NULL = now)
+    not_before = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        # heartbeat: this device's pending commands
+        db.Index("ix_device_cmd_pending", "device_code", "processed"),
+    )
+
     def __repr__(self):
         return f"<Cmd {self.device_code}: {self.command}>"
 
@@ -252,9 +278,9 @@ class DeviceState(db.Model):
     __tablename__ = "device_state"
 
     id = db.Column(db.Integer, primary_key=True)
-    device_id = db.Column(db.Integer, db.ForeignKey("device.id"))
+    device_id = db.Column(db.Integer, db.ForeignKey("device.id"), unique=True, index=True)
 
-    files = db.Column(db.JSON)  # {"audio":[], "json":[], "logs":[]}
+    files = db.Column(db.JSON)  # legacy blob, no longer written — see DeviceFile
     storage_used = db.Column(db.Integer)
     storage_total = db.Column(db.Integer)
 
@@ -263,6 +289,103 @@ class DeviceState(db.Model):
     def __repr__(self):
         return f"<DeviceState Device={self.device_id}>"
 
+
+# ------------------------------------------------------
+# DEVICE FILE INVENTORY (one row per file on the device)
+# ------------------------------------------------------
+class DeviceFile(db.Model):
+    __tablename__ = "device_file"
+
+    id = db.Column(db.Integer, primary_key=True)
+    device_id = db.Column(db.Integer, db.ForeignKey("device.id"), nullable=False)
+
+    path = db.Column(db.String(255), nullable=False)
+    category = db.Column(db.String(20))     # audio / json / logs
+    size = db.Column(db.Integer)
+    hash = db.Column(db.String(64))
+
+    seen_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint("device_id", "path", name="unique_device_file"),
+    )
+
+    def __repr__(self):
+        return f"<DeviceFile {self.device_id}:{self.path}>"
+
+
+class DeviceFileEvent(db.Model):
+    __tablename__ = "device_file_event"
+
+    id = db.Column(db.Integer, primary_key=True)
+    device_id = db.Column(db.Integer, db.ForeignKey("device.id"), nullable=False)
+
+    path = db.Column(db.String(255), nullable=False)
+    action = db.Column(db.String(10))       # added / removed / changed
+    size = db.Column(db.Integer)
+    hash = db.Column(db.String(64))
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("ix_device_file_event_device_time", "device_id", "created_at"),
+    )
+
+    def __repr__(self):
+        return f"<DeviceFileEvent {self.action} {self.path}>"
+
+
+class DeviceStorageSample(db.Model):
+    __tablename__ = "device_storage_sample"
+
+    id = db.Column(db.Integer, primary_key=True)
+    device_id = db.Column(db.Integer, db.ForeignKey("device.id"), nullable=False)
+
+    storage_used = db.Column(db.Integer)
+    storage_total = db.Column(db.Integer)
+    recorded_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("ix_device_storage_sample_device_time", "device_id", "recorded_at"),
+    )
+
+
+# ------------------------------------------------------
+# DEVICE SYNC SNAPSHOT (what the device is served)
+# ------------------------------------------------------
+class DeviceSyncSnapshot(db.Model):
+    __tablename__ = "device_sync_snapshot"
+
+    id = db.Column(db.Integer, primary_key=True)
+    device_id = db.Column(db.Integer, db.ForeignKey("device.id"), unique=True, nullable=False)
+
+    # Hash of the rows the payloads are built from (see sync_snapshot)
+    content_version = db.Column(db.String(16), nullable=False)
+    language = db.Column(db.String(10))
+
+    config = db.Column(db.JSON)
+    schedule = db.Column(db.JSON)
+    manifest = db.Column(db.JSON)
+
+    config_hash = db.Column(db.String(16))
+    schedule_hash = db.Column(db.String(16))
+    manifest_hash = db.Column(db.String(16))
+
+    # Hashes the device confirmed with sync_done
+    synced_config_hash = db.Column(db.String(16))
+    synced_schedule_hash = db.Column(db.String(16))
+    synced_manifest_hash = db.Column(db.String(16))
+
+    built_at = db.Column(db.DateTime, default=datetime.utcnow)
+    synced_at = db.Column(db.DateTime)
+
+    # A download was served this snapshot while it was out of date
+    served_stale = db.Column(db.Boolean, default=False)
+
+    def __repr__(self):
+        return f"<DeviceSyncSnapshot Device={self.device_id} v={self.content_version}>"
+
+
 class DeviceSyncStatus(db.Model):
     __tablename__ = "device_sync_status"
 
@@ -1,8 +1,12 @@
 # app/routes/admin.py
 # app/routes/admin.py
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
 from flask_login import login_required, current_user
+from sqlalchemy import or_
+from sqlalchemy.orm import joinedload
 from app.models import db, User, Device
+from app.utils.identity import invalidate_identity
+from app.utils.admin_stats import user_counts, device_count, growth_series, invalidate_growth
 from functools import wraps
 
 admin_bp = Blueprint("admin", __name__, url_prefix="/admin")
@@ -17,22 +21,35 @@ def admin_required(f):
         return f(*args, **kwargs)
     return wrapper
 
+def resolve_patient(ref):
+    """
+    Owner field (patient ID or username) → (owner_id, error).
+    Empty means unassigned.
+    """
+    ref = (ref or "").strip()
+    if not ref:
+        return None, None
+    if ref.isdigit():
+        user = db.session.get(User, int(ref))
+    else:
+        user = User.query.filter_by(username=ref).first()
+    if user is None:
+        return None, f"❌ No user '{ref}'."
+    if user.role != "patient":
+        return None, f"❌ {user.name} is a {user.role}, not a patient."
+    return user.id, None
+
+
 # --- DASHBOARD ---
 @admin_bp.route("/dashboard", methods=["GET", "POST"])
 @login_required
 @admin_required
 def dashboard():
-    users = User.query.all()
-    patients = [u for u in users if u.role == "patient"]
-    doctors = [u for u in users if u.role == "doctor"]
-    devices = Device.query.all()
-    pending_users = [u for u in users if not u.approved]
-
     if request.method == "POST":
         # Add device
         if "add_device" in request.form:
             device_code = request.form.get("device_code")
-            owner_id = request.form.get("owner_id") or None
+            owner_id, error = resolve_patient(request.form.get("owner_id"))
             compartments = int(request.form.get("total_compartments", 8))
             if not device_code:
                 flash("⚠️ Device code required.", "warning")
@@ -40,9 +57,13 @@ def dashboard():
             if Device.query.filter_by(device_code=device_code).first():
                 flash("❌ Device code already exists!", "danger")
                 return redirect(url_for("admin.dashboard"))
+            if error:
+                flash(error, "danger")
+                return redirect(url_for("admin.dashboard"))
             new_device = Device(device_code=device_code, owner_id=owner_id, total_compartments=compartments)
             db.session.add(new_device)
             db.session.commit()
+            invalidate_growth()
             flash(f"✅ Added device {device_code} with {compartments} compartments.", "success")
 
         # Approve user
@@ -51,6 +72,7 @@ def dashboard():
             user = User.query.get(user_id)
             user.approved = True
             db.session.commit()
+            invalidate_identity(user_id)
             flash(f"✅ Approved {user.name} ({user.role}).", "success")
 
         # Reject user
@@ -59,6 +81,7 @@ def dashboard():
             user = User.query.get(user_id)
             db.session.delete(user)
             db.session.commit()
+            invalidate_identity(user_id)
             flash(f"❌ Rejected user {user.name}.", "danger")
 
         # Delete user
@@ -67,6 +90,7 @@ def dashboard():
             user = User.query.get(user_id)
             db.session.delete(user)
             db.session.commit()
+            invalidate_identity(user_id)
             flash(f"🗑️ Deleted {user.name}.", "danger")
 
         # Delete device
@@ -80,7 +104,10 @@ def dashboard():
         # Change device owner
         if "update_device_owner" in request.form:
             device_code = request.form.get("device_code")
-            owner_id = request.form.get("owner_id") or None
+            owner_id, error = resolve_patient(request.form.get("owner_id"))
+            if error:
+                flash(error, "danger")
+                return redirect(url_for("admin.dashboard"))
             device = Device.query.filter_by(device_code=device_code).first()
             device.owner_id = owner_id
             db.session.commit()
@@ -88,44 +115,175 @@ def dashboard():
 
         return redirect(url_for("admin.dashboard"))
 
+    page_size = current_app.config["ADMIN_PAGE_SIZE"]
+    counts = user_counts()
+
+    # ---- Pending approvals ----
+    pending_users = User.query.filter_by(approved=False).order_by(
+        User.created_at
+    ).paginate(
+        page=request.args.get("pending_page", 1, type=int),
+        per_page=page_size,
+        error_out=False
+    )
+
+    # ---- Users table (filtered + paginated in SQL) ----
+    user_q = request.args.get("user_q", "").strip()
+    user_role = request.args.get("user_role", "")
+
+    users_query = User.query.filter(User.role != "admin")
+    if user_q:
+        users_query = users_query.filter(or_(
+            User.name.ilike(f"{user_q}%"),
+            User.username.ilike(f"{user_q}%")
+        ))
+    if user_role:
+        users_query = users_query.filter(User.role == user_role)
+
+    users = users_query.order_by(User.id.desc()).paginate(
+        page=request.args.get("user_page", 1, type=int),
+        per_page=page_size,
+        error_out=False
+    )
+
+    # ---- Devices table ----
+    device_q = request.args.get("device_q", "").strip()
+    device_owner = request.args.get("device_owner", "")
+
+    devices_query = Device.query.options(joinedload(Device.owner))
+    if device_q:
+        devices_query = devices_query.filter(Device.device_code.ilike(f"{device_q}%"))
+    if device_owner == "assigned":
+        devices_query = devices_query.filter(Device.owner_id.isnot(None))
+    elif device_owner == "unassigned":
+        devices_query = devices_query.filter(Device.owner_id.is_(None))
+
+    devices = devices_query.order_by(Device.id.desc()).paginate(
+        page=request.args.get("device_page", 1, type=int),
+        per_page=page_size,
+        error_out=False
+    )
+
     return render_template(
         "admin/dashboard.html",
-        patients=patients,
-        doctors=doctors,
+        users=users,
         devices=devices,
         pending_users=pending_users,
-        total_users=len(users),
-        total_patients=len(patients),
-        total_doctors=len(doctors),
-        total_devices=len(devices),
+        user_q=user_q,
+        user_role=user_role,
+        device_q=device_q,
+        device_owner=device_owner,
+        total_users=counts["total"],
+        total_patients=counts["by_role"].get("patient", 0),
+        total_doctors=counts["by_role"].get("doctor", 0),
+        total_pending=counts["pending"],
+        total_devices=device_count(),
         title="Admin Dashboard"
     )
 
-from datetime import datetime, timedelta
 from flask import jsonify
-import random
+from app.utils.provisioning import parse_rows, provision_devices, ProvisioningError
+from app.utils.broadcast import broadcast_command, BroadcastError
 
 @admin_bp.route("/dashboard-data")
 @login_required
 @admin_required
 def dashboard_data():
-    # Simulate or compute weekly stats
-    today = datetime.utcnow().date()
-    dates = [(today - timedelta(days=i)).strftime("%b %d") for i in reversed(range(7))]
-    user_growth = [random.randint(1, 5) for _ in range(7)]
-    device_growth = [random.randint(0, 3) for _ in range(7)]
+    days = min(max(request.args.get("days", 7, type=int), 1), 90)
+    growth = growth_series(days)
+
+    counts = user_counts()
+    total_users = counts["total"]
+    approved_users = counts["approved"]
 
     approval_rate = 0
-    total_users = User.query.count()
-    approved_users = User.query.filter_by(approved=True).count()
     if total_users > 0:
         approval_rate = round((approved_users / total_users) * 100, 2)
 
     return jsonify({
-        "dates": dates,
-        "user_growth": user_growth,
-        "device_growth": device_growth,
+        "dates": growth["dates"],
+        "user_growth": growth["user_growth"],
+        "device_growth": growth["device_growth"],
         "approval_rate": approval_rate,
         "total_users": total_users,
         "approved_users": approved_users
     })
+
+
+# --- PATIENT PICKER (owner fields) ---
+@admin_bp.route("/patients/search")
+@login_required
+@admin_required
+def search_patients():
+    q = request.args.get("q", "").strip()
+    query = User.query.filter(User.role == "patient")
+    if q:
+        query = query.filter(or_(
+            User.name.ilike(f"{q}%"),
+            User.username.ilike(f"{q}%")
+        ))
+    patients = query.order_by(User.name).limit(20).all()
+    return jsonify([
+        {"id": p.id, "name": p.name, "username": p.username} for p in patients
+    ])
+
+
+# --- BULK DEVICE IMPORT ---
+# Body: a CSV / JSON file in the "file" form field, or the raw CSV / JSON
+# request body. ?dry_run=1 validates only. Returns the per-row report.
+@admin_bp.route("/devices/import", methods=["POST"])
+@login_required
+@admin_required
+def import_devices():
+    upload = request.files.get("file")
+    if upload:
+        data = upload.read()
+        fmt = upload.filename.rsplit(".", 1)[-1] if "." in upload.filename else None
+    else:
+        data = request.get_data()
+        fmt = "json" if request.is_json else None
+
+    dry_run = request.values.get("dry_run") in ("1", "true", "on")
+
+    try:
+        report = provision_devices(parse_rows(data, fmt), dry_run=dry_run)
+    except ProvisioningError as e:
+        return jsonify({"error": str(e)}), 400
+
+    status = 200 if report["errors"] == 0 and report["duplicates"] == 0 else 207
+    return jsonify(report), status
+
+
+# --- FLEET BROADCAST ---
+# JSON or form: command, data (object), owner_ids (list or "1,2,3"),
+# language, doctor_id, rate_per_minute. Empty filters = every device.
+@admin_bp.route("/devices/broadcast", methods=["POST"])
+@login_required
+@admin_required
+def broadcast_devices():
+    payload = request.get_json(silent=True) or request.form.to_dict()
+
+    owner_ids = payload.get("owner_ids") or []
+    if isinstance(owner_ids, str):
+        owner_ids = [o for o in owner_ids.replace(" ", "").split(",") if o]
+
+    try:
+        summary = broadcast_command(
+            payload.get("command", ""),
+            data=payload.get("data") if isinstance(payload.get("data"), dict) else None,
+            owner_ids=[int(o) for o in owner_ids],
+            language=payload.get("language") or None,
+            doctor_id=int(payload["doctor_id"]) if payload.get("doctor_id") else None,
+            rate_per_minute=int(payload["rate_per_minute"]) if payload.get("rate_per_minute") else None
+        )
+    except (BroadcastError, ValueError) as e:
+        if not request.is_json:
+            flash(f"❌ {e}", "danger")
+            return redirect(url_for("admin.dashboard"))
+        return jsonify({"error": str(e)}), 400
+
+    if not request.is_json:
+        flash(f"📣 {summary['command']} queued for {summary['queued']} devices "
+              f"({summary['already_pending']} already pending).", "success")
+        return redirect(url_for("admin.dashboard"))
+    return jsonify(summary)
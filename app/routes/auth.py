@@ -1,10 +1,12 @@
 # app/routes/auth.py
 # app/routes/auth.py
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, session
 from flask_login import login_user, logout_user, current_user, login_required
-from werkzeug.security import generate_password_hash, check_password_hash
 from app.extensions import db
 from app.models import User
+from app.utils.passwords import hash_password, verify_password, needs_rehash, HashingBusy
+from app.utils.throttle import ip_limiter, username_limiter
+from app.utils.identity import remember_identity, identity_record, SESSION_KEY
 
 auth_bp = Blueprint("auth", __name__)
 
@@ -30,16 +32,44 @@ def login():
     if request.method == "POST":
         username = request.form["username"]
         password = request.form["password"]
+        ip = request.remote_addr or "-"
 
+        # Reject floods before doing any DB or hashing work
+        if ip_limiter.blocked(ip) or username_limiter.blocked(username.lower()):
+            flash("⏳ Too many login attempts. Please wait a few minutes.", "danger")
+            return render_template("auth/login.html", title="Login"), 429
+
+        # Only failures count against the IP: a clinic behind one NAT
+        # logging in at shift change must not lock itself out
         user = User.query.filter_by(username=username).first()
         if not user:
+            ip_limiter.hit(ip)
+            username_limiter.hit(username.lower())
             flash("❌ Invalid username or password.", "danger")
             return redirect(url_for("auth.login"))
 
-        if not check_password_hash(user.password_hash, password):
+        try:
+            valid = verify_password(user.password_hash, password)
+        except HashingBusy:
+            flash("⏳ Server is busy. Please try again in a moment.", "warning")
+            return render_template("auth/login.html", title="Login"), 503
+
+        if not valid:
+            ip_limiter.hit(ip)
+            username_limiter.hit(username.lower())
             flash("❌ Invalid username or password.", "danger")
             return redirect(url_for("auth.login"))
 
+        username_limiter.reset(username.lower())
+
+        # Transparent upgrade when hashing parameters changed
+        if needs_rehash(user.password_hash):
+            try:
+                user.password_hash = hash_password(password)
+                db.session.commit()
+            except HashingBusy:
+                pass  # try again on a later login
+
         # Block unapproved users from logging in
         if not user.approved:
             flash("⏳ Your account is still awaiting admin approval.", "warning")
@@ -47,6 +77,7 @@ def login():
 
         # ✅ Everything ok — log in
         login_user(user)
+        remember_identity(identity_record(user))
         flash(f"Welcome back, {user.name}!", "success")
 
         # Role-based redirects
@@ -85,11 +116,22 @@ def signup():
             flash("⚠️ Please fill in all required fields.", "warning")
             return redirect(url_for("auth.signup"))
 
+        ip = request.remote_addr or "-"
+        if ip_limiter.blocked(ip):
+            flash("⏳ Too many requests. Please wait a few minutes.", "danger")
+            return render_template("auth/signup.html", title="Signup"), 429
+        ip_limiter.hit(ip)
+
         if User.query.filter_by(username=username).first():
             flash("❌ Username already exists. Choose another.", "danger")
             return redirect(url_for("auth.signup"))
 
-        hashed_pw = generate_password_hash(password)
+        try:
+            hashed_pw = hash_password(password)
+        except HashingBusy:
+            flash("⏳ Server is busy. Please try again in a moment.", "warning")
+            return render_template("auth/signup.html", title="Signup"), 503
+
         new_user = User(
             name=name,
             username=username,
@@ -112,6 +154,7 @@ def signup():
 @login_required
 def logout():
     logout_user()
+    session.pop(SESSION_KEY, None)
     flash("You have been logged out.", "info")
     return redirect(url_for("auth.home"))
 
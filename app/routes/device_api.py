@@ -1,7 +1,10 @@
 # app/routes/device_api_bp.py
 
-from flask import Blueprint, request, jsonify, send_file, abort
+from flask import Blueprint, Response, request, jsonify, send_file, abort
 from datetime import datetime
+from sqlalchemy import or_
+import gzip
+import hashlib
 import os
 
 from app import db
@@ -9,17 +12,35 @@ from app.models import (
     Device,
     DeviceCommandQueue,
     Log,
-    DeviceState,
 )
 
-from app.utils.device_sync import (
-    build_config_json,
-    build_schedule_json,
-    build_audio_manifest_cached
+from app.utils.sync_snapshot import (
+    bundle_body,
+    content_version,
+    current_snapshot,
+    device_manifest,
+    get_snapshot,
+    is_current,
+    mark_synced,
+    token_version,
 )
+from app.utils.schedule_codec import (
+    MIMETYPE as SCHEDULE_MIMETYPE,
+    ScheduleFormatError,
+    encode_schedule,
+)
+from app.utils.sync_files import (
+    bundle_file,
+    send_bundle_file,
+    signed_bundle_url,
+    verify_bundle_url,
+    write_bundle_files,
+)
+from app.utils.pregen import request_pregen
 
-from flask_socketio import emit
-from app import socketio
+from app.utils.log_search import invalidate_med_names
+from app.utils.device_state import apply_state_report
+from app.utils.realtime import emit_device_event, publish_device_status, publish_new_logs
 
 
 device_api_bp = Blueprint("device_api", __name__, url_prefix="/api/device")
@@ -36,13 +57,20 @@ def heartbeat(device_code):
         return jsonify({"error": "device not found"}), 404
 
     # Update heartbeat timestamp
+    was_online = device.is_online()
     device.last_heartbeat = datetime.utcnow()
     db.session.commit()
 
+    if not was_online:
+        publish_device_status(device, True)
+
     # ---- FETCH COMMANDS QUEUED FOR THIS DEVICE ----
-    cmds = DeviceCommandQueue.query.filter_by(
-        device_code=device_code,
-        processed=False
+    # Broadcast commands wait for their not_before slot
+    cmds = DeviceCommandQueue.query.filter(
+        DeviceCommandQueue.device_code == device_code,
+        DeviceCommandQueue.processed.is_(False),
+        or_(DeviceCommandQueue.not_before.is_(None),
+            DeviceCommandQueue.not_before <= datetime.utcnow())
     ).all()
 
     cmd_list = []
@@ -57,11 +85,20 @@ def heartbeat(device_code):
     db.session.commit()
 
     # ---- SEND BACK SYNC + COMMANDS ----
+    sync = {"all": bool(device.data_dirty)}
+    if device.data_dirty:
+        # Pre-written bundle behind a signed URL pinned to its version
+        # (sync_files). Not while the snapshot is out of date: the
+        # device can use the download routes until pregen catches up.
+        snapshot = get_snapshot(device)
+        if is_current(device, snapshot):
+            sync["bundle_url"] = signed_bundle_url(device_code, snapshot.content_version)
+        else:
+            request_pregen(device.owner_id, device.language)
+
     return jsonify({
         "status": "ok",
-        "sync": {
-            "all": bool(device.data_dirty)
-        },
+        "sync": sync,
         "commands": cmd_list
     })
 
@@ -76,12 +113,43 @@ def sync_done(device_code):
     if not device:
         return jsonify({"error": "device not found"}), 404
 
+    # Did the device get the current data? A bundle's sync_token names
+    # the version it holds. Without one, it downloaded the stored
+    # snapshot piecewise: stale if any piece was served out of date
+    # (while pregen rebuilt it) or the data changed since. Either way
+    # the device stays dirty and syncs again.
+    snapshot = get_snapshot(device)
+    token = (request.get_json(silent=True) or {}).get("sync_token")
+    if token:
+        version = token_version(device, token)
+        if version is None:
+            return jsonify({"error": "invalid sync token"}), 400
+        stale = version != content_version(device)
+    else:
+        stale = snapshot is not None and (
+            snapshot.served_stale or snapshot.content_version != content_version(device)
+        )
+
+    if stale:
+        if snapshot is not None and snapshot.served_stale:
+            snapshot.served_stale = False      # the retry starts clean
+            db.session.commit()
+        # Make sure the next attempt finds a fresh snapshot
+        request_pregen(device.owner_id, device.language)
+        return jsonify({"status": "stale", "sync": {"all": True}})
+
     # Device finished downloading config/schedule/audio
     device.data_dirty = False
     device.last_incoming_sync = datetime.utcnow()
+    mark_synced(device)
 
     db.session.commit()
 
+    emit_device_event(device, "sync_done", {
+        "device": device_code,
+        "patient_id": device.owner_id,
+    })
+
     return jsonify({"status": "ok"})
 
 
@@ -96,15 +164,12 @@ def device_progress(device_code):
 
     payload = request.json or {}
 
-    socketio.emit(
-        "device_progress",
-        {
-            "device": device_code,
-            "msg": payload.get("msg", ""),
-            "pct": payload.get("pct", 0),
-        },
-        room=device.owner_id
-    )
+    emit_device_event(device, "device_progress", {
+        "device": device_code,
+        "patient_id": device.owner_id,
+        "msg": payload.get("msg", ""),
+        "pct": payload.get("pct", 0),
+    })
 
     return jsonify({"status": "sent"})
 
@@ -118,8 +183,8 @@ def download_config(device_code):
     if not device:
         return jsonify({"error": "device not found"}), 404
 
-    cfg = build_config_json(device.owner)
-    return jsonify(cfg)
+    # Stored payloads (sync_snapshot), rebuilt only when the data changed
+    return jsonify(current_snapshot(device).config)
 
 
 # =============================================================
@@ -131,8 +196,28 @@ def download_schedule(device_code):
     if not device:
         return jsonify({"error": "device not found"}), 404
 
-    sch = build_schedule_json(device.owner)
-    return jsonify(sch)
+    schedule = current_snapshot(device).schedule
+
+    # Firmware that asks for it gets fixed-layout binary records
+    # (schedule_codec) instead of JSON; */* and JSON clients get JSON
+    best = request.accept_mimetypes.best_match(["application/json", SCHEDULE_MIMETYPE])
+    if best == SCHEDULE_MIMETYPE:
+        try:
+            return Response(encode_schedule(schedule["schedule"]), mimetype=SCHEDULE_MIMETYPE,
+                            headers={"Vary": "Accept"})
+        except ScheduleFormatError as e:
+            # Data the binary layout can't carry: JSON if the device
+            # takes it, otherwise tell it why instead of a 500
+            print(f"[SYNC] ⚠️ {device_code}: binary schedule unavailable: {e}")
+            if not request.accept_mimetypes["application/json"]:
+                response = jsonify({"error": "schedule does not fit binary format", "detail": str(e)})
+                response.status_code = 406
+                response.vary.add("Accept")
+                return response
+
+    response = jsonify(schedule)
+    response.vary.add("Accept")
+    return response
 
 
 # =============================================================
@@ -145,8 +230,103 @@ def download_audio_manifest(device_code):
     if not device:
         return jsonify({"error": "device not found"}), 404
 
-    manifest = build_audio_manifest_cached(device.owner)
-    return jsonify(manifest)
+    from app.utils.audio_codecs import pick_codec   # NumPy: load on first use
+    from app.utils.manifest_priority import parse_now
+
+    # Codec capability, preferred first: ?codecs=ima_adpcm,mulaw
+    # or an X-Audio-Codecs header. Undeclared → 16-bit PCM WAV.
+    codec = pick_codec(request.args.get("codecs") or request.headers.get("X-Audio-Codecs"))
+
+    # "files" lists clips in download order for the device's clock
+    # (?now=HH:MM), globals first, then the soonest doses
+    now_minutes = parse_now(request.args.get("now"))
+
+    snapshot = current_snapshot(device)
+    return jsonify(device_manifest(device, snapshot, codec, now_minutes))
+
+
+# =============================================================
+# SYNC BUNDLE  (config + schedule + manifest in one response)
+# =============================================================
+@device_api_bp.route("/download/bundle/<device_code>", methods=["GET"])
+def download_bundle(device_code):
+
+    device = Device.query.filter_by(device_code=device_code).first()
+    if not device:
+        return jsonify({"error": "device not found"}), 404
+
+    from app.utils.audio_codecs import pick_codec   # NumPy: load on first use
+    from app.utils.manifest_priority import parse_now
+
+    # Same negotiation as download/audio_manifest
+    codec = pick_codec(request.args.get("codecs") or request.headers.get("X-Audio-Codecs"))
+    now = request.args.get("now")
+    snapshot = current_snapshot(device)
+
+    # The body is a function of the stored snapshot, the codec and the
+    # device clock it was ordered for, so the ETag is built from those
+    # and checked first: a 304 costs no body, no pack lock, no gzip.
+    # (Without ?now the order follows the server clock; the ETag then
+    # stays put for the snapshot and the device's stored order is
+    # still valid, every clip carrying its window.)
+    compress = request.accept_encodings["gzip"] > 0
+    etag = hashlib.sha256(
+        f"{snapshot.content_version}|{codec}|{now or ''}".encode()
+    ).hexdigest()[:32] + ("-gz" if compress else "")
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        body = bundle_body(device, snapshot, codec, parse_now(now))
+        if compress:
+            response = Response(gzip.compress(body, compresslevel=6), mimetype="application/json")
+            response.headers["Content-Encoding"] = "gzip"
+        else:
+            response = Response(body, mimetype="application/json")
+
+    response.set_etag(etag)
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+# =============================================================
+# SYNC BUNDLE AS A STATIC FILE  (signed URL from heartbeat)
+# =============================================================
+@device_api_bp.route("/sync_file/<device_code>", methods=["GET"])
+def download_sync_file(device_code):
+
+    # Signature only: no DB work while the file exists
+    version = request.args.get("v")
+    if not verify_bundle_url(device_code, version, request.args.get("expires"), request.args.get("sig")):
+        return jsonify({"error": "invalid or expired link"}), 403
+
+    from app.utils.audio_codecs import pick_codec   # NumPy: load on first use
+    codec = pick_codec(request.args.get("codecs") or request.headers.get("X-Audio-Codecs"))
+
+    path = bundle_file(device_code, codec, version)
+    if path is None:
+        return jsonify({"error": "no static bundle for this device"}), 404
+
+    if not os.path.isfile(path):
+        # First request for this codec, or the link's version was replaced
+        device = Device.query.filter_by(device_code=device_code).first()
+        if not device:
+            return jsonify({"error": "device not found"}), 404
+        snapshot = get_snapshot(device)
+        if snapshot is None or snapshot.content_version != version:
+            return _bundle_replaced()
+        write_bundle_files(device, snapshot, codecs={codec})
+
+    response = send_bundle_file(path, request.accept_encodings["gzip"] > 0)
+    if response is None:
+        # Removed by a rebuild since the check above
+        return _bundle_replaced()
+    return response
+
+
+def _bundle_replaced():
+    return jsonify({"error": "bundle has changed, heartbeat for a new link",
+                    "sync": {"all": True}}), 410
 
 
 # =============================================================
@@ -176,6 +356,7 @@ def upload_logs(device_code):
         return jsonify({"error": "device not found"}), 404
 
     logs = request.json or []
+    new_logs = []
 
     for entry in logs:
         log = Log(
@@ -191,8 +372,11 @@ def upload_logs(device_code):
             dustbin_sensor=entry.get("dustbin_sensor", False)
         )
         db.session.add(log)
+        new_logs.append(log)
 
     db.session.commit()
+    invalidate_med_names(device.owner_id)
+    publish_new_logs(device.owner_id, new_logs)
 
     # VERY SIMPLE:
     # device may delete all logs after uploading
@@ -211,26 +395,7 @@ def upload_state(device_code):
 
     payload = request.json or {}
 
-    files = payload.get("files", {})
-    used = payload.get("storage_used", 0)
-    total = payload.get("storage_total", 0)
-
-    state = DeviceState.query.filter_by(device_code=device_code).first()
-
-    if not state:
-        state = DeviceState(
-            device_code=device_code,
-            files=files,
-            storage_used=used,
-            storage_total=total
-        )
-        db.session.add(state)
-    else:
-        state.files = files
-        state.storage_used = used
-        state.storage_total = total
-        state.updated_at = datetime.utcnow()
+    # Only the difference against the stored inventory is written
+    changes = apply_state_report(device, payload)
 
-    db.session.commit()
-
-    return jsonify({"status": "ok"})
+    return jsonify({"status": "ok", **changes})
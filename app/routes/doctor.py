@@ -2,6 +2,8 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_required, current_user
 from app.models import db, User, Device, Medication, Dosage, Log, Alert, DoctorPatientLink
+from app.utils.realtime import publish_alerts
+from app.utils.pregen import schedule_pregen
 from datetime import datetime
 
 doctor_bp = Blueprint("doctor", __name__, url_prefix="/doctor")
@@ -88,7 +90,12 @@ def approve_link(link_id):
 
     link.active = True
     link.approved_at = datetime.utcnow()
+    alert = Alert(user_id=link.patient_id, title="Doctor Link Update",
+                  message=f"✅ Dr. {current_user.name} approved your link request.",
+                  created_at=datetime.utcnow())
+    db.session.add(alert)
     db.session.commit()
+    publish_alerts([alert])
 
     flash(f"✅ You approved {link.patient_link.name}'s request.", "success")
     return redirect(url_for("doctor.dashboard"))
@@ -102,9 +109,15 @@ def reject_link(link_id):
         flash("⚠️ Unauthorized action.", "danger")
         return redirect(url_for("doctor.dashboard"))
 
+    patient_name = link.patient_link.name
+    alert = Alert(user_id=link.patient_id, title="Doctor Link Update",
+                  message=f"❌ Dr. {current_user.name} rejected your link request.",
+                  created_at=datetime.utcnow())
     db.session.delete(link)
+    db.session.add(alert)
     db.session.commit()
-    flash(f"❌ You rejected {link.patient_link.name}'s request.", "warning")
+    publish_alerts([alert])
+    flash(f"❌ You rejected {patient_name}'s request.", "warning")
     return redirect(url_for("doctor.dashboard"))
 
 
@@ -188,6 +201,7 @@ def send_alert(patient_id):
     )
     db.session.add(new_alert)
     db.session.commit()
+    publish_alerts([new_alert])
 
     flash(f"📩 Alert sent to {patient.name}.", "success")
     return redirect(url_for("doctor.view_patient", patient_id=patient_id))
@@ -244,6 +258,7 @@ def handle_link_request(link_id, action):
     alert = Alert(user_id=patient.id, title="Doctor Link Update", message=msg, created_at=datetime.utcnow())
     db.session.add(alert)
     db.session.commit()
+    publish_alerts([alert])
 
     return redirect(url_for("doctor.link_requests"))
 
@@ -276,10 +291,13 @@ def view_alerts():
         # 💊 Low stock
         low_stock = [m for m in meds if m.quantity and m.quantity <= 5]
 
-        # ❌ Missed doses (approx.)
-        logs = Log.query.filter(Log.device_id == (device.device_code if device else None)).all()
+        # ❌ Missed doses this week (approx.)
+        logs = Log.query.filter(
+            Log.device_id == (device.id if device else None),
+            Log.taken_time >= now - timedelta(days=7)
+        ).all()
         week_missed = len([l for l in logs if l.missed])
-        important = [m for m in meds if m.importance_level == "High"]
+        important = [m for m in meds if m.critical]
 
         patient_alerts = []
         if expiring:
@@ -459,8 +477,9 @@ def manage_meds(patient_id):
         db.session.commit()
 
         if device:
-            device.pending_sync = True
+            device.data_dirty = True
             db.session.commit()
+            schedule_pregen(patient.id, device.language)
 
         flash(f"📡 Sync flag set for patient’s device ({device.device_code if device else 'no device'})", "info")
         return redirect(url_for("doctor.manage_meds", patient_id=patient.id))
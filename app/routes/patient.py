@@ -1,22 +1,20 @@
 # app/routes/patient.py
 
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
 from flask_login import login_required, current_user
 from datetime import datetime, date, time
-from sqlalchemy import func
 
 from app.models import (
     db, User, Device, Medication, Dosage, Alert,
     DoctorPatientLink, DeviceState, Log, DeviceCommandQueue
 )
 
-from app.utils.device_sync import (
-    build_config_json,
-    build_schedule_json,
-    build_audio_manifest_cached
-)
-
 from app.utils.analytics import compute_patient_analytics
+from app.utils.log_search import search_logs, patient_med_names
+from app.utils.device_state import inventory_summary, files_needed, manifest_paths
+from app.utils.realtime import publish_alerts
+from app.utils.pregen import request_pregen, schedule_pregen
+from app.utils.sync_snapshot import get_snapshot, is_current
 
 patient_bp = Blueprint("patient", __name__, url_prefix="/patient")
 
@@ -120,14 +118,16 @@ def link_doctor():
             )
             db.session.add(link)
 
-            db.session.add(Alert(
+            alert = Alert(
                 user_id=doc_id,
                 title="New Patient Request",
                 message=f"{current_user.name} wants to link with you.",
                 created_at=datetime.utcnow()
-            ))
+            )
+            db.session.add(alert)
 
             db.session.commit()
+            publish_alerts([alert])
             flash("Request sent.", "success")
             return redirect(url_for("patient.link_doctor"))
 
@@ -234,15 +234,26 @@ def device():
             device.language = request.form.get("language")
             device.data_dirty = True
             db.session.commit()
+            schedule_pregen(current_user.id, device.language)
             push_device_cmd(device, "force_sync")
             flash("Language updated.", "success")
 
         return redirect(url_for("patient.device"))
 
-    # GET: Preview data
-    config_preview = build_config_json(current_user)
-    schedule_preview = build_schedule_json(current_user)
-    audio_manifest = build_audio_manifest_cached(current_user)
+    # GET: Preview the stored sync snapshot. Building it here would
+    # synthesize audio on a page view; a stale one is rebuilt in the
+    # background instead (pregen → sync_snapshot). Only edits debounce:
+    # a view must not push back a build that is already pending.
+    snapshot = get_snapshot(device)
+    snapshot_stale = not is_current(device, snapshot)
+    if snapshot_stale:
+        request_pregen(current_user.id, device.language)
+
+    config_preview, schedule_preview, audio_manifest = {}, {}, {}
+    if snapshot:
+        config_preview = {"data": snapshot.config, "hash": snapshot.config_hash}
+        schedule_preview = {"data": snapshot.schedule, "hash": snapshot.schedule_hash}
+        audio_manifest = {"data": snapshot.manifest, "hash": snapshot.manifest_hash}
 
     med_ids = [m.id for m in Medication.query.filter_by(patient_id=current_user.id).all()]
     recent_logs = Log.query.filter(Log.med_id.in_(med_ids)).order_by(
@@ -250,6 +261,8 @@ def device():
     ).limit(15).all()
 
     dev_state = DeviceState.query.filter_by(device_id=device.id).first()
+    inventory = inventory_summary(device.id)
+    missing_files = sorted(files_needed(device.id, manifest_paths(audio_manifest.get("data"))))
     medications = Medication.query.filter_by(patient_id=current_user.id).all()
 
     return render_template(
@@ -258,9 +271,13 @@ def device():
         config_preview=config_preview,
         schedule_preview=schedule_preview,
         audio_manifest=audio_manifest,
+        snapshot=snapshot,
+        snapshot_stale=snapshot_stale,
         medications=medications,
         recent_logs=recent_logs,
-        dev_state=dev_state
+        dev_state=dev_state,
+        inventory=inventory,
+        missing_files=missing_files
     )
 
 
@@ -370,6 +387,9 @@ def medicine():
                 device.data_dirty = True
 
             db.session.commit()
+
+            if device:
+                schedule_pregen(current_user.id, device.language)
             return redirect(url_for("patient.medicine"))
 
         except Exception as e:
@@ -419,37 +439,37 @@ def history():
         return redirect(url_for("auth.login"))
 
     med_filter = request.args.get("medicine", "")
+    search = request.args.get("q", "").strip()
     date_filter = request.args.get("date", "")
+    cursor = request.args.get("cursor") or None
 
-    logs = Log.query
-    med_ids = [
-        m.id for m in Medication.query.filter_by(patient_id=current_user.id).all()
-    ]
-    logs = logs.filter(Log.med_id.in_(med_ids))
-
-    if med_filter:
-        logs = logs.filter(Log.med_name.ilike(f"%{med_filter}%"))
-
+    day = None
     if date_filter:
         try:
-            dt = datetime.strptime(date_filter, "%Y-%m-%d").date()
-            logs = logs.filter(func.date(Log.taken_time) == dt)
-        except:
+            day = datetime.strptime(date_filter, "%Y-%m-%d").date()
+        except ValueError:
             flash("Invalid date format.", "warning")
 
-    logs = logs.order_by(Log.taken_time.desc()).limit(200).all()
+    logs, next_cursor = search_logs(
+        current_user.id,
+        med_name=med_filter or None,
+        q=search or None,
+        day=day,
+        cursor=cursor,
+        limit=current_app.config["HISTORY_PAGE_SIZE"]
+    )
 
-    med_names = [
-        m[0] for m in db.session.query(Log.med_name)
-              .filter(Log.med_id.in_(med_ids)).distinct().all()
-    ]
+    med_names = patient_med_names(current_user.id)
 
     return render_template(
         "patient/history.html",
         logs=logs,
         med_filter=med_filter,
+        search=search,
         date_filter=date_filter,
-        med_names=med_names
+        med_names=med_names,
+        cursor=cursor,
+        next_cursor=next_cursor
     )
 
 
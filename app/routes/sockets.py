@@ -0,0 +1,39 @@
+# app/routes/sockets.py
+
+from flask_login import current_user
+from flask_socketio import join_room, disconnect
+
+from app import socketio
+from app.models import Device
+from app.utils.realtime import user_room, device_room, doctor_room, ADMIN_ROOM
+
+
+# =============================================================
+# CONNECT — join rooms from the Flask-Login session
+# =============================================================
+@socketio.on("connect")
+def on_connect(auth=None):
+
+    # Browser sockets only; devices talk to the HTTP API
+    if not current_user.is_authenticated or not current_user.approved:
+        return False
+
+    join_room(user_room(current_user.id))
+
+    if current_user.role == "patient":
+        codes = Device.query.with_entities(Device.device_code).filter_by(
+            owner_id=current_user.id
+        ).all()
+        for (code,) in codes:
+            join_room(device_room(code))
+
+    elif current_user.role == "doctor":
+        join_room(doctor_room(current_user.id))
+
+    elif current_user.role == "admin":
+        join_room(ADMIN_ROOM)
+
+
+@socketio.on("logout")
+def on_logout():
+    disconnect()
@@ -0,0 +1,75 @@
+# app/utils/admin_stats.py
+
+from datetime import datetime, timedelta
+from sqlalchemy import func
+
+from app.extensions import db
+from app.models import User, Device
+from app.utils.cache import TTLCache
+
+
+_growth_cache = TTLCache(maxsize=32, ttl=300)
+
+
+# =========================================================
+# COUNTS  (one GROUP BY instead of loading every user)
+# =========================================================
+def user_counts():
+    rows = db.session.query(
+        User.role, User.approved, func.count(User.id)
+    ).group_by(User.role, User.approved).all()
+
+    counts = {"total": 0, "pending": 0, "approved": 0, "by_role": {}}
+    for role, approved, n in rows:
+        counts["total"] += n
+        counts["by_role"][role] = counts["by_role"].get(role, 0) + n
+        if approved:
+            counts["approved"] += n
+        else:
+            counts["pending"] += n
+
+    return counts
+
+
+def device_count():
+    return db.session.query(func.count(Device.id)).scalar() or 0
+
+
+# =========================================================
+# DAILY GROWTH SERIES (bucketed in SQL, cached)
+# =========================================================
+def _daily_counts(column, start):
+    day = func.date(column)
+    rows = db.session.query(day, func.count()).filter(
+        column >= start
+    ).group_by(day).all()
+    return {str(d): n for d, n in rows}
+
+
+def growth_series(days=7):
+    def load():
+        today = datetime.utcnow().date()
+        start_day = today - timedelta(days=days - 1)
+        start = datetime.combine(start_day, datetime.min.time())
+
+        users = _daily_counts(User.created_at, start)
+        devices = _daily_counts(Device.created_at, start)
+
+        dates, user_growth, device_growth = [], [], []
+        for i in range(days):
+            d = start_day + timedelta(days=i)
+            dates.append(d.strftime("%b %d"))
+            user_growth.append(users.get(d.isoformat(), 0))
+            device_growth.append(devices.get(d.isoformat(), 0))
+
+        return {
+            "dates": dates,
+            "user_growth": user_growth,
+            "device_growth": device_growth
+        }
+
+    return _growth_cache.get_or_set(days, load)
+
+
+def invalidate_growth():
+    _growth_cache.clear()
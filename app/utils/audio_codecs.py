@@ -0,0 +1,210 @@
+# app/utils/audio_codecs.py
+
+import os
+import struct
+
+import numpy as np
+
+
+# =========================================================
+# COMPACT CLIP CODECS FOR THE DISPENSER
+# =========================================================
+# Clips are produced as 16 kHz mono 16-bit PCM. A device that can
+# decode something smaller says so (?codecs=ima_adpcm,mulaw or an
+# X-Audio-Codecs header, in order of preference) and gets the clip
+# re-encoded in a standard WAV container:
+#
+#   pcm16      WAVE_FORMAT_PCM        (0x0001)  16 bit/sample
+#   mulaw      WAVE_FORMAT_MULAW      (0x0007)   8 bit/sample  (G.711)
+#   ima_adpcm  WAVE_FORMAT_IMA_ADPCM  (0x0011)   4 bit/sample, 256-byte blocks
+#
+# Both decoders are a table lookup / a few adds per sample on the
+# ESP32. Reference decoders are included below for checking output.
+
+PCM16 = "pcm16"
+MULAW = "mulaw"
+IMA_ADPCM = "ima_adpcm"
+
+CODECS = (IMA_ADPCM, MULAW, PCM16)
+EXTENSIONS = {PCM16: ".wav", MULAW: ".ulaw.wav", IMA_ADPCM: ".ima.wav"}
+
+RATE = 16000
+
+
+def pick_codec(declared):
+    """declared: comma-separated codec names, preferred first."""
+    for name in (declared or "").replace(" ", "").lower().split(","):
+        if name in CODECS:
+            return name
+    return PCM16
+
+
+def encoded_path(wav_path, codec):
+    return wav_path[:-len(".wav")] + EXTENSIONS[codec]
+
+
+# ---------------------------------------------------------
+# RIFF / WAVE container for non-PCM formats
+# ---------------------------------------------------------
+def _wav_bytes(format_tag, bits, block_align, byte_rate, data, frames, extra=b""):
+    fmt = struct.pack(
+        "<HHIIHH", format_tag, 1, RATE, byte_rate, block_align, bits
+    ) + struct.pack("<H", len(extra)) + extra
+    fact = struct.pack("<I", frames)
+
+    body = (
+        b"WAVE"
+        + b"fmt " + struct.pack("<I", len(fmt)) + fmt
+        + b"fact" + struct.pack("<I", len(fact)) + fact
+        + b"data" + struct.pack("<I", len(data)) + data
+        + (b"\0" if len(data) % 2 else b"")
+    )
+    return b"RIFF" + struct.pack("<I", len(body)) + body
+
+
+def read_pcm16_wav(path):
+    import wave
+    with wave.open(path, "rb") as w:
+        return np.frombuffer(w.readframes(w.getnframes()), dtype="<i2")
+
+
+# ---------------------------------------------------------
+# µ-law (G.711), vectorized
+# ---------------------------------------------------------
+_MULAW_BIAS = 0x84
+_MULAW_CLIP = 32635
+
+
+def mulaw_encode(samples):
+    """int16 array → uint8 µ-law bytes."""
+    x = samples.astype(np.int32)
+    sign = np.where(x < 0, 0x80, 0)
+    mag = np.minimum(np.abs(x), _MULAW_CLIP) + _MULAW_BIAS
+    exponent = np.floor(np.log2(mag)).astype(np.int32) - 7
+    mantissa = (mag >> (exponent + 3)) & 0x0F
+    return (~(sign | (exponent << 4) | mantissa) & 0xFF).astype(np.uint8)
+
+
+def mulaw_decode(codes):
+    u = ~codes.astype(np.int32) & 0xFF
+    exponent = (u >> 4) & 0x07
+    mag = (((u & 0x0F) << 3) + _MULAW_BIAS) << exponent
+    return np.where(u & 0x80, _MULAW_BIAS - mag, mag - _MULAW_BIAS).astype(np.int16)
+
+
+def mulaw_wav(samples):
+    data = mulaw_encode(samples).tobytes()
+    return _wav_bytes(0x0007, 8, 1, RATE, data, len(samples))
+
+
+# ---------------------------------------------------------
+# IMA-ADPCM (WAV / DVI layout, mono)
+# ---------------------------------------------------------
+IMA_BLOCK = 256
+IMA_SAMPLES_PER_BLOCK = (IMA_BLOCK - 4) * 2 + 1     # 505
+
+_STEPS = (
+    7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45,
+    50, 55, 60, 66, 73, 80, 88, 97, 107, 118, 130, 143, 157, 173, 190, 209, 230,
+    253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724, 796, 876, 963,
+    1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327,
+    3660, 4026, 4428, 4871, 5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442,
+    11487, 12635, 13899, 15289, 16818, 18500, 20350, 22385, 24623, 27086, 29794,
+    32767,
+)
+_INDEX_ADJUST = (-1, -1, -1, -1, 2, 4, 6, 8) * 2
+
+
+def _ima_step(predictor, index, nibble):
+    step = _STEPS[index]
+    diff = step >> 3
+    if nibble & 4:
+        diff += step
+    if nibble & 2:
+        diff += step >> 1
+    if nibble & 1:
+        diff += step >> 2
+    predictor += -diff if nibble & 8 else diff
+    predictor = max(-32768, min(32767, predictor))
+    index = max(0, min(88, index + _INDEX_ADJUST[nibble]))
+    return predictor, index
+
+
+def ima_encode(samples):
+    """int16 array → IMA-ADPCM blocks (the last block is zero-padded)."""
+    values = samples.tolist()
+    pad = -len(values) % IMA_SAMPLES_PER_BLOCK
+    values += [0] * pad
+
+    out = bytearray()
+    index = 0
+    for start in range(0, len(values), IMA_SAMPLES_PER_BLOCK):
+        block = values[start:start + IMA_SAMPLES_PER_BLOCK]
+        predictor = block[0]
+        out += struct.pack("<hBB", predictor, index, 0)
+
+        nibbles = []
+        for sample in block[1:]:
+            diff = sample - predictor
+            nibble = 8 if diff < 0 else 0
+            diff = abs(diff)
+            step = _STEPS[index]
+            if diff >= step:
+                nibble |= 4
+                diff -= step
+            if diff >= step >> 1:
+                nibble |= 2
+                diff -= step >> 1
+            if diff >= step >> 2:
+                nibble |= 1
+            predictor, index = _ima_step(predictor, index, nibble)
+            nibbles.append(nibble)
+
+        out += bytes(lo | (hi << 4) for lo, hi in zip(nibbles[0::2], nibbles[1::2]))
+    return bytes(out)
+
+
+def ima_decode(data, frames):
+    out = []
+    for start in range(0, len(data), IMA_BLOCK):
+        block = data[start:start + IMA_BLOCK]
+        predictor, index, _ = struct.unpack_from("<hBB", block)
+        out.append(predictor)
+        for byte in block[4:]:
+            for nibble in (byte & 0x0F, byte >> 4):
+                predictor, index = _ima_step(predictor, index, nibble)
+                out.append(predictor)
+    return np.array(out[:frames], dtype=np.int16)
+
+
+def ima_wav(samples):
+    data = ima_encode(samples)
+    byte_rate = RATE * IMA_BLOCK // IMA_SAMPLES_PER_BLOCK
+    return _wav_bytes(0x0011, 4, IMA_BLOCK, byte_rate, data, len(samples),
+                      extra=struct.pack("<H", IMA_SAMPLES_PER_BLOCK))
+
+
+# ---------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------
+ENCODERS = {MULAW: mulaw_wav, IMA_ADPCM: ima_wav}
+
+
+def encode_clip(wav_path, codec):
+    """
+    Write the CODEC variant next to a 16-bit PCM clip (once).
+    Returns its path (the clip itself for pcm16).
+    """
+    if codec == PCM16:
+        return wav_path
+
+    target = encoded_path(wav_path, codec)
+    if os.path.isfile(target):
+        return target
+
+    # Packs are already published; appear in one step
+    tmp = f"{target}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(ENCODERS[codec](read_pcm16_wav(wav_path)))
+    os.replace(tmp, target)
+    return target
@@ -0,0 +1,201 @@
+# app/utils/audio_compose.py
+
+import hashlib
+import io
+import os
+import threading
+import wave
+from collections import OrderedDict
+
+import numpy as np
+from flask import current_app
+
+from app.utils import audio_dsp as dsp
+from app.utils.device_sync import audio_stack
+
+
+# =========================================================
+# PHRASE-FRAGMENT COMPOSITION
+# =========================================================
+# A dosage prompt ("It is 09:00 AM. Take Paracetamol. After Food.")
+# is built from short fragments instead of one TTS call per sentence:
+#
+#   "It is 09:00 AM."   one per time of day
+#   "Take" + "<name>"   "Take" once per language, names shared by patients
+#   "After Food."       a handful per language
+#   "Note:" + "<remark>"
+#
+# Each fragment is synthesized once per (backend, language, text),
+# trimmed of leading / trailing silence and stored as 16 kHz mono
+# PCM under AUDIO_FRAGMENT_DIR, named by content hash. Clips are then
+# joined sample-accurately: short crossfades inside a sentence, a
+# pause between sentences, then the usual normalize + gain.
+#
+# Imported on first use (like the rest of the audio stack).
+
+RATE = 16000
+FORMAT_VERSION = "1"               # bump when the fragment DSP changes
+
+SILENCE_DB = -40                   # trim threshold
+EDGE_MS = 15                       # kept around speech when trimming
+CROSSFADE_MS = 12                  # between fragments of one sentence
+SENTENCE_GAP_MS = 180              # between sentences
+MEMORY_FRAGMENTS = 2048            # per-process LRU of decoded fragments
+
+_memory = OrderedDict()
+_lock = threading.Lock()
+_stats = {"synthesized": 0, "disk_hits": 0, "memory_hits": 0}
+
+
+# ---------------------------------------------------------
+# Sentence plans — lists of sentences, each a list of fragment texts
+# ---------------------------------------------------------
+def dosage_phrases(m, d):
+    """The dosage prompt's words, split into fragments."""
+    sentences = [
+        [f"It is {d.time_range_start.strftime('%I:%M %p')}."],
+        ["Take", f"{m.name}."],
+    ]
+    if d.food_status:
+        sentences.append([f"{d.food_status}."])
+    if d.remark:
+        sentences.append(["Note:", f"{d.remark}."])
+    return sentences
+
+
+# ---------------------------------------------------------
+# Fragment cache
+# ---------------------------------------------------------
+def fragment_key(text, lang, backend):
+    raw = f"{FORMAT_VERSION}|{backend}|{lang}|{text.strip()}"
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+def _fragment_path(key, lang):
+    return os.path.join(current_app.config["AUDIO_FRAGMENT_DIR"], lang, key[:2], f"{key}.wav")
+
+
+def _read_fragment(path):
+    with wave.open(path, "rb") as w:
+        pcm = w.readframes(w.getnframes())
+    return np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32768.0
+
+
+def _write_fragment(path, samples):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    dsp.write_wav(tmp, dsp.to_pcm16(samples), RATE)
+    os.replace(tmp, path)   # readers never see a half-written fragment
+
+
+def _synthesize(text, lang, backend):
+    if backend == "stub":
+        # Soft tone, roughly as long as the words: same format as
+        # the real clips, no network
+        seconds = min(max(len(text) * 0.06, 0.2), 8.0)
+        t = np.arange(int(RATE * seconds), dtype=np.float32) / RATE
+        return (0.25 * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+
+    gTTS, _ = audio_stack()
+    mp3 = io.BytesIO()
+    gTTS(text=text, lang=lang).write_to_fp(mp3)
+    samples, rate = dsp.decode_mp3(mp3.getvalue())
+    return dsp.resample(dsp.to_mono(samples), rate, RATE)
+
+
+def _trim(samples):
+    threshold = 10 ** (SILENCE_DB / 20)
+    loud = np.flatnonzero(np.abs(samples) > threshold)
+    if not loud.size:
+        return samples[:0]
+    edge = RATE * EDGE_MS // 1000
+    return samples[max(loud[0] - edge, 0):loud[-1] + edge + 1]
+
+
+def fragment(text, lang):
+    """Fragment samples (float32, 16 kHz mono), synthesizing on a miss."""
+    backend = current_app.config.get("TTS_BACKEND")
+    key = fragment_key(text, lang, backend)
+
+    with _lock:
+        cached = _memory.get(key)
+        if cached is not None:
+            _memory.move_to_end(key)
+            _stats["memory_hits"] += 1
+            return cached
+
+    path = _fragment_path(key, lang)
+    if os.path.isfile(path):
+        samples = _read_fragment(path)
+        stat = "disk_hits"
+    else:
+        samples = _trim(_synthesize(text, lang, backend))
+        _write_fragment(path, samples)
+        stat = "synthesized"
+
+    with _lock:
+        _stats[stat] += 1
+        _memory[key] = samples
+        while len(_memory) > MEMORY_FRAGMENTS:
+            _memory.popitem(last=False)
+    return samples
+
+
+def fragment_stats():
+    with _lock:
+        return dict(_stats)
+
+
+# ---------------------------------------------------------
+# Joining
+# ---------------------------------------------------------
+def crossfade_join(parts, crossfade):
+    """
+    Concatenate with equal-power crossfades of `crossfade` samples.
+    Output length is exactly sum(len) - overlaps.
+    """
+    parts = [p for p in parts if p.size]
+    if not parts:
+        return np.zeros(0, dtype=np.float32)
+
+    total = sum(p.size for p in parts)
+    overlaps = [min(crossfade, a.size, b.size) for a, b in zip(parts, parts[1:])]
+    out = np.zeros(total - sum(overlaps), dtype=np.float32)
+
+    pos = 0
+    for i, part in enumerate(parts):
+        part = part.copy()
+        if i > 0 and overlaps[i - 1]:
+            n = overlaps[i - 1]
+            ramp = np.sin(np.linspace(0, np.pi / 2, n, dtype=np.float32))
+            part[:n] *= ramp
+            out[pos - n:pos] *= ramp[::-1]
+            pos -= n
+        out[pos:pos + part.size] += part
+        pos += part.size
+    return out
+
+
+def compose(sentences, lang):
+    """Sentences of fragment texts → float32 samples at 16 kHz."""
+    xfade = RATE * CROSSFADE_MS // 1000
+    gap = np.zeros(RATE * SENTENCE_GAP_MS // 1000, dtype=np.float32)
+
+    joined = []
+    for i, sentence in enumerate(sentences):
+        if i:
+            joined.append(gap)
+        joined.append(crossfade_join([fragment(t, lang) for t in sentence], xfade))
+    # Fragment edges are near-silent, so a short fade at sentence
+    # boundaries is enough to avoid clicks
+    return crossfade_join(joined, xfade)
+
+
+def compose_wav(sentences, lang, wav_path):
+    """Compose and write a device clip (normalized, +6 dB for the ESP32 speaker)."""
+    samples = compose(sentences, lang)
+    samples = dsp.apply_gain(dsp.peak_normalize(samples, 0.1), 6)
+
+    os.makedirs(os.path.dirname(wav_path), exist_ok=True)
+    dsp.write_wav(wav_path, dsp.to_pcm16(samples), RATE)
+    return wav_path
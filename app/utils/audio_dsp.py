@@ -0,0 +1,131 @@
+# app/utils/audio_dsp.py
+
+import io
+import wave
+
+import numpy as np
+
+
+# =========================================================
+# IN-PROCESS AUDIO DSP (NumPy)
+# =========================================================
+# Turns gTTS MP3 bytes into the device format — 16 kHz, mono,
+# 16-bit PCM WAV — without temp files or an ffmpeg subprocess.
+#
+# Samples are float32 in [-1, 1], shape (frames,) for mono or
+# (frames, channels). MP3 decoding uses miniaudio (a small wheel,
+# no system libraries); without it, pydub + ffmpeg decode and the
+# rest of the pipeline still runs here.
+#
+# Imported lazily through device_sync.audio_stack().
+
+DEVICE_RATE = 16000
+PEAK = 1.0
+
+
+# ---------------------------------------------------------
+# Decode
+# ---------------------------------------------------------
+def decode_mp3(data):
+    """MP3 bytes → (float32 samples, sample rate)."""
+    try:
+        import miniaudio
+    except ImportError:
+        return _decode_with_pydub(data)
+
+    # Native rate / channels; conversion happens below in NumPy
+    decoded = miniaudio.mp3_read_s16(data)
+    samples = np.frombuffer(decoded.samples, dtype=np.int16).astype(np.float32) / 32768.0
+    if decoded.nchannels > 1:
+        samples = samples.reshape(-1, decoded.nchannels)
+    return samples, decoded.sample_rate
+
+
+def _decode_with_pydub(data):
+    from pydub import AudioSegment
+    from pydub.utils import which
+
+    AudioSegment.converter = which("ffmpeg")
+    AudioSegment.ffprobe = which("ffprobe")
+
+    seg = AudioSegment.from_file(io.BytesIO(data), format="mp3")
+    scale = float(1 << (8 * seg.sample_width - 1))
+    samples = np.array(seg.get_array_of_samples(), dtype=np.float32) / scale
+    if seg.channels > 1:
+        samples = samples.reshape(-1, seg.channels)
+    return samples, seg.frame_rate
+
+
+# ---------------------------------------------------------
+# Processing
+# ---------------------------------------------------------
+def to_mono(samples):
+    if samples.ndim == 1:
+        return samples
+    return samples.mean(axis=1, dtype=np.float32)
+
+
+def peak_normalize(samples, headroom_db=0.1):
+    """Scale so the loudest sample sits headroom_db below full scale."""
+    peak = float(np.max(np.abs(samples))) if samples.size else 0.0
+    if peak == 0.0:
+        return samples
+    target = PEAK * 10 ** (-headroom_db / 20)
+    return samples * np.float32(target / peak)
+
+
+def apply_gain(samples, gain_db):
+    """Gain in dB, hard-clipped to full scale."""
+    gained = samples * np.float32(10 ** (gain_db / 20))
+    return np.clip(gained, -PEAK, PEAK, out=gained)
+
+
+def _lowpass_taps(cutoff, taps=63):
+    """Windowed-sinc FIR; cutoff as a fraction of the input sample rate."""
+    n = np.arange(taps) - (taps - 1) / 2
+    h = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(taps)
+    return (h / h.sum()).astype(np.float32)
+
+
+def resample(samples, src_rate, dst_rate=DEVICE_RATE):
+    """Mono resample: anti-alias low-pass (when downsampling) + linear interpolation."""
+    if src_rate == dst_rate or samples.size == 0:
+        return samples
+
+    if dst_rate < src_rate:
+        samples = np.convolve(samples, _lowpass_taps(0.45 * dst_rate / src_rate), mode="same")
+
+    frames = int(round(samples.size * dst_rate / src_rate))
+    positions = np.arange(frames, dtype=np.float64) * (src_rate / dst_rate)
+    return np.interp(positions, np.arange(samples.size), samples).astype(np.float32)
+
+
+# ---------------------------------------------------------
+# Encode
+# ---------------------------------------------------------
+def to_pcm16(samples):
+    clipped = np.clip(samples, -PEAK, PEAK)
+    return (clipped * 32767).astype("<i2").tobytes()
+
+
+def write_wav(target, pcm, rate=DEVICE_RATE):
+    """target: path or binary file object. pcm: 16-bit mono bytes."""
+    with wave.open(target, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(pcm)
+
+
+def mp3_to_device_pcm(data, headroom_db=None, gain_db=0.0):
+    """
+    MP3 bytes → 16 kHz mono 16-bit PCM bytes.
+    headroom_db=None skips peak normalization.
+    """
+    samples, rate = decode_mp3(data)
+    samples = to_mono(samples)
+    if headroom_db is not None:
+        samples = peak_normalize(samples, headroom_db)
+    if gain_db:
+        samples = apply_gain(samples, gain_db)
+    return to_pcm16(resample(samples, rate))
@@ -1,11 +1,11 @@
 # app/utils/audio_generator.py
 
+import io
 import os
 import shutil
-from gtts import gTTS
-from pydub import AudioSegment
 
 from app.models import Medication, Dosage
+from app.utils.device_sync import audio_stack
 
 BASE_AUDIO_DIR = "app/static/audio"
 
@@ -55,16 +55,12 @@ def normalize(lang):
 # Convert MP3 → WAV (ESP32 + MAX98357A format)
 # --------------------------------------------------------
 def mp3_to_wav(mp3_path, wav_path):
-    audio = AudioSegment.from_mp3(mp3_path)
+    _, dsp = audio_stack()
+    with open(mp3_path, "rb") as f:
+        pcm = dsp.mp3_to_device_pcm(f.read())
 
-    # ESP32 I2S recommended format
-    audio = (
-        audio.set_sample_width(2)   # 16-bit PCM
-             .set_frame_rate(16000) # 16 kHz
-             .set_channels(1)       # Mono
-    )
-
-    audio.export(wav_path, format="wav")
+    # ESP32 I2S recommended format: 16-bit PCM, 16 kHz, mono
+    dsp.write_wav(wav_path, pcm)
 
 # --------------------------------------------------------
 # Generate WAV file from text
@@ -72,13 +68,11 @@ def mp3_to_wav(mp3_path, wav_path):
 def generate_wav(text, wav_path, lang):
     ensure_dir(os.path.dirname(wav_path))
 
-    temp_mp3 = wav_path.replace(".wav", ".mp3")
-
-    tts = gTTS(text=text, lang=lang)
-    tts.save(temp_mp3)
+    gTTS, dsp = audio_stack()
+    mp3 = io.BytesIO()
+    gTTS(text=text, lang=lang).write_to_fp(mp3)
 
-    mp3_to_wav(temp_mp3, wav_path)
-    os.remove(temp_mp3)
+    dsp.write_wav(wav_path, dsp.mp3_to_device_pcm(mp3.getvalue()))
 
     return wav_path
 
@@ -0,0 +1,220 @@
+# app/utils/audio_packs.py
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:            # Windows dev boxes: in-process locking only
+    fcntl = None
+
+
+# =========================================================
+# VERSIONED AUDIO PACKS
+# =========================================================
+# A patient's clips for one language live in
+#
+#   app/static/audio/<patient>/<lang>/<version>/...
+#
+# where <version> hashes everything that goes into the audio (the
+# sentence plan, TTS backend, composer format). A pack is built in a
+# staging directory next to it and published with one os.rename(),
+# so a downloading device sees either the old pack or the complete
+# new one, never a half-written directory. An unchanged plan reuses
+# the published pack without any synthesis.
+#
+# Builds for one patient are serialized by a thread lock plus an
+# fcntl lock file, so concurrent requests and workers don't race.
+# The file lock is polled (LOCK_NB + sleep) rather than waited on:
+# a blocking flock() would stall a gevent / eventlet worker's whole
+# event loop while another process builds a pack, whereas sleep()
+# yields to the other green threads.
+#
+# <patient>/packs.json counts references: every manifest handed out
+# moves its holder (device code, or "portal" for dashboard previews)
+# onto that pack. Packs nobody holds are deleted once PACK_GC_GRACE
+# seconds have passed since their last release, which leaves time for
+# downloads that started from an older manifest. Pre-versioning files
+# (clips and med_<id> folders directly under <lang>) are removed too.
+
+REFS_FILE = "packs.json"
+LOCK_FILE = ".lock"
+STAGING_PREFIX = ".staging-"
+
+LOCK_POLL_MIN = 0.01               # seconds between flock attempts,
+LOCK_POLL_MAX = 0.2                # backing off up to this
+
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+
+def pack_version(lang, plan, backend):
+    """plan: [(relative wav path, sentences)] in a stable order."""
+    from app.utils.audio_compose import FORMAT_VERSION
+
+    digest = hashlib.sha256()
+    digest.update(json.dumps([FORMAT_VERSION, backend, lang, plan], sort_keys=True).encode())
+    return digest.hexdigest()[:16]
+
+
+# ---------------------------------------------------------
+# Per-patient lock (threads + processes)
+# ---------------------------------------------------------
+def _flock_cooperative(fh):
+    delay = LOCK_POLL_MIN
+    while True:
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return
+        except BlockingIOError:
+            time.sleep(delay)          # green-thread aware under gevent / eventlet
+            delay = min(delay * 2, LOCK_POLL_MAX)
+
+
+@contextmanager
+def patient_lock(patient_dir):
+    with _thread_locks_guard:
+        lock = _thread_locks.setdefault(patient_dir, threading.Lock())
+
+    with lock:
+        os.makedirs(patient_dir, exist_ok=True)
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(patient_dir, LOCK_FILE), "w") as fh:
+            _flock_cooperative(fh)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+# ---------------------------------------------------------
+# Build + publish
+# ---------------------------------------------------------
+def publish_pack(patient_dir, lang, version, build):
+    """
+    Make <patient_dir>/<lang>/<version> exist. build(staging_dir) writes
+    the clips; it only runs when the pack is not published yet.
+    Call with patient_lock held. Returns (pack_dir, built).
+    """
+    pack_dir = os.path.join(patient_dir, lang, version)
+    if os.path.isdir(pack_dir):
+        return pack_dir, False
+
+    staging = os.path.join(patient_dir, f"{STAGING_PREFIX}{lang}-{version}-{os.getpid()}")
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    try:
+        build(staging)
+        os.makedirs(os.path.dirname(pack_dir), exist_ok=True)
+        os.rename(staging, pack_dir)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return pack_dir, True
+
+
+# ---------------------------------------------------------
+# Reference counts
+# ---------------------------------------------------------
+def _load_refs(patient_dir):
+    try:
+        with open(os.path.join(patient_dir, REFS_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_refs(patient_dir, refs):
+    path = os.path.join(patient_dir, REFS_FILE)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(refs, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def hold_pack(patient_dir, pack, holder):
+    """Move HOLDER's reference onto PACK ("<lang>/<version>"). Lock held."""
+    refs = _load_refs(patient_dir)
+    now = time.time()
+
+    for name, info in refs.items():
+        if name != pack and holder in info["holders"]:
+            info["holders"].remove(holder)
+            info["released_at"] = now
+
+    info = refs.setdefault(pack, {"holders": [], "released_at": now})
+    if holder not in info["holders"]:
+        info["holders"].append(holder)
+
+    _save_refs(patient_dir, refs)
+
+
+# ---------------------------------------------------------
+# Garbage collection
+# ---------------------------------------------------------
+def collect_patient(patient_dir, grace):
+    """Delete unreferenced packs and legacy files. Lock held. Returns names removed."""
+    refs = _load_refs(patient_dir)
+    now = time.time()
+    removed = []
+
+    for name in os.listdir(patient_dir):
+        path = os.path.join(patient_dir, name)
+
+        # Staging dirs left behind by a crashed build
+        if name.startswith(STAGING_PREFIX):
+            if now - os.path.getmtime(path) > grace:
+                shutil.rmtree(path, ignore_errors=True)
+                removed.append(name)
+            continue
+        if not os.path.isdir(path):
+            continue
+
+        lang = name
+        for entry in os.listdir(path):
+            pack = f"{lang}/{entry}"
+            full = os.path.join(path, entry)
+            info = refs.get(pack)
+
+            if info is None:
+                # Legacy unversioned clip / med_<id> folder, or a pack
+                # whose refs were lost: keep it for one grace period
+                if now - os.path.getmtime(full) <= grace:
+                    continue
+            elif info["holders"] or now - info["released_at"] <= grace:
+                continue
+
+            if os.path.isdir(full):
+                shutil.rmtree(full, ignore_errors=True)
+            else:
+                os.remove(full)
+            refs.pop(pack, None)
+            removed.append(pack)
+
+        if not os.listdir(path):
+            os.rmdir(path)
+
+    if removed:
+        _save_refs(patient_dir, refs)
+        print(f"[AUDIO] 🧹 {os.path.basename(patient_dir)}: removed {', '.join(removed)}")
+    return removed
+
+
+def collect_all(base_dir, grace):
+    """GC every patient directory under BASE_DIR."""
+    removed = 0
+    if not os.path.isdir(base_dir):
+        return removed
+    for name in sorted(os.listdir(base_dir)):
+        patient_dir = os.path.join(base_dir, name)
+        if os.path.isdir(patient_dir) and not name.startswith("."):
+            with patient_lock(patient_dir):
+                removed += len(collect_patient(patient_dir, grace))
+    return removed
@@ -0,0 +1,99 @@
+# app/utils/broadcast.py
+
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, exists, insert, select
+
+from app.extensions import db
+from app.models import Device, DeviceCommandQueue, DoctorPatientLink
+
+
+# =========================================================
+# FLEET BROADCAST COMMANDS
+# =========================================================
+# push_device_cmd() queues one command for one device. A broadcast
+# queues the same command for every device matching a filter, in a
+# single SELECT + bulk INSERT. Devices that already have the same
+# command pending are skipped in SQL.
+#
+# Each row gets a not_before time so the fleet is released at
+# BROADCAST_RATE_PER_MINUTE; heartbeat only hands out commands whose
+# time has come. A fleet-wide force_sync therefore spreads its
+# downloads instead of every device fetching in the same minute.
+
+BROADCAST_COMMANDS = ("force_sync", "reboot", "stop_alarm", "play_audio", "set_led")
+
+INSERT_CHUNK = 1000
+
+
+class BroadcastError(ValueError):
+    pass
+
+
+def target_devices(owner_ids=None, language=None, doctor_id=None):
+    """SELECT of device codes matching every given filter (none = all devices)."""
+    q = select(Device.device_code)
+
+    if owner_ids:
+        q = q.where(Device.owner_id.in_(owner_ids))
+    if language:
+        q = q.where(Device.language == language)
+    if doctor_id:
+        q = q.where(Device.owner_id.in_(
+            select(DoctorPatientLink.patient_id).where(
+                DoctorPatientLink.doctor_id == doctor_id,
+                DoctorPatientLink.active.is_(True)
+            )
+        ))
+    return q
+
+
+def broadcast_command(command, data=None, owner_ids=None, language=None,
+                      doctor_id=None, rate_per_minute=None):
+    """
+    Queue COMMAND for every matching device, paced at rate_per_minute
+    (default BROADCAST_RATE_PER_MINUTE). Returns a summary dict.
+    """
+    if command not in BROADCAST_COMMANDS:
+        raise BroadcastError(f"Unknown broadcast command: {command}")
+
+    rate = rate_per_minute or current_app.config["BROADCAST_RATE_PER_MINUTE"]
+    if rate <= 0:
+        raise BroadcastError("Rate must be a positive number of devices per minute.")
+
+    matching = target_devices(owner_ids, language, doctor_id)
+
+    # Dedupe in SQL: skip devices with this command still pending
+    pending = exists().where(and_(
+        DeviceCommandQueue.device_code == Device.device_code,
+        DeviceCommandQueue.command == command,
+        DeviceCommandQueue.processed.is_(False)
+    ))
+    codes = db.session.scalars(matching.where(~pending).order_by(Device.id)).all()
+    total = db.session.scalar(select(db.func.count()).select_from(matching.subquery()))
+
+    now = datetime.utcnow()
+    step = 60.0 / rate
+    rows = [
+        dict(device_code=code, command=command, data=data or {}, processed=False,
+             created_at=now, not_before=now + timedelta(seconds=i * step))
+        for i, code in enumerate(codes)
+    ]
+
+    for i in range(0, len(rows), INSERT_CHUNK):
+        db.session.execute(insert(DeviceCommandQueue), rows[i:i + INSERT_CHUNK])
+    db.session.commit()
+
+    finishes = rows[-1]["not_before"] if rows else now
+    print(f"[BROADCAST] 📣 {command} → {len(rows)} devices "
+          f"({total - len(rows)} already pending), {rate}/min until {finishes:%H:%M:%S}")
+
+    return {
+        "command": command,
+        "matched": total,
+        "queued": len(rows),
+        "already_pending": total - len(rows),
+        "rate_per_minute": rate,
+        "last_release": finishes.isoformat(),
+    }
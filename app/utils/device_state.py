@@ -0,0 +1,236 @@
+# app/utils/device_state.py
+
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert
+
+from app.extensions import db
+from app.models import DeviceState, DeviceFile, DeviceFileEvent, DeviceStorageSample
+
+
+# A storage sample is written only when usage changes,
+# or at most this often while it stays flat.
+STORAGE_SAMPLE_INTERVAL = timedelta(hours=1)
+
+
+# =========================================================
+# PAYLOAD NORMALIZATION
+# =========================================================
+def guess_category(path):
+    ext = path.rsplit(".", 1)[-1].lower() if "." in path else ""
+    if ext in ("wav", "mp3", "adpcm", "ulaw"):
+        return "audio"
+    if ext == "json":
+        return "json"
+    return "logs"
+
+
+def _path(item):
+    """
+    Relative path of a reported file (bare string or {"path": ...}),
+    or None for anything else the device sent.
+    """
+    if isinstance(item, dict):
+        item = item.get("path")
+    if not isinstance(item, str):
+        return None
+    return item.lstrip("/") or None
+
+
+def _entry(item, category=None):
+    """
+    Accept either a bare path string or {"path", "size", "hash"}.
+    """
+    path = _path(item)
+    if not path:
+        return None
+    if not isinstance(item, dict):
+        item = {}
+
+    return {
+        "path": path,
+        "category": category or item.get("category") or guess_category(path),
+        "size": item.get("size"),
+        "hash": item.get("hash"),
+    }
+
+
+def reported_inventory(files):
+    """
+    {"audio": [...], "json": [...], "logs": [...]} → {path: entry}
+    """
+    inventory = {}
+    for category, items in (files or {}).items():
+        for item in items or []:
+            e = _entry(item, category)
+            if e:
+                inventory[e["path"]] = e
+    return inventory
+
+
+# =========================================================
+# DIFF + APPLY
+# =========================================================
+# Two reports from one device can race (retries, a reconnect), so
+# rows keyed by device (+ path) are upserted: the second writer
+# updates what the first inserted instead of failing on the unique
+# constraint.
+
+def _upsert(model, rows, keys, update):
+    # Dialect modules imported here: the PostgreSQL one alone costs
+    # ~50 ms of worker boot
+    dialect = db.engine.dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        db.session.execute(insert(model), rows)
+        return
+
+    stmt = dialect_insert(model)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=keys,
+        set_={col: getattr(stmt.excluded, col) for col in update}
+    )
+    db.session.execute(stmt, rows)
+
+def stored_inventory(device_id):
+    rows = db.session.query(
+        DeviceFile.path, DeviceFile.size, DeviceFile.hash
+    ).filter(DeviceFile.device_id == device_id).all()
+    return {p: (size, h) for p, size, h in rows}
+
+
+def diff_inventory(stored, reported):
+    stored_paths = set(stored)
+    reported_paths = set(reported)
+
+    added = [reported[p] for p in reported_paths - stored_paths]
+    removed = list(stored_paths - reported_paths)
+    changed = [
+        reported[p] for p in reported_paths & stored_paths
+        if (reported[p]["size"], reported[p]["hash"]) != stored[p]
+    ]
+    return added, removed, changed
+
+
+def apply_file_diff(device_id, added, removed, changed):
+    now = datetime.utcnow()
+
+    if removed:
+        DeviceFile.query.filter(
+            DeviceFile.device_id == device_id,
+            DeviceFile.path.in_(removed)
+        ).delete(synchronize_session=False)
+
+    for e in changed:
+        DeviceFile.query.filter_by(device_id=device_id, path=e["path"]).update(
+            {"size": e["size"], "hash": e["hash"], "seen_at": now},
+            synchronize_session=False
+        )
+
+    if added:
+        _upsert(DeviceFile, [
+            dict(e, device_id=device_id, seen_at=now) for e in added
+        ], keys=["device_id", "path"], update=["category", "size", "hash", "seen_at"])
+
+    events = (
+        [dict(path=e["path"], action="added", size=e["size"], hash=e["hash"]) for e in added]
+        + [dict(path=p, action="removed", size=None, hash=None) for p in removed]
+        + [dict(path=e["path"], action="changed", size=e["size"], hash=e["hash"]) for e in changed]
+    )
+    if events:
+        db.session.execute(insert(DeviceFileEvent), [
+            dict(ev, device_id=device_id, created_at=now) for ev in events
+        ])
+
+
+def record_storage(device_id, used, total):
+    now = datetime.utcnow()
+
+    last = DeviceStorageSample.query.filter_by(device_id=device_id).order_by(
+        DeviceStorageSample.recorded_at.desc()
+    ).first()
+
+    if (
+        not last
+        or (last.storage_used, last.storage_total) != (used, total)
+        or now - last.recorded_at >= STORAGE_SAMPLE_INTERVAL
+    ):
+        db.session.add(DeviceStorageSample(
+            device_id=device_id,
+            storage_used=used,
+            storage_total=total,
+            recorded_at=now
+        ))
+
+    _upsert(DeviceState, [dict(
+        device_id=device_id, storage_used=used, storage_total=total, updated_at=now
+    )], keys=["device_id"], update=["storage_used", "storage_total", "updated_at"])
+
+
+def apply_state_report(device, payload):
+    """
+    Store a device state report. Accepts either a full inventory
+    ("files") or a device-side diff ("added" / "removed").
+    Returns counts of what changed.
+    """
+    if "added" in payload or "removed" in payload:
+        stored = stored_inventory(device.id)
+        # Keyed by path: a path listed twice is one file (last entry wins)
+        reported_added = list({
+            e["path"]: e for e in (_entry(i) for i in payload.get("added") or []) if e
+        }.values())
+        removed = list({p for p in map(_path, payload.get("removed") or []) if p in stored})
+
+        added = [e for e in reported_added if e["path"] not in stored]
+        changed = [
+            e for e in reported_added
+            if e["path"] in stored and (e["size"], e["hash"]) != stored[e["path"]]
+        ]
+    else:
+        added, removed, changed = diff_inventory(
+            stored_inventory(device.id),
+            reported_inventory(payload.get("files"))
+        )
+
+    apply_file_diff(device.id, added, removed, changed)
+    record_storage(
+        device.id,
+        payload.get("storage_used", 0),
+        payload.get("storage_total", 0)
+    )
+    db.session.commit()
+
+    return {"added": len(added), "removed": len(removed), "changed": len(changed)}
+
+
+# =========================================================
+# QUERIES FOR THE PORTAL
+# =========================================================
+def manifest_paths(manifest):
+    """Flatten an audio manifest into the set of relative file paths."""
+    files = (manifest or {}).get("audio_files", {})
+    entries = list(files.get("global", {}).values())
+    for clips in files.get("medicines", {}).values():
+        entries.extend(clips.values())
+    # Entries are path strings, or {"path", "codec"} for encoded clips
+    return {(e["path"] if isinstance(e, dict) else e).lstrip("/") for e in entries}
+
+
+def files_needed(device_id, wanted_paths):
+    """Paths the device still has to download."""
+    return set(wanted_paths) - set(stored_inventory(device_id))
+
+
+def files_unneeded(device_id, wanted_paths):
+    """Paths on the device that nothing references any more."""
+    return set(stored_inventory(device_id)) - set(wanted_paths)
+
+
+def inventory_summary(device_id):
+    rows = db.session.query(
+        DeviceFile.category, func.count(DeviceFile.id), func.sum(DeviceFile.size)
+    ).filter(DeviceFile.device_id == device_id).group_by(DeviceFile.category).all()
+
+    return {cat or "other": {"count": n, "bytes": b or 0} for cat, n, b in rows}
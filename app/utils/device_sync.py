@@ -2,19 +2,28 @@
 
 import os
 import json
-import shutil
 from datetime import datetime
 
+from flask import current_app
+
 from app.models import Medication, Dosage
-from gtts import gTTS
-from pydub import AudioSegment
-from pydub.utils import which
 
 # ---------------------------------------------------------
-# Windows Fix: Force pydub to use ffmpeg correctly
+# AUDIO TOOLCHAIN — loaded on first use, not at import, so
+# workers that never generate audio never pay for it
 # ---------------------------------------------------------
-AudioSegment.converter = which("ffmpeg")
-AudioSegment.ffprobe = which("ffprobe")
+_audio_stack = None
+
+
+def audio_stack():
+    """(gTTS, audio_dsp), imported once."""
+    global _audio_stack
+    if _audio_stack is None:
+        from gtts import gTTS
+        from app.utils import audio_dsp
+
+        _audio_stack = (gTTS, audio_dsp)
+    return _audio_stack
 
 # ---------------------------------------------------------
 # BASE AUDIO DIRECTORY
@@ -104,100 +113,115 @@ def normalize_lang(l):
     return SUPPORTED_LANGS.get(l.lower(), "en")
 
 # =========================================================
-# TTS GENERATOR — NORMALIZED + BOOSTED WAV
+# AUDIO MANIFEST (versioned packs, see audio_packs)
 # =========================================================
-def generate_wav_tts(text, wav_path, lang):
-    ensure_dir(os.path.dirname(wav_path))
-
-    temp_mp3 = wav_path.replace(".wav", ".mp3")
-
-    tts = gTTS(text=text, lang=lang)
-    tts.save(temp_mp3)
-
-    audio = AudioSegment.from_mp3(temp_mp3)
-
-    # LOUD & CLEAN
-    audio = audio.normalize(headroom=0.1)
-    audio = audio.apply_gain(+6)
-
-    # ESP32-compatible
-    audio = audio.set_frame_rate(16000).set_channels(1).set_sample_width(2)
-    audio.export(wav_path, format="wav")
-
-    try: os.remove(temp_mp3)
-    except: pass
+GLOBAL_LINES = {
+    "snooze": "I will remind you again.",
+    "dispense_alarm": "Your medicine is ready. Please collect it.",
+    "dustbin_alarm": "Eat your medicine and then put the wrapper in the dustbin."
+}
 
-# =========================================================
-# SENTENCE BUILDER
-# =========================================================
-def build_sentence(m, d):
-    parts = [
-        f"It is {d.time_range_start.strftime('%I:%M %p')}.",
-        f"Take {m.name}."
-    ]
-    if d.food_status:
-        parts.append(f"{d.food_status}.")
-    if d.remark:
-        parts.append(f"Note: {d.remark}.")
-    return " ".join(parts)
 
-# =========================================================
-# AUDIO MANIFEST
-# =========================================================
-def build_audio_manifest_cached(user):
+def build_audio_manifest_cached(user, codec="pcm16", holder="portal"):
+    """
+    codec: what the device declared it can decode (audio_codecs).
+    pcm16 keeps the classic manifest of path strings; any other codec
+    gives {"path", "codec"} entries pointing at re-encoded clips.
+    holder: who will download from this manifest (device code, or
+    "portal" for previews); it keeps the pack alive (audio_packs).
+    """
+    from app.utils.audio_compose import compose_wav, dosage_phrases, fragment_stats
+    from app.utils import audio_packs
 
     device = user.devices[0]
     lang = normalize_lang(device.language or "en")
-
-    patient_dir = os.path.join(BASE_AUDIO_DIR, str(user.id), lang)
-
-    # Clean old audio
-    if os.path.exists(patient_dir):
-        shutil.rmtree(patient_dir, ignore_errors=True)
-    ensure_dir(patient_dir)
-
-    meds = Medication.query.filter_by(patient_id=user.id).all()
-
-    manifest = {"global": {}, "medicines": {}}
+    patient_dir = os.path.join(BASE_AUDIO_DIR, str(user.id))
 
     # ----------------------------------------------------
-    # GLOBAL AUDIO
+    # PLAN: (relative path, sentences) for every clip
     # ----------------------------------------------------
-    global_lines = {
-        "snooze": "I will remind you again.",
-        "dispense_alarm": "Your medicine is ready. Please collect it.",
-        "dustbin_alarm": "Eat your medicine and then put the wrapper in the dustbin."
-    }
+    plan = [(f"{key}.wav", [[text]]) for key, text in GLOBAL_LINES.items()]
+    layout = {"global": {key: f"{key}.wav" for key in GLOBAL_LINES}, "medicines": {}}
+    windows = {}
 
-    for key, text in global_lines.items():
-        wav_path = os.path.join(patient_dir, f"{key}.wav")
-        generate_wav_tts(text, wav_path, lang)
-        manifest["global"][key] = f"audio/{user.id}/{lang}/{key}.wav"
-
-    # ----------------------------------------------------
-    # MEDICINE-SPECIFIC AUDIO
-    # ----------------------------------------------------
+    meds = Medication.query.filter_by(patient_id=user.id).order_by(Medication.id).all()
     for m in meds:
+        dosages = Dosage.query.filter_by(medication_id=m.id).order_by(Dosage.id).all()
+        layout["medicines"][str(m.id)] = {}
+        for idx, d in enumerate(dosages, start=1):
+            rel = f"med_{m.id}/dosage_{idx}.wav"
+            plan.append((rel, dosage_phrases(m, d)))
+            layout["medicines"][str(m.id)][f"dosage_{idx}"] = rel
+            windows[f"{m.id}/dosage_{idx}"] = [
+                d.time_range_start.strftime("%H:%M"), d.time_range_end.strftime("%H:%M")
+            ]
+
+    version = audio_packs.pack_version(lang, plan, current_app.config.get("TTS_BACKEND"))
+
+    # Clips are composed from cached phrase fragments (audio_compose);
+    # only fragments never seen before cost a TTS call
+    def build(staging):
+        before = fragment_stats()
+        for rel, sentences in plan:
+            compose_wav(sentences, lang, os.path.join(staging, rel))
+        after = fragment_stats()
+        synthesized = after["synthesized"] - before["synthesized"]
+        reused = sum(after[k] - before[k] for k in ("memory_hits", "disk_hits"))
+        print(f"[AUDIO] 📦 user {user.id} ({lang}) pack {version}: {len(plan)} clips, "
+              f"{synthesized} fragments synthesized, {reused} reused")
+
+    with audio_packs.patient_lock(patient_dir):
+        pack_dir, _ = audio_packs.publish_pack(patient_dir, lang, version, build)
+
+        def clip_path(rel):
+            wav_path = os.path.join(pack_dir, rel)
+            return "audio/" + os.path.relpath(wav_path, BASE_AUDIO_DIR).replace(os.sep, "/")
+
+        manifest = encode_manifest({
+            "global": {k: clip_path(rel) for k, rel in layout["global"].items()},
+            "medicines": {
+                med: {k: clip_path(rel) for k, rel in clips.items()}
+                for med, clips in layout["medicines"].items()
+            },
+        }, codec)
+
+        audio_packs.hold_pack(patient_dir, f"{lang}/{version}", holder)
+        audio_packs.collect_patient(patient_dir, current_app.config["PACK_GC_GRACE"])
 
-        med_folder = os.path.join(patient_dir, f"med_{m.id}")
-        ensure_dir(med_folder)
+    return {
+        "audio_files": manifest,
+        "windows": windows,          # dose window per clip, for manifest_priority
+        "pack": version,
+        "timestamp": datetime.utcnow().isoformat()
+    }
 
-        manifest["medicines"][str(m.id)] = {}
 
-        dosages = Dosage.query.filter_by(medication_id=m.id).all()
+def clip_file(path):
+    """Manifest path ("audio/<patient>/...") → file under BASE_AUDIO_DIR."""
+    return os.path.join(BASE_AUDIO_DIR, path[len("audio/"):])
 
-        for idx, d in enumerate(dosages, start=1):
 
-            fname = f"dosage_{idx}.wav"
-            wav_path = os.path.join(med_folder, fname)
+def encode_manifest(audio_files, codec):
+    """
+    A pcm16 manifest (path strings) for a device that declared CODEC:
+    {"path", "codec"} entries, each clip encoded once (audio_codecs).
+    """
+    from app.utils.audio_codecs import PCM16, encode_clip
 
-            text = build_sentence(m, d)
-            generate_wav_tts(text, wav_path, lang)
+    if codec == PCM16:
+        return audio_files
 
-            manifest["medicines"][str(m.id)][f"dosage_{idx}"] = \
-                f"audio/{user.id}/{lang}/med_{m.id}/{fname}"
+    def entry(path):
+        encoded = encode_clip(clip_file(path), codec)
+        return {
+            "path": "audio/" + os.path.relpath(encoded, BASE_AUDIO_DIR).replace(os.sep, "/"),
+            "codec": codec,
+        }
 
     return {
-        "audio_files": manifest,
-        "timestamp": datetime.utcnow().isoformat()
+        "global": {k: entry(p) for k, p in audio_files["global"].items()},
+        "medicines": {
+            med: {k: entry(p) for k, p in clips.items()}
+            for med, clips in audio_files["medicines"].items()
+        },
     }
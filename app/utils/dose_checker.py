@@ -2,6 +2,8 @@
 
 from datetime import datetime, timedelta
 from app.models import db, Medication, Dosage, Log, Alert
+from app.utils.log_search import invalidate_med_names
+from app.utils.realtime import publish_new_logs, publish_alerts
 
 
 def detect_missed_doses(patient_id, window_hours=24):
@@ -20,6 +22,8 @@ def detect_missed_doses(patient_id, window_hours=24):
 
     missed_count = 0
     alerts_created = 0
+    new_logs = []
+    new_alerts = []
 
     for med in medications:
         dosages = Dosage.query.filter_by(medication_id=med.id).all()
@@ -52,12 +56,14 @@ def detect_missed_doses(patient_id, window_hours=24):
                 # Check for Late Dose
                 delay = (taken_log.taken_time - expected_start).total_seconds() / 60
                 if delay > 30:
-                    db.session.add(Alert(
+                    alert = Alert(
                         user_id=patient_id,
                         title="Late Dose",
                         message=f"You took {med.name} {int(delay)} minutes late.",
                         created_at=datetime.utcnow()
-                    ))
+                    )
+                    db.session.add(alert)
+                    new_alerts.append(alert)
                     alerts_created += 1
 
                 continue  # Taken, no missed dose.
@@ -81,17 +87,25 @@ def detect_missed_doses(patient_id, window_hours=24):
                 dustbin_sensor=False
             )
             db.session.add(missed_log)
+            new_logs.append(missed_log)
 
             # Create alert
-            db.session.add(Alert(
+            alert = Alert(
                 user_id=patient_id,
                 title="Missed Dose",
                 message=f"You missed your {med.name} dose scheduled at {d.time_range_start.strftime('%I:%M %p')}.",
                 created_at=datetime.utcnow()
-            ))
+            )
+            db.session.add(alert)
+            new_alerts.append(alert)
             alerts_created += 1
 
     db.session.commit()
+    if missed_count:
+        invalidate_med_names(patient_id)
+
+    publish_new_logs(patient_id, new_logs)
+    publish_alerts(new_alerts)
 
     print(f"[DOSE CHECK] Missed={missed_count}, Alerts={alerts_created}")
     return {
@@ -0,0 +1,120 @@
+# app/utils/identity.py
+
+import time
+
+from flask import current_app, session, has_request_context
+from flask_login import UserMixin
+from sqlalchemy import event
+
+from app.extensions import db
+from app.models import User
+from app.utils.cache import TTLCache
+
+
+# Fields needed for auth + role checks on every request
+IDENTITY_FIELDS = ("id", "name", "username", "role", "approved", "email")
+
+SESSION_KEY = "_identity"
+
+_identity_cache = TTLCache(maxsize=10000, ttl=60)
+
+
+# =========================================================
+# LIGHTWEIGHT USER RECORD
+# =========================================================
+class CachedIdentity(UserMixin):
+    """
+    Stand-in for User built from the identity cache.
+    Relationships and any other attribute (devices, alerts…) load
+    the full User row on first access, so callers don't need to care.
+    """
+
+    def __init__(self, id, name, username, role, approved, email):
+        self.id = id
+        self.name = name
+        self.username = username
+        self.role = role
+        self.approved = approved
+        self.email = email
+        self._user = None
+
+    def _model(self):
+        if self._user is None:
+            self._user = db.session.get(User, self.id)
+        return self._user
+
+    def __getattr__(self, name):
+        # only reached for attributes not set in __init__
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._model(), name)
+
+    def __repr__(self):
+        return f"<CachedIdentity {self.username}>"
+
+
+# =========================================================
+# LOADER
+# =========================================================
+def configure_identity_cache(app):
+    _identity_cache.maxsize = app.config["IDENTITY_CACHE_SIZE"]
+    _identity_cache.ttl = app.config["IDENTITY_CACHE_TTL"]
+
+
+def _record_from_session(user_id):
+    if not current_app.config["IDENTITY_IN_SESSION"] or not has_request_context():
+        return None
+
+    data = session.get(SESSION_KEY)
+    if not data or data.get("id") != user_id:
+        return None
+
+    # Session copies are trusted only as long as a cache entry would be
+    if time.time() - data.get("at", 0) > _identity_cache.ttl:
+        return None
+
+    return tuple(data.get(f) for f in IDENTITY_FIELDS)
+
+
+def remember_identity(record):
+    if current_app.config["IDENTITY_IN_SESSION"] and has_request_context():
+        data = dict(zip(IDENTITY_FIELDS, record))
+        data["at"] = time.time()
+        session[SESSION_KEY] = data
+
+
+def identity_record(user):
+    return tuple(getattr(user, f) for f in IDENTITY_FIELDS)
+
+
+def load_identity(user_id):
+    record = _identity_cache.get(user_id) or _record_from_session(user_id)
+
+    if record is None:
+        row = db.session.query(
+            *(getattr(User, f) for f in IDENTITY_FIELDS)
+        ).filter(User.id == user_id).first()
+
+        if not row:
+            return None
+
+        # Entries are only (re)set after a DB read, so TTL bounds staleness
+        record = tuple(row)
+        _identity_cache.set(user_id, record)
+        remember_identity(record)
+
+    return CachedIdentity(*record)
+
+
+def invalidate_identity(user_id):
+    _identity_cache.pop(user_id)
+
+
+# ---------------------------------------------------------
+# Any ORM update/delete of a User drops its cached identity,
+# so role changes and approvals are seen on the next request.
+# ---------------------------------------------------------
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _drop_cached_identity(mapper, connection, target):
+    invalidate_identity(target.id)
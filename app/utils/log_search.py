@@ -0,0 +1,234 @@
+# app/utils/log_search.py
+
+import re
+import base64
+from datetime import datetime, timedelta
+
+from sqlalchemy import text, and_, or_, column, table
+
+from app.extensions import db
+from app.models import Log, Medication
+from app.utils.cache import TTLCache
+
+
+# ---------------------------------------------------------
+# FTS5 index over log medication names + dosage remarks.
+# rowid of log_fts == log.id, kept in step by triggers.
+# ---------------------------------------------------------
+LOG_FTS_TABLE = "log_fts"
+
+log_fts = table(LOG_FTS_TABLE, column("rowid"), column(LOG_FTS_TABLE))
+
+_FTS_DDL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {LOG_FTS_TABLE}
+    USING fts5(med_name, remark, tokenize='unicode61 remove_diacritics 2', prefix='2 3')
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS log_fts_ai AFTER INSERT ON log BEGIN
+        INSERT INTO {LOG_FTS_TABLE}(rowid, med_name, remark)
+        VALUES (new.id, new.med_name, (SELECT remark FROM dosage WHERE id = new.dose_id));
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS log_fts_ad AFTER DELETE ON log BEGIN
+        DELETE FROM {LOG_FTS_TABLE} WHERE rowid = old.id;
+    END
+    """,
+    # Remarks live on dosage: editing one re-indexes the logs that use it
+    f"""
+    CREATE TRIGGER IF NOT EXISTS log_fts_dosage_au AFTER UPDATE OF remark ON dosage BEGIN
+        UPDATE {LOG_FTS_TABLE}
+        SET remark = new.remark
+        WHERE rowid IN (SELECT id FROM log WHERE dose_id = new.id);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS log_fts_au AFTER UPDATE OF med_name, dose_id ON log BEGIN
+        UPDATE {LOG_FTS_TABLE}
+        SET med_name = new.med_name,
+            remark = (SELECT remark FROM dosage WHERE id = new.dose_id)
+        WHERE rowid = old.id;
+    END
+    """,
+]
+
+_FTS_BACKFILL = f"""
+    INSERT INTO {LOG_FTS_TABLE}(rowid, med_name, remark)
+    SELECT l.id, l.med_name, d.remark
+    FROM log l LEFT JOIN dosage d ON d.id = l.dose_id
+    WHERE l.id NOT IN (SELECT rowid FROM {LOG_FTS_TABLE})
+"""
+
+_fts_available = None
+
+
+def fts_enabled():
+    """
+    The index is built by `flask init-db`; a worker just checks
+    once whether it exists.
+    """
+    global _fts_available
+
+    if _fts_available is None:
+        engine = db.engine
+        if engine.dialect.name != "sqlite":
+            _fts_available = False
+        else:
+            with engine.connect() as conn:
+                _fts_available = bool(conn.execute(text(
+                    "SELECT 1 FROM sqlite_master WHERE type='table' AND name=:n"
+                ), {"n": LOG_FTS_TABLE}).first())
+
+    return _fts_available
+
+
+def ensure_log_fts():
+    """
+    Create the FTS table + triggers (SQLite only) and index any
+    logs written before the triggers existed.
+    """
+    global _fts_available
+
+    engine = db.engine
+    if engine.dialect.name != "sqlite":
+        _fts_available = False
+        return False
+
+    try:
+        with engine.begin() as conn:
+            created = not conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name=:n"
+            ), {"n": LOG_FTS_TABLE}).first()
+
+            for ddl in _FTS_DDL:
+                conn.execute(text(ddl))
+
+            if created:
+                conn.execute(text(_FTS_BACKFILL))
+                print("[SEARCH] ✅ Built log full-text index")
+
+        _fts_available = True
+    except Exception as e:
+        # SQLite built without FTS5 → fall back to LIKE filtering
+        print(f"[SEARCH] ⚠️ FTS5 unavailable: {e}")
+        _fts_available = False
+
+    return _fts_available
+
+
+def fts_match_expr(q):
+    """
+    Turn free text into a safe FTS5 expression:
+    every word becomes a quoted prefix term, all terms ANDed.
+    """
+    words = re.findall(r"\w+", q or "", flags=re.UNICODE)
+    return " ".join(f'"{w}"*' for w in words)
+
+
+# =========================================================
+# KEYSET CURSOR  (taken_time, id) — newest first
+# =========================================================
+# taken_time is nullable; logs without one sort after every dated
+# log (NULLS LAST) and are encoded with an empty time.
+
+def encode_cursor(log):
+    ts = log.taken_time.isoformat() if log.taken_time else ""
+    raw = f"{ts}|{log.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """(taken_time or None, id), or None for a malformed cursor."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        ts, log_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        return (datetime.fromisoformat(ts) if ts else None), int(log_id)
+    except Exception:
+        return None
+
+
+# =========================================================
+# HISTORY SEARCH
+# =========================================================
+def patient_med_ids(patient_id):
+    return db.select(Medication.id).where(Medication.patient_id == patient_id)
+
+
+def search_logs(patient_id, med_name=None, q=None, day=None, cursor=None, limit=50):
+    """
+    Return (logs, next_cursor) for a patient's dose history.
+
+    - med_name : exact medicine name (from the dropdown)
+    - q        : free text over medicine names + dosage remarks
+    - day      : a date; matched as a half-open taken_time range
+    - cursor   : opaque keyset cursor from a previous page
+    """
+    query = Log.query.filter(Log.med_id.in_(patient_med_ids(patient_id)))
+
+    if med_name:
+        query = query.filter(Log.med_name == med_name)
+
+    if q:
+        if fts_enabled():
+            expr = fts_match_expr(q)
+            if expr:
+                matches = db.select(log_fts.c.rowid).where(
+                    log_fts.c[LOG_FTS_TABLE].op("MATCH")(expr)
+                )
+                query = query.filter(Log.id.in_(matches))
+        else:
+            query = query.filter(Log.med_name.ilike(f"%{q}%"))
+
+    if day:
+        start = datetime.combine(day, datetime.min.time())
+        query = query.filter(
+            Log.taken_time >= start,
+            Log.taken_time < start + timedelta(days=1)
+        )
+
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        ts, log_id = position
+        if ts is None:
+            # Already into the undated tail
+            query = query.filter(Log.taken_time.is_(None), Log.id < log_id)
+        else:
+            query = query.filter(or_(
+                Log.taken_time < ts,
+                and_(Log.taken_time == ts, Log.id < log_id),
+                Log.taken_time.is_(None)
+            ))
+
+    rows = query.order_by(
+        Log.taken_time.desc().nulls_last(), Log.id.desc()
+    ).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1])
+
+    return rows, next_cursor
+
+
+# =========================================================
+# CACHED MEDICINE NAMES (history dropdown)
+# =========================================================
+_med_names_cache = TTLCache(maxsize=4096, ttl=300)
+
+
+def patient_med_names(patient_id):
+    def load():
+        rows = db.session.query(Log.med_name).filter(
+            Log.med_id.in_(patient_med_ids(patient_id)),
+            Log.med_name.isnot(None)
+        ).distinct().all()
+        return sorted(r[0] for r in rows)
+
+    return _med_names_cache.get_or_set(patient_id, load)
+
+
+def invalidate_med_names(patient_id):
+    if patient_id is not None:
+        _med_names_cache.pop(patient_id)
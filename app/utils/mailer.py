@@ -0,0 +1,452 @@
+# app/utils/mailer.py
+
+import hashlib
+import heapq
+import hmac
+import json
+import queue
+import random
+import socketserver
+import threading
+import time
+import urllib.request
+
+from app.extensions import db, mail
+
+
+# =========================================================
+# OUTBOUND NOTIFICATIONS
+# =========================================================
+# Alerts are written to the Alert table by the request / job that
+# raises them; publish_alerts() then hands them to this dispatcher.
+# A background thread batches them for NOTIFY_BATCH_WINDOW seconds,
+# folds each recipient's items into one digest, and delivers the
+# digest on every enabled channel (NOTIFY_CHANNELS):
+#
+#   email     Flask-Mail (run `python -m app.utils.mailer` for a local
+#             debugging SMTP server and point MAIL_SERVER at it)
+#   socketio  a "notification" event to the recipient's sessions
+#   webhook   JSON POST to NOTIFY_WEBHOOK_URL, HMAC-signed
+#
+# Failed deliveries are retried per (digest, channel) with
+# exponential backoff + jitter, without holding up other channels.
+
+class Digest:
+    def __init__(self, user_id, name, email, items):
+        self.user_id = user_id
+        self.name = name
+        self.email = email
+        self.items = items
+
+    def subject(self):
+        if len(self.items) == 1:
+            return f"Kapsul: {self.items[0]['title']}"
+        return f"Kapsul: {len(self.items)} new alerts"
+
+    def body(self):
+        lines = [f"Hello {self.name}," if self.name else "Hello,", ""]
+        for item in self.items:
+            lines.append(f"• {item['title']}: {item['message']}")
+        lines += ["", "— Kapsul Smart Pill Dispenser"]
+        return "\n".join(lines)
+
+    def payload(self):
+        return {"user_id": self.user_id, "items": self.items}
+
+
+# ---------------------------------------------------------
+# Channels — deliver(digests) returns {digest: error} failures
+# ---------------------------------------------------------
+class Channel:
+    name = "base"
+
+    def __init__(self, app):
+        self.app = app
+
+    def accepts(self, digest):
+        return True
+
+    def send(self, digest):
+        raise NotImplementedError
+
+    def deliver(self, digests):
+        failed = {}
+        for d in digests:
+            try:
+                self.send(d)
+            except Exception as e:
+                failed[d] = e
+        return failed
+
+
+class EmailChannel(Channel):
+    name = "email"
+
+    def accepts(self, digest):
+        return bool(digest.email)
+
+    def deliver(self, digests):
+        from flask_mail import Message
+
+        sender = self.app.config.get("MAIL_DEFAULT_SENDER") or "kapsul@localhost"
+        failed = {}
+        with self.app.app_context():
+            try:
+                # One SMTP session per batch
+                with mail.connect() as conn:
+                    for d in digests:
+                        try:
+                            conn.send(Message(
+                                subject=d.subject(), recipients=[d.email],
+                                body=d.body(), sender=sender
+                            ))
+                        except Exception as e:
+                            failed[d] = e
+            except Exception as e:
+                # Could not connect at all
+                return {d: e for d in digests}
+        return failed
+
+
+class SocketIOChannel(Channel):
+    name = "socketio"
+
+    def send(self, digest):
+        from app import socketio
+        from app.utils.realtime import user_room
+
+        socketio.emit("notification", digest.payload(), to=user_room(digest.user_id))
+
+
+class WebhookChannel(Channel):
+    name = "webhook"
+
+    def accepts(self, digest):
+        return bool(self.app.config.get("NOTIFY_WEBHOOK_URL"))
+
+    def send(self, digest):
+        url = self.app.config["NOTIFY_WEBHOOK_URL"]
+        body = json.dumps(digest.payload()).encode()
+        headers = {"Content-Type": "application/json"}
+        secret = self.app.config.get("NOTIFY_WEBHOOK_SECRET")
+        if secret:
+            sig = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+            headers["X-Kapsul-Signature"] = f"sha256={sig}"
+
+        req = urllib.request.Request(url, data=body, headers=headers, method="POST")
+        with urllib.request.urlopen(req, timeout=self.app.config["NOTIFY_WEBHOOK_TIMEOUT"]) as resp:
+            if resp.status >= 300:
+                raise RuntimeError(f"webhook answered {resp.status}")
+
+
+CHANNELS = {c.name: c for c in (EmailChannel, SocketIOChannel, WebhookChannel)}
+
+
+# =========================================================
+# DISPATCHER
+# =========================================================
+class Dispatcher:
+
+    def __init__(self, app):
+        cfg = app.config
+        self.app = app
+        self.window = cfg["NOTIFY_BATCH_WINDOW"]
+        self.batch_size = cfg["NOTIFY_BATCH_SIZE"]
+        self.max_attempts = cfg["NOTIFY_MAX_ATTEMPTS"]
+        self.retry_base = cfg["NOTIFY_RETRY_BASE"]
+
+        self.channels = [
+            CHANNELS[name.strip()](app)
+            for name in cfg["NOTIFY_CHANNELS"].split(",") if name.strip() in CHANNELS
+        ]
+
+        self.inbox = queue.Queue(maxsize=cfg["NOTIFY_QUEUE_SIZE"])
+        self.retries = []        # heap of (due, seq, attempt, channel, digest)
+        self._seq = 0
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._idle = threading.Event()
+        self._idle.set()
+
+        self.started_at = time.time()
+        self.stats = {
+            "enqueued": 0, "dropped": 0, "batches": 0, "digests": 0,
+            "retries": 0, "gave_up": 0,
+            "delivered": {c.name: 0 for c in self.channels},
+            "failed": {c.name: 0 for c in self.channels},
+            "last_batch_seconds": 0.0,
+        }
+        self._stats_lock = threading.Lock()
+
+    # ---------------- producer side ----------------
+    def submit(self, items):
+        self._ensure_started()
+        for item in items:
+            try:
+                self.inbox.put_nowait(item)
+                self._count("enqueued")
+            except queue.Full:
+                self._count("dropped")
+        self._idle.clear()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name="notify-dispatcher", daemon=True
+                    )
+                    self._thread.start()
+
+    def _count(self, key, channel=None, n=1):
+        with self._stats_lock:
+            if channel:
+                self.stats[key][channel] += n
+            else:
+                self.stats[key] += n
+
+    # ---------------- consumer side ----------------
+    def _collect(self, timeout):
+        """Block for the first item, then gather for one batch window."""
+        try:
+            batch = [self.inbox.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.inbox.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _digests(self, batch):
+        from app.models import User
+
+        by_user = {}
+        for item in batch:
+            by_user.setdefault(item["user_id"], []).append(item)
+
+        with self.app.app_context():
+            users = {
+                uid: (name, email) for uid, name, email in db.session.query(
+                    User.id, User.name, User.email
+                ).filter(User.id.in_(list(by_user)))
+            }
+            db.session.remove()
+
+        return [
+            Digest(uid, *users.get(uid, (None, None)), items)
+            for uid, items in by_user.items()
+        ]
+
+    def _deliver(self, channel, digests, attempt):
+        digests = [d for d in digests if channel.accepts(d)]
+        if not digests:
+            return
+        failed = channel.deliver(digests)
+        self._count("delivered", channel.name, len(digests) - len(failed))
+
+        for digest, error in failed.items():
+            self._count("failed", channel.name)
+            if attempt + 1 >= self.max_attempts:
+                self._count("gave_up")
+                print(f"[NOTIFY] ❌ {channel.name} → user {digest.user_id} gave up: {error}")
+                continue
+
+            delay = self.retry_base * (2 ** attempt) * random.uniform(0.8, 1.2)
+            self._seq += 1
+            heapq.heappush(self.retries, (
+                time.monotonic() + delay, self._seq, attempt + 1, channel, digest
+            ))
+            self._count("retries")
+
+    def _run_due_retries(self):
+        now = time.monotonic()
+        due = {}
+        while self.retries and self.retries[0][0] <= now:
+            _, _, attempt, channel, digest = heapq.heappop(self.retries)
+            due.setdefault((channel, attempt), []).append(digest)
+        for (channel, attempt), digests in due.items():
+            self._deliver(channel, digests, attempt)
+
+    def _run(self):
+        while True:
+            timeout = 1.0
+            if self.retries:
+                timeout = max(0.05, min(timeout, self.retries[0][0] - time.monotonic()))
+
+            batch = self._collect(timeout)
+            if batch:
+                started = time.perf_counter()
+                digests = self._digests(batch)
+                for channel in self.channels:
+                    self._deliver(channel, digests, 0)
+
+                with self._stats_lock:
+                    self.stats["batches"] += 1
+                    self.stats["digests"] += len(digests)
+                    self.stats["last_batch_seconds"] = time.perf_counter() - started
+
+            self._run_due_retries()
+
+            if self.inbox.empty() and not self.retries:
+                self._idle.set()
+
+    # ---------------- shutdown ----------------
+    def drain(self, timeout):
+        """Wait (up to timeout) until queued notifications are sent."""
+        if self._thread is None:
+            return True
+        return self._idle.wait(timeout)
+
+    def snapshot(self):
+        with self._stats_lock:
+            stats = json.loads(json.dumps(self.stats))
+        stats["queued"] = self.inbox.qsize()
+        stats["pending_retries"] = len(self.retries)
+        uptime = max(time.time() - self.started_at, 1e-9)
+        stats["delivered_per_second"] = round(sum(stats["delivered"].values()) / uptime, 3)
+        return stats
+
+
+_dispatcher = None
+
+
+def configure_notifications(app):
+    global _dispatcher
+    if not app.config["NOTIFY_ENABLED"]:
+        return
+    dispatcher = Dispatcher(app)
+    if not dispatcher.channels:
+        # Nothing configured to deliver on: don't queue at all
+        return
+    _dispatcher = dispatcher
+
+    from app.utils.metrics import register_collector
+    register_collector(_prometheus_lines)
+
+
+def notify_alerts(alerts):
+    """Queue Alert rows (already committed) for outbound delivery."""
+    if _dispatcher is None or not alerts:
+        return
+    _dispatcher.submit([
+        {
+            "alert_id": a.id,
+            "user_id": a.user_id,
+            "title": a.title,
+            "message": a.message,
+            "created_at": a.created_at.isoformat() if a.created_at else None,
+        }
+        for a in alerts
+    ])
+
+
+def drain_notifications(timeout):
+    return _dispatcher.drain(timeout) if _dispatcher else True
+
+
+def notification_stats():
+    return _dispatcher.snapshot() if _dispatcher else {}
+
+
+def _prometheus_lines():
+    s = notification_stats()
+    if not s:
+        return []
+
+    lines = [
+        "# HELP kapsul_notify_events_total Notification pipeline events.",
+        "# TYPE kapsul_notify_events_total counter",
+    ]
+    for key in ("enqueued", "dropped", "batches", "digests", "retries", "gave_up"):
+        lines.append(f'kapsul_notify_events_total{{event="{key}"}} {s[key]}')
+
+    lines += [
+        "# HELP kapsul_notify_deliveries_total Digest deliveries by channel and result.",
+        "# TYPE kapsul_notify_deliveries_total counter",
+    ]
+    for result in ("delivered", "failed"):
+        for channel, n in s[result].items():
+            lines.append(f'kapsul_notify_deliveries_total{{channel="{channel}",result="{result}"}} {n}')
+
+    lines += [
+        "# HELP kapsul_notify_queue_depth Notifications waiting (queue, retries).",
+        "# TYPE kapsul_notify_queue_depth gauge",
+        f'kapsul_notify_queue_depth{{queue="inbox"}} {s["queued"]}',
+        f'kapsul_notify_queue_depth{{queue="retry"}} {s["pending_retries"]}',
+        "# HELP kapsul_notify_last_batch_seconds Time to deliver the last batch.",
+        "# TYPE kapsul_notify_last_batch_seconds gauge",
+        f'kapsul_notify_last_batch_seconds {s["last_batch_seconds"]:.6f}',
+    ]
+    return lines
+
+
+# =========================================================
+# LOCAL DEBUGGING SMTP SERVER
+# =========================================================
+#   python -m app.utils.mailer              # 127.0.0.1:1025
+#   MAIL_SERVER=127.0.0.1 MAIL_PORT=1025 MAIL_USE_TLS=0 python run.py
+# Accepts every message and prints it; nothing is relayed.
+
+class _DebugSMTPHandler(socketserver.StreamRequestHandler):
+
+    def reply(self, line):
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        self.reply("220 kapsul debug smtp")
+        rcpts, sender = [], None
+
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            cmd = line.decode(errors="replace").strip()
+            verb = cmd[:4].upper()
+
+            if verb in ("HELO", "EHLO"):
+                self.reply("250 kapsul")
+            elif verb == "MAIL":
+                sender, rcpts = cmd[10:], []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                rcpts.append(cmd[8:])
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                for raw in self.rfile:
+                    if raw in (b".\r\n", b".\n"):
+                        break
+                    data.append(raw.decode(errors="replace"))
+                print(f"---------- MAIL FROM {sender} TO {', '.join(rcpts)} ----------")
+                print("".join(data).rstrip())
+                print("-" * 60)
+                self.reply("250 OK: queued")
+            elif verb == "RSET":
+                rcpts, sender = [], None
+                self.reply("250 OK")
+            elif verb == "NOOP":
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+def run_debug_smtp(host="127.0.0.1", port=1025):
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    with socketserver.ThreadingTCPServer((host, port), _DebugSMTPHandler) as server:
+        print(f"[MAIL] 📬 Debug SMTP server on {host}:{port}")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    run_debug_smtp()
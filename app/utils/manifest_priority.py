@@ -0,0 +1,113 @@
+# app/utils/manifest_priority.py
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from app.utils.device_sync import clip_file
+
+
+# =========================================================
+# DOWNLOAD ORDER FOR AUDIO MANIFESTS
+# =========================================================
+# After a language change the device has to fetch a whole new pack,
+# which can take minutes on a weak link. The manifest therefore also
+# carries a flat "files" list in the order to download it:
+#
+#   priority 0   global clips (alarms, snooze) — needed for any dose
+#   priority 1…  dosage clips, soonest dose first: a window that is
+#                open now, then by minutes until it next starts
+#
+# with size and sha256 per file, so the device can verify each clip
+# and start announcing as soon as the clips it needs next are in.
+# The order depends on the clock, so it is computed per download;
+# the dict-shaped "audio_files" stays as it was for older firmware.
+#
+# Clips inside a published pack never change (audio_packs), so their
+# size / hash are cached per process, keyed by path + mtime + size.
+
+CACHE_SIZE = 8192
+
+_info = OrderedDict()
+_lock = threading.Lock()
+
+
+def clip_info(path):
+    """(size, sha256 hex) of a manifest path."""
+    full = clip_file(path)
+    st = os.stat(full)
+    key = (full, st.st_mtime_ns, st.st_size)
+
+    with _lock:
+        cached = _info.get(key)
+        if cached is not None:
+            _info.move_to_end(key)
+            return cached
+
+    digest = hashlib.sha256()
+    with open(full, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            digest.update(chunk)
+    info = (st.st_size, digest.hexdigest())
+
+    with _lock:
+        _info[key] = info
+        while len(_info) > CACHE_SIZE:
+            _info.popitem(last=False)
+    return info
+
+
+def _minutes(hhmm):
+    hours, minutes = hhmm.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def minutes_until(window, now_minutes):
+    """0 while the window is open, else minutes until it next starts."""
+    start, end = _minutes(window[0]), _minutes(window[1])
+    if start <= now_minutes < end or (end < start and (now_minutes >= start or now_minutes < end)):
+        return 0
+    return (start - now_minutes) % (24 * 60)
+
+
+def parse_now(value):
+    """Device clock as "HH:MM" (e.g. ?now=07:45); server time otherwise."""
+    if value:
+        try:
+            return _minutes(value)
+        except ValueError:
+            pass
+    now = datetime.utcnow()     # same clock as dose_checker
+    return now.hour * 60 + now.minute
+
+
+def ordered_files(audio_files, windows, now_minutes):
+    """
+    Flat download list for AUDIO_FILES (path strings or {"path", "codec"}
+    entries), highest priority first.
+    """
+    def item(entry, priority, due_in=None):
+        path = entry["path"] if isinstance(entry, dict) else entry
+        size, sha256 = clip_info(path)
+        out = {"path": path, "size": size, "sha256": sha256, "priority": priority}
+        if isinstance(entry, dict):
+            out["codec"] = entry["codec"]
+        if due_in is not None:
+            out["due_in_min"] = due_in
+        return out
+
+    files = [item(entry, 0) for _, entry in sorted(audio_files.get("global", {}).items())]
+
+    doses = []
+    for med, clips in audio_files.get("medicines", {}).items():
+        for key, entry in clips.items():
+            window = (windows or {}).get(f"{med}/{key}")
+            due_in = minutes_until(window, now_minutes) if window else 24 * 60
+            path = entry["path"] if isinstance(entry, dict) else entry
+            doses.append((due_in, path, entry))
+
+    doses.sort(key=lambda d: (d[0], d[1]))
+    files.extend(item(entry, rank, due_in) for rank, (due_in, _, entry) in enumerate(doses, start=1))
+    return files
@@ -0,0 +1,225 @@
+# app/utils/metrics.py
+
+import threading
+import time
+from collections import Counter
+
+from flask import g, has_request_context, request, Response, abort
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.extensions import db
+
+
+# =========================================================
+# PER-REQUEST DB + LATENCY METRICS (per process)
+# =========================================================
+# Each request collects: wall time, query count, SQL time and ORM rows
+# loaded. Totals are kept per endpoint and served on /metrics in
+# Prometheus text format. With several workers, scrape each worker.
+#
+# SQL time is cursor.execute() time. SQLite produces most rows lazily
+# during fetch, so heavy reads show up in rows loaded + wall time too.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_lock = threading.Lock()
+_endpoints = {}
+_settings = {"slow_query": 0.1, "n_plus_one": 20}
+_collectors = []   # other subsystems: fn() → list of exposition lines
+
+
+def _endpoint_stats(endpoint):
+    stats = _endpoints.get(endpoint)
+    if stats is None:
+        stats = _endpoints[endpoint] = {
+            "status": Counter(),
+            "buckets": [0] * len(LATENCY_BUCKETS),
+            "seconds": 0.0,
+            "count": 0,
+            "queries": 0,
+            "sql_seconds": 0.0,
+            "rows": 0,
+            "slow_queries": 0,
+            "n_plus_one": 0,
+        }
+    return stats
+
+
+def reset_metrics():
+    with _lock:
+        _endpoints.clear()
+
+
+# ---------------------------------------------------------
+# SQLAlchemy hooks — only count work done inside a request
+# ---------------------------------------------------------
+def _tracker():
+    if has_request_context():
+        return g.get("_metrics")
+    return None
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_query(conn, cursor, statement, parameters, context, executemany):
+    if _tracker() is not None:
+        conn.info.setdefault("_metrics_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_query(conn, cursor, statement, parameters, context, executemany):
+    tracker = _tracker()
+    started = conn.info.get("_metrics_started")
+    if tracker is None or not started:
+        return
+
+    elapsed = time.perf_counter() - started.pop()
+    tracker["queries"] += 1
+    tracker["sql_seconds"] += elapsed
+    tracker["statements"][statement] += 1
+
+    if elapsed >= _settings["slow_query"]:
+        tracker["slow_queries"] += 1
+        print(f"[METRICS] 🐢 {elapsed * 1000:.0f} ms query on "
+              f"{request.endpoint}: {' '.join(statement.split())[:300]}")
+
+
+@event.listens_for(db.Model, "load", propagate=True)
+def _on_load(target, context):
+    tracker = _tracker()
+    if tracker is not None:
+        tracker["rows"] += 1
+
+
+# ---------------------------------------------------------
+# Request hooks
+# ---------------------------------------------------------
+def _start_request():
+    g._metrics = {
+        "started": time.perf_counter(),
+        "queries": 0,
+        "sql_seconds": 0.0,
+        "rows": 0,
+        "slow_queries": 0,
+        "statements": Counter(),
+    }
+
+
+def _remember_status(response):
+    g._metrics_status = response.status_code
+    return response
+
+
+def _finish_request(exc):
+    tracker = g.pop("_metrics", None)
+    if tracker is None:
+        return
+
+    elapsed = time.perf_counter() - tracker["started"]
+    endpoint = request.endpoint or "unmatched"
+    status = g.pop("_metrics_status", 500)
+
+    n_plus_one = tracker["queries"] > _settings["n_plus_one"]
+    if n_plus_one:
+        statement, repeats = tracker["statements"].most_common(1)[0]
+        print(f"[METRICS] ⚠️ {endpoint}: {tracker['queries']} queries in one request "
+              f"(possible N+1; ran {repeats}x: {' '.join(statement.split())[:200]})")
+
+    with _lock:
+        stats = _endpoint_stats(endpoint)
+        stats["status"][status] += 1
+        stats["count"] += 1
+        stats["seconds"] += elapsed
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if elapsed <= bound:
+                stats["buckets"][i] += 1
+        stats["queries"] += tracker["queries"]
+        stats["sql_seconds"] += tracker["sql_seconds"]
+        stats["rows"] += tracker["rows"]
+        stats["slow_queries"] += tracker["slow_queries"]
+        stats["n_plus_one"] += n_plus_one
+
+
+# =========================================================
+# PROMETHEUS TEXT FORMAT
+# =========================================================
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def render_metrics():
+    with _lock:
+        snapshot = {
+            ep: dict(s, status=Counter(s["status"]), buckets=list(s["buckets"]))
+            for ep, s in _endpoints.items()
+        }
+
+    lines = []
+
+    def family(name, kind, help_text):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    family("kapsul_http_requests_total", "counter", "Requests handled, by endpoint and status.")
+    for ep, s in sorted(snapshot.items()):
+        for status, n in sorted(s["status"].items()):
+            lines.append(f'kapsul_http_requests_total{{endpoint="{_label(ep)}",status="{status}"}} {n}')
+
+    family("kapsul_http_request_duration_seconds", "histogram", "Request wall time.")
+    for ep, s in sorted(snapshot.items()):
+        ep = _label(ep)
+        for bound, n in zip(LATENCY_BUCKETS, s["buckets"]):
+            lines.append(f'kapsul_http_request_duration_seconds_bucket{{endpoint="{ep}",le="{bound}"}} {n}')
+        lines.append(f'kapsul_http_request_duration_seconds_bucket{{endpoint="{ep}",le="+Inf"}} {s["count"]}')
+        lines.append(f'kapsul_http_request_duration_seconds_sum{{endpoint="{ep}"}} {s["seconds"]:.6f}')
+        lines.append(f'kapsul_http_request_duration_seconds_count{{endpoint="{ep}"}} {s["count"]}')
+
+    for name, key, kind, help_text, fmt in (
+        ("kapsul_db_queries_total", "queries", "counter", "SQL statements executed.", "{}"),
+        ("kapsul_db_query_seconds_total", "sql_seconds", "counter", "Time spent in SQL.", "{:.6f}"),
+        ("kapsul_db_rows_loaded_total", "rows", "counter", "ORM rows loaded.", "{}"),
+        ("kapsul_db_slow_queries_total", "slow_queries", "counter", "Queries over the slow threshold.", "{}"),
+        ("kapsul_db_n_plus_one_requests_total", "n_plus_one", "counter",
+         "Requests over the per-request query threshold.", "{}"),
+    ):
+        family(name, kind, help_text)
+        for ep, s in sorted(snapshot.items()):
+            lines.append(f'{name}{{endpoint="{_label(ep)}"}} ' + fmt.format(s[key]))
+
+    for collect in _collectors:
+        lines.extend(collect())
+
+    return "\n".join(lines) + "\n"
+
+
+def register_collector(fn):
+    if fn not in _collectors:
+        _collectors.append(fn)
+
+
+def metrics_view():
+    from flask import current_app
+
+    token = current_app.config.get("METRICS_TOKEN")
+    if token:
+        given = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+        if given != token:
+            abort(403)
+    elif request.remote_addr not in ("127.0.0.1", "::1"):
+        # No token configured → only a local scraper
+        abort(403)
+
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+def configure_metrics(app):
+    if not app.config.get("METRICS_ENABLED", True):
+        return
+
+    _settings["slow_query"] = app.config["METRICS_SLOW_QUERY_MS"] / 1000
+    _settings["n_plus_one"] = app.config["METRICS_N_PLUS_ONE"]
+
+    app.before_request(_start_request)
+    app.after_request(_remember_status)
+    app.teardown_request(_finish_request)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
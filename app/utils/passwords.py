@@ -0,0 +1,107 @@
+# app/utils/passwords.py
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from werkzeug.security import (
+    DEFAULT_PBKDF2_ITERATIONS,
+    check_password_hash,
+    generate_password_hash,
+)
+
+
+# ---------------------------------------------------------
+# Password hashing is CPU-bound (hundreds of ms per call).
+# It runs on a small bounded pool so a login burst can't
+# occupy every worker and starve the device API.
+# ---------------------------------------------------------
+class HashingBusy(Exception):
+    """Raised when too many hash operations are already in flight."""
+
+
+_executor = None
+_slots = None
+_method = None
+_timeout = None
+_async_mode = "threading"
+
+
+def configure_password_hashing(app, async_mode="threading"):
+    global _executor, _slots, _method, _timeout, _async_mode
+
+    _executor = ThreadPoolExecutor(
+        max_workers=app.config["PASSWORD_HASH_WORKERS"],
+        thread_name_prefix="pwhash"
+    )
+    _slots = threading.BoundedSemaphore(app.config["PASSWORD_HASH_MAX_PENDING"])
+    _method = normalize_method(app.config["PASSWORD_HASH_METHOD"])
+    _timeout = app.config["PASSWORD_HASH_TIMEOUT"]
+    _async_mode = async_mode
+
+
+def _offload(fn, *args):
+    if not _slots.acquire(blocking=False):
+        raise HashingBusy()
+
+    # Under green-thread servers a plain thread pool would be
+    # monkey-patched too, so use the hub's real OS thread pool.
+    if _async_mode in ("eventlet", "gevent"):
+        try:
+            if _async_mode == "eventlet":
+                from eventlet import tpool
+                return tpool.execute(fn, *args)
+
+            import gevent
+            return gevent.get_hub().threadpool.apply(fn, args)
+        finally:
+            _slots.release()
+
+    try:
+        future = _executor.submit(fn, *args)
+    except Exception:
+        _slots.release()
+        raise
+
+    # The slot stays taken until the hash really finishes, even if
+    # the request stops waiting for it
+    future.add_done_callback(lambda _: _slots.release())
+    try:
+        return future.result(timeout=_timeout)
+    except FutureTimeout:
+        raise HashingBusy() from None
+
+
+def normalize_method(method):
+    """
+    Spell METHOD the way werkzeug writes it into a hash, with its
+    defaults filled in ("scrypt" → "scrypt:32768:8:1",
+    "pbkdf2:sha256" → "pbkdf2:sha256:<default iterations>").
+    """
+    name, *args = method.split(":")
+    if name == "scrypt" and not args:
+        return "scrypt:32768:8:1"
+    if name == "pbkdf2":
+        if not args:
+            args = ["sha256"]
+        if len(args) == 1:
+            args.append(str(DEFAULT_PBKDF2_ITERATIONS))
+    return ":".join([name, *args])
+
+
+# =========================================================
+# PUBLIC API
+# =========================================================
+def hash_password(password):
+    return _offload(generate_password_hash, password, _method)
+
+
+def verify_password(pw_hash, password):
+    return _offload(check_password_hash, pw_hash, password)
+
+
+def needs_rehash(pw_hash):
+    """
+    True if the stored hash was made with different parameters
+    than PASSWORD_HASH_METHOD (e.g. after raising the iteration count).
+    """
+    return normalize_method(pw_hash.split("$", 1)[0]) != _method
@@ -0,0 +1,130 @@
+# app/utils/pregen.py
+
+import threading
+import time
+
+
+# =========================================================
+# DEBOUNCED AUDIO PRE-GENERATION
+# =========================================================
+# Without this, a patient's pack is built the first time the device
+# (or the device page) asks for the manifest after an edit, so that
+# sync waits on TTS. Routes that change what the device says call
+# schedule_pregen() right after committing; the pack is then built in
+# the background while the device is still waiting for its next
+# heartbeat to notice data_dirty.
+#
+# Jobs are keyed by (patient, language). Every call restarts the
+# key's timer, so saving eight compartments in a row builds once,
+# AUDIO_PREGEN_DELAY seconds after the last save. A build that is
+# already running is left alone; an edit during it schedules one more.
+#
+# A build refreshes the device's stored sync snapshot (sync_snapshot),
+# which builds the pack as a side effect.
+#
+# Device downloads that find a stale snapshot call request_pregen()
+# instead: it starts a build right away unless one is already
+# scheduled, and never pushes a pending one back (devices poll).
+#
+# Timers live in the worker that handled the edit. Building twice is
+# harmless anyway: packs are versioned and serialized per patient
+# (audio_packs), so a second build of the same plan is a no-op.
+
+_app = None
+_delay = 0.0
+_timers = {}
+_lock = threading.Lock()
+_stats = {"scheduled": 0, "coalesced": 0, "built": 0, "skipped": 0, "failed": 0}
+
+
+def configure_pregen(app):
+    global _app, _delay
+    if not app.config["AUDIO_PREGEN_ENABLED"]:
+        return
+    _app = app
+    _delay = app.config["AUDIO_PREGEN_DELAY"]
+
+
+def schedule_pregen(patient_id, language):
+    """Build the patient's LANGUAGE pack once edits have been quiet for a while."""
+    return _schedule(patient_id, language, _delay, restart=True)
+
+
+def request_pregen(patient_id, language):
+    """
+    Make sure a build is on its way: now, unless one is already
+    scheduled. False if pre-generation is off (the caller builds).
+    """
+    return _schedule(patient_id, language, 0, restart=False)
+
+
+def _schedule(patient_id, language, delay, restart):
+    if _app is None:
+        return False
+
+    from app.utils.device_sync import normalize_lang
+    key = (patient_id, normalize_lang(language or "en"))
+
+    with _lock:
+        previous = _timers.get(key)
+        if previous is not None:
+            if not restart:
+                return True
+            previous.cancel()
+            _stats["coalesced"] += 1
+
+        timer = threading.Timer(delay, _run, args=(key,))
+        timer.daemon = True
+        _timers[key] = timer
+        _stats["scheduled"] += 1
+        timer.start()
+    return True
+
+
+def _run(key):
+    with _lock:
+        if _timers.get(key) is not threading.current_thread():
+            return          # superseded between firing and here
+        del _timers[key]
+
+    patient_id, lang = key
+    with _app.app_context():
+        from app.extensions import db
+        from app.models import User
+        from app.utils.device_sync import normalize_lang
+        from app.utils.sync_snapshot import refresh_snapshot
+
+        try:
+            user = db.session.get(User, patient_id)
+            device = user.devices[0] if user and user.devices else None
+
+            # Language changed again since scheduling: that edit has
+            # its own job for the new language
+            if device is None or normalize_lang(device.language or "en") != lang:
+                with _lock:
+                    _stats["skipped"] += 1
+                return
+
+            started = time.perf_counter()
+            snapshot = refresh_snapshot(device)
+            print(f"[AUDIO] 🔊 pre-generated user {patient_id} ({lang}) pack "
+                  f"{snapshot.manifest['pack']} in {time.perf_counter() - started:.2f}s")
+            with _lock:
+                _stats["built"] += 1
+
+        except Exception as e:
+            print(f"[AUDIO] ⚠️ pre-generation failed for user {patient_id} ({lang}): {e}")
+            with _lock:
+                _stats["failed"] += 1
+        finally:
+            db.session.remove()
+
+
+def pending_pregen():
+    with _lock:
+        return sorted(_timers)
+
+
+def pregen_stats():
+    with _lock:
+        return dict(_stats, pending=len(_timers))
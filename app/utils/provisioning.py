@@ -0,0 +1,228 @@
+# app/utils/provisioning.py
+
+import csv
+import io
+import json
+import re
+from datetime import datetime
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+from app.extensions import db
+from app.models import User, Device
+
+
+# =========================================================
+# BULK DEVICE PROVISIONING
+# =========================================================
+# Used by POST /admin/devices/import and `flask provision-devices`.
+#
+# Input rows (CSV with a header, or a JSON list of objects):
+#   device_code          required, unique, [A-Za-z0-9_-], ≤ 50 chars
+#   owner                optional patient id or username
+#   total_compartments   optional, 1–12 (default 8)
+#   language             optional (default "en")
+#
+# Every row is validated before anything is written, with one query
+# per lookup (existing codes, owners, owners' devices) instead of one
+# per row. Valid rows are then inserted in BATCH_SIZE chunks in a
+# single transaction. The report lists each row's outcome.
+
+BATCH_SIZE = 1000
+LOOKUP_CHUNK = 500          # stays under SQLite's bound-parameter limit
+MAX_COMPARTMENTS = 12
+
+CODE_RE = re.compile(r"^[A-Za-z0-9_-]{1,50}$")
+
+
+class ProvisioningError(ValueError):
+    """The upload itself could not be read (bad format / header)."""
+
+
+def parse_rows(data, fmt=None):
+    """
+    data: str or bytes; fmt: "csv" / "json" (guessed from content if None).
+    Returns a list of dicts.
+    """
+    if isinstance(data, bytes):
+        data = data.decode("utf-8-sig")
+    data = data.strip()
+    if not data:
+        raise ProvisioningError("Empty upload.")
+
+    fmt = (fmt or ("json" if data[0] in "[{" else "csv")).lower()
+
+    if fmt == "json":
+        try:
+            rows = json.loads(data)
+        except ValueError as e:
+            raise ProvisioningError(f"Invalid JSON: {e}")
+        if isinstance(rows, dict):
+            rows = rows.get("devices", [])
+        if not isinstance(rows, list) or not all(isinstance(r, dict) for r in rows):
+            raise ProvisioningError("JSON must be a list of device objects.")
+        return rows
+
+    if fmt == "csv":
+        reader = csv.DictReader(io.StringIO(data))
+        header = [h.strip().lower() for h in (reader.fieldnames or [])]
+        if "device_code" not in header:
+            raise ProvisioningError("CSV header must include device_code.")
+        reader.fieldnames = header
+        return list(reader)
+
+    raise ProvisioningError(f"Unsupported format: {fmt}")
+
+
+def _chunks(values, size=LOOKUP_CHUNK):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def _lookup_owners(refs):
+    """refs: set of owner strings → {ref: (patient_id or None, role)}."""
+    ids = {r for r in refs if r.isdigit()}
+    names = refs - ids
+
+    found = {}
+    for chunk in _chunks(ids):
+        for uid, role in db.session.query(User.id, User.role).filter(
+            User.id.in_([int(i) for i in chunk])
+        ):
+            found[str(uid)] = (uid, role)
+    for chunk in _chunks(names):
+        for uid, username, role in db.session.query(User.id, User.username, User.role).filter(
+            User.username.in_(chunk)
+        ):
+            found[username] = (uid, role)
+    return found
+
+
+def validate_rows(rows):
+    """
+    One pass over the upload. Returns (report, to_insert) where report
+    has one entry per input row and to_insert holds the valid rows.
+    """
+    from app.utils.device_sync import SUPPORTED_LANGS
+
+    def clean(row, key):
+        value = row.get(key)
+        return "" if value is None else str(value).strip()
+
+    report, parsed = [], []
+    seen_codes = {}
+
+    for n, row in enumerate(rows, start=1):
+        entry = {"row": n, "device_code": clean(row, "device_code"), "status": "ok", "errors": []}
+        report.append(entry)
+        code = entry["device_code"]
+
+        if not CODE_RE.match(code):
+            entry["errors"].append("device_code must be 1–50 letters, digits, '-' or '_'")
+        elif code in seen_codes:
+            entry["status"] = "duplicate"
+            entry["errors"].append(f"repeats row {seen_codes[code]}")
+        else:
+            seen_codes[code] = n
+
+        compartments = clean(row, "total_compartments") or "8"
+        if not compartments.isdigit() or not 1 <= int(compartments) <= MAX_COMPARTMENTS:
+            entry["errors"].append(f"total_compartments must be 1–{MAX_COMPARTMENTS}")
+
+        language = clean(row, "language").lower() or "en"
+        if language not in SUPPORTED_LANGS:
+            entry["errors"].append(f"unsupported language '{language}'")
+
+        parsed.append((entry, code, clean(row, "owner") or clean(row, "owner_id"),
+                       compartments, SUPPORTED_LANGS.get(language)))
+
+    # ---------------- set-based lookups ----------------
+    existing = set()
+    for chunk in _chunks(seen_codes):
+        existing.update(c for (c,) in db.session.query(Device.device_code).filter(
+            Device.device_code.in_(chunk)
+        ))
+
+    owners = _lookup_owners({ref for _, _, ref, _, _ in parsed if ref})
+
+    owner_ids = {o[0] for o in owners.values()}
+    has_device = {}
+    for chunk in _chunks(owner_ids):
+        for owner_id, code in db.session.query(Device.owner_id, Device.device_code).filter(
+            Device.owner_id.in_(chunk)
+        ):
+            has_device[owner_id] = code
+
+    # ---------------- second look at each row (no queries) ----------------
+    to_insert = []
+    claimed = {}
+    for entry, code, ref, compartments, language in parsed:
+        if code in existing and entry["status"] != "duplicate":
+            entry["status"] = "duplicate"
+            entry["errors"].append("device_code already registered")
+
+        owner_id = None
+        if ref:
+            owner = owners.get(ref)
+            if owner is None:
+                entry["errors"].append(f"owner '{ref}' not found")
+            elif owner[1] != "patient":
+                entry["errors"].append(f"owner '{ref}' is a {owner[1]}, not a patient")
+            elif owner[0] in has_device:
+                entry["errors"].append(f"owner '{ref}' already has device {has_device[owner[0]]}")
+            elif owner[0] in claimed:
+                entry["errors"].append(f"owner '{ref}' also assigned in row {claimed[owner[0]]}")
+            else:
+                owner_id = owner[0]
+                claimed[owner_id] = entry["row"]
+        entry["owner_id"] = owner_id
+
+        if entry["status"] == "ok" and entry["errors"]:
+            entry["status"] = "error"
+        if entry["status"] == "ok":
+            to_insert.append(dict(
+                device_code=code, owner_id=owner_id, total_compartments=int(compartments),
+                language=language, alarm_tone="default", data_dirty=True
+            ))
+
+    return report, to_insert
+
+
+def provision_devices(rows, dry_run=False):
+    """
+    Validate and insert. Nothing is written if dry_run.
+    Returns {"created", "duplicates", "errors", "rows": [...]}.
+    """
+    from app.utils.admin_stats import invalidate_growth
+
+    report, to_insert = validate_rows(rows)
+
+    if to_insert and not dry_run:
+        now = datetime.utcnow()
+        for row in to_insert:
+            row["created_at"] = now
+        try:
+            for i in range(0, len(to_insert), BATCH_SIZE):
+                db.session.execute(insert(Device), to_insert[i:i + BATCH_SIZE])
+            db.session.commit()
+        except IntegrityError:
+            # A device was added between validation and insert
+            db.session.rollback()
+            raise ProvisioningError("Devices changed during the import; nothing was added, retry.")
+        invalidate_growth()
+        print(f"[PROVISION] ✅ Added {len(to_insert)} devices")
+
+    for entry in report:
+        if entry["status"] == "ok":
+            entry["status"] = "valid" if dry_run else "created"
+
+    return {
+        "created": 0 if dry_run else len(to_insert),
+        "valid": len(to_insert),
+        "duplicates": sum(e["status"] == "duplicate" for e in report),
+        "errors": sum(e["status"] == "error" for e in report),
+        "dry_run": dry_run,
+        "rows": report,
+    }
@@ -0,0 +1,141 @@
+# app/utils/realtime.py
+
+from datetime import datetime, timedelta
+
+from app.extensions import db
+from app.models import Device, DoctorPatientLink
+
+
+# =========================================================
+# ROOM NAMES
+# =========================================================
+def user_room(user_id):
+    return f"user:{user_id}"
+
+
+def device_room(device_code):
+    return f"device:{device_code}"
+
+
+def doctor_room(doctor_id):
+    return f"doctor:{doctor_id}"
+
+
+ADMIN_ROOM = "admins"
+
+
+# =========================================================
+# EMIT HELPERS
+# =========================================================
+def linked_doctor_ids(patient_id):
+    rows = db.session.query(DoctorPatientLink.doctor_id).filter_by(
+        patient_id=patient_id, active=True
+    ).all()
+    return [r[0] for r in rows]
+
+
+def emit_to_patient(patient_id, event, data):
+    """Send to the patient's own sessions and every active linked doctor."""
+    from app import socketio
+
+    socketio.emit(event, data, to=user_room(patient_id))
+    for doc_id in linked_doctor_ids(patient_id):
+        socketio.emit(event, data, to=doctor_room(doc_id))
+
+
+def emit_device_event(device, event, data):
+    """Send to dashboards watching this device (owner + linked doctors)."""
+    from app import socketio
+
+    socketio.emit(event, data, to=device_room(device.device_code))
+    if device.owner_id:
+        for doc_id in linked_doctor_ids(device.owner_id):
+            socketio.emit(event, data, to=doctor_room(doc_id))
+
+
+# =========================================================
+# LIVE DASHBOARD EVENTS (small diffs, sent after commit)
+# =========================================================
+def _log_payload(log):
+    return {
+        "id": log.id,
+        "med_name": log.med_name,
+        "status": log.status,
+        "taken_time": log.taken_time.isoformat() if log.taken_time else None,
+        "delay": log.delay_minutes or 0,
+    }
+
+
+def _alert_payload(alert):
+    return {
+        "id": alert.id,
+        "title": alert.title,
+        "message": alert.message,
+        "created_at": alert.created_at.isoformat() if alert.created_at else None,
+    }
+
+
+def publish_new_logs(patient_id, logs):
+    if patient_id is None or not logs:
+        return
+    emit_to_patient(patient_id, "new_logs", {
+        "patient_id": patient_id,
+        "logs": [_log_payload(l) for l in logs],
+    })
+
+
+def publish_alerts(alerts):
+    """
+    Alerts are addressed to one user (patient or doctor).
+    Patient alerts also reach that patient's linked doctors.
+    The same alerts are queued for email / webhook delivery.
+    """
+    from app.utils.mailer import notify_alerts
+
+    notify_alerts(alerts)
+
+    by_user = {}
+    for a in alerts:
+        by_user.setdefault(a.user_id, []).append(_alert_payload(a))
+
+    for user_id, items in by_user.items():
+        emit_to_patient(user_id, "new_alert", {
+            "patient_id": user_id,
+            "alerts": items,
+        })
+
+
+def publish_device_status(device, online):
+    emit_device_event(device, "device_status", {
+        "device": device.device_code,
+        "patient_id": device.owner_id,
+        "online": online,
+    })
+
+
+# ---------------------------------------------------------
+# Offline transitions have no request to hang off, so a
+# background sweep reports heartbeats that just went stale.
+# Start it in ONE process only (run.py does this).
+# ---------------------------------------------------------
+def start_presence_watcher(app, interval=30):
+    from app import socketio
+
+    def sweep():
+        last_cutoff = datetime.utcnow() - timedelta(seconds=Device.ONLINE_SECONDS)
+        while True:
+            socketio.sleep(interval)
+            cutoff = datetime.utcnow() - timedelta(seconds=Device.ONLINE_SECONDS)
+
+            with app.app_context():
+                went_offline = Device.query.filter(
+                    Device.last_heartbeat > last_cutoff,
+                    Device.last_heartbeat <= cutoff
+                ).all()
+                for device in went_offline:
+                    publish_device_status(device, False)
+                db.session.remove()
+
+            last_cutoff = cutoff
+
+    return socketio.start_background_task(sweep)
@@ -0,0 +1,206 @@
+# app/utils/schedule_codec.py
+
+import struct
+from datetime import date, datetime, timedelta, timezone
+
+
+# =========================================================
+# COMPACT BINARY SCHEDULE (for the ESP32)
+# =========================================================
+# The JSON schedule repeats every key and spells times and dates as
+# strings, so the device needs a JSON parser and a heap to hold the
+# tree. A device that sends
+#
+#   Accept: application/vnd.kapsul.schedule.v1
+#
+# on download/schedule gets the same data as fixed-size little-endian
+# records it can read in place:
+#
+#   header      16 bytes  "<4sBBHHHI"
+#     magic        "KSCH"
+#     version      1
+#     flags        0 (reserved)
+#     med_count
+#     dose_count
+#     strings_len  bytes in the string table
+#     timestamp    unix seconds, UTC
+#
+#   medication  12 bytes × med_count  "<IHHBBBB"
+#     id, name (string offset), expiry (days since 2000-01-01,
+#     0xFFFF = none), compartment (0 = none), flags (bit 0 critical),
+#     dose_count, reserved
+#
+#   dosage      12 bytes × dose_count  "<IHHHH"
+#     id, start, end (minutes after midnight), food, remark
+#     (string offsets, 0xFFFF = none). Doses follow their medication's
+#     order: the first med_0.dose_count belong to med 0, and so on.
+#
+#   strings     UTF-8, NUL-terminated, each distinct string stored once
+#
+# A new layout gets a new version number and media type; old devices
+# keep asking for (and getting) the one they know.
+
+MIMETYPE = "application/vnd.kapsul.schedule.v1"
+VERSION = 1
+MAGIC = b"KSCH"
+
+HEADER = struct.Struct("<4sBBHHHI")
+MEDICATION = struct.Struct("<IHHBBBB")
+DOSAGE = struct.Struct("<IHHHH")
+
+NONE = 0xFFFF
+EPOCH = date(2000, 1, 1)
+CRITICAL = 0x01
+
+
+class ScheduleFormatError(ValueError):
+    pass
+
+
+# ---------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------
+def _checked(value, low, high, what):
+    """VALUE if it fits the field, else ScheduleFormatError (not struct.error)."""
+    if not low <= value <= high:
+        raise ScheduleFormatError(f"{what} {value} does not fit the binary layout ({low}..{high})")
+    return value
+
+
+def _minutes(hhmm):
+    hours, minutes = hhmm.split(":")
+    return _checked(int(hours) * 60 + int(minutes), 0, 24 * 60 - 1, "Time of day")
+
+
+def _hhmm(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+class _Strings:
+    def __init__(self):
+        self.offsets = {}
+        self.data = bytearray()
+
+    def add(self, text):
+        if text is None:
+            return NONE
+        if text not in self.offsets:
+            if len(self.data) >= NONE:
+                raise ScheduleFormatError("String table is full")
+            self.offsets[text] = len(self.data)
+            self.data += text.encode() + b"\0"
+        return self.offsets[text]
+
+
+# ---------------------------------------------------------
+# Encode
+# ---------------------------------------------------------
+def encode_schedule(payload):
+    """
+    build_schedule_json()["schedule"] → bytes. Raises ScheduleFormatError
+    for data the layout can't carry (e.g. an expiry before 2000).
+    """
+    strings = _Strings()
+    meds = bytearray()
+    doses = bytearray()
+    dose_count = 0
+
+    for m in payload["schedule"]:
+        if len(m["dosages"]) > 255:
+            raise ScheduleFormatError(f"Too many dosages for medication {m['id']}")
+
+        expiry = NONE
+        if m["expiry"]:
+            expiry = _checked((date.fromisoformat(m["expiry"]) - EPOCH).days,
+                              0, NONE - 1, f"Expiry (days since {EPOCH}) of medication {m['id']}")
+
+        meds += MEDICATION.pack(
+            _checked(m["id"], 0, 0xFFFFFFFF, "Medication id"),
+            strings.add(m["name"]), expiry,
+            _checked(m["compartment"] or 0, 0, 0xFF, f"Compartment of medication {m['id']}"),
+            CRITICAL if m["critical"] else 0,
+            len(m["dosages"]), 0,
+        )
+
+        for d in m["dosages"]:
+            doses += DOSAGE.pack(
+                _checked(d["id"], 0, 0xFFFFFFFF, "Dosage id"),
+                _minutes(d["start"]), _minutes(d["end"]),
+                strings.add(d["food"]), strings.add(d["remark"]),
+            )
+            dose_count += 1
+
+    timestamp = 0
+    if payload.get("timestamp"):
+        # Payload timestamps are naive UTC (datetime.utcnow())
+        stamp = datetime.fromisoformat(payload["timestamp"]).replace(tzinfo=timezone.utc)
+        timestamp = _checked(int(stamp.timestamp()), 0, 0xFFFFFFFF, "Timestamp")
+    if len(strings.data) > NONE:
+        raise ScheduleFormatError("String table is full")
+
+    header = HEADER.pack(MAGIC, VERSION, 0,
+                         _checked(len(payload["schedule"]), 0, 0xFFFF, "Medication count"),
+                         _checked(dose_count, 0, 0xFFFF, "Dosage count"),
+                         len(strings.data), timestamp)
+    return header + bytes(meds) + bytes(doses) + bytes(strings.data)
+
+
+# ---------------------------------------------------------
+# Decode (reference implementation of the device side)
+# ---------------------------------------------------------
+def decode_schedule(data):
+    """bytes → the JSON schedule payload (timestamp to the second)."""
+    if len(data) < HEADER.size:
+        raise ScheduleFormatError("Truncated header")
+
+    magic, version, _, med_count, dose_count, strings_len, timestamp = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ScheduleFormatError("Not a schedule")
+    if version != VERSION:
+        raise ScheduleFormatError(f"Unsupported schedule version {version}")
+
+    med_at = HEADER.size
+    dose_at = med_at + med_count * MEDICATION.size
+    strings_at = dose_at + dose_count * DOSAGE.size
+    if len(data) < strings_at + strings_len:
+        raise ScheduleFormatError("Truncated body")
+    table = data[strings_at:strings_at + strings_len]
+
+    def string(offset):
+        if offset == NONE:
+            return None
+        return table[offset:table.index(b"\0", offset)].decode()
+
+    schedule = []
+    for i in range(med_count):
+        med_id, name, expiry, compartment, flags, count, _ = \
+            MEDICATION.unpack_from(data, med_at + i * MEDICATION.size)
+
+        dosages = []
+        for _ in range(count):
+            dose_id, start, end, food, remark = DOSAGE.unpack_from(data, dose_at)
+            dose_at += DOSAGE.size
+            dosages.append({
+                "id": dose_id,
+                "start": _hhmm(start),
+                "end": _hhmm(end),
+                "food": string(food),
+                "remark": string(remark),
+            })
+
+        schedule.append({
+            "id": med_id,
+            "name": string(name),
+            "critical": bool(flags & CRITICAL),
+            "compartment": compartment or None,
+            "expiry": (EPOCH + timedelta(days=expiry)).isoformat() if expiry != NONE else None,
+            "dosages": dosages,
+        })
+
+    return {
+        "schedule": schedule,
+        "timestamp": (
+            datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None).isoformat()
+            if timestamp else None
+        ),
+    }
@@ -0,0 +1,86 @@
+# app/utils/schema.py
+
+from sqlalchemy import inspect, text
+
+from app.extensions import db
+
+
+# =========================================================
+# LIGHTWEIGHT SCHEMA UPKEEP
+# =========================================================
+# db.create_all() only creates missing tables. Existing SQLite
+# databases also need new nullable columns and new indexes added,
+# which is all this does — there is no migration framework here.
+
+def add_missing_columns():
+    engine = db.engine
+    insp = inspect(engine)
+    existing_tables = set(insp.get_table_names())
+
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+
+        present = {c["name"] for c in insp.get_columns(table.name)}
+
+        for col in table.columns:
+            if col.name in present:
+                continue
+
+            if not col.nullable and col.server_default is None:
+                print(f"[SCHEMA] ⚠️ Cannot add NOT NULL column {table.name}.{col.name}")
+                continue
+
+            col_type = col.type.compile(dialect=engine.dialect)
+            with engine.begin() as conn:
+                conn.execute(text(
+                    f'ALTER TABLE "{table.name}" ADD COLUMN "{col.name}" {col_type}'
+                ))
+            print(f"[SCHEMA] ➕ Added column {table.name}.{col.name}")
+
+
+# Unique indexes added to tables that may already hold duplicates:
+# table → key columns. The newest row (highest id) per key is kept.
+UNIQUE_KEYS = {
+    "device_state": ["device_id"],
+}
+
+
+def drop_duplicate_rows():
+    engine = db.engine
+    existing_tables = set(inspect(engine).get_table_names())
+
+    for table, keys in UNIQUE_KEYS.items():
+        if table not in existing_tables:
+            continue
+
+        cols = ", ".join(f'"{k}"' for k in keys)
+        present = " AND ".join(f'"{k}" IS NOT NULL' for k in keys)
+        with engine.begin() as conn:
+            deleted = conn.execute(text(
+                f'DELETE FROM "{table}" WHERE {present} AND id NOT IN '
+                f'(SELECT MAX(id) FROM "{table}" WHERE {present} GROUP BY {cols})'
+            )).rowcount
+        if deleted:
+            print(f"[SCHEMA] 🧹 Removed {deleted} duplicate row(s) from {table}")
+
+
+def create_missing_indexes():
+    engine = db.engine
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def ensure_schema():
+    """
+    Bring an existing database up to the current models.
+    Safe to call repeatedly.
+    """
+    from app.utils.log_search import ensure_log_fts
+
+    db.create_all()
+    add_missing_columns()
+    drop_duplicate_rows()
+    create_missing_indexes()
+    ensure_log_fts()
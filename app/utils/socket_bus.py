@@ -0,0 +1,140 @@
+# app/utils/socket_bus.py
+
+import hmac
+import json
+import os
+import socket
+import threading
+import time
+from urllib.parse import urlparse
+
+from socketio import PubSubManager
+
+
+# =========================================================
+# INTER-WORKER MESSAGE BUS FOR SOCKET.IO
+# =========================================================
+# SOCKETIO_MESSAGE_QUEUE selects the backend:
+#   (unset)                  → in-process (single worker only)
+#   local://127.0.0.1:5099   → the tiny broker below (no extra services)
+#   redis://… / amqp://…     → handed to Flask-SocketIO as message_queue
+#
+# Every worker publishes emits to the bus and replays emits from the
+# other workers, so an event raised anywhere reaches the right room.
+
+def socketio_bus_options(config):
+    url = config.get("SOCKETIO_MESSAGE_QUEUE")
+    if not url:
+        return {}
+
+    if url.startswith("local://"):
+        return {"client_manager": LocalBrokerManager(url, key=config["SOCKETIO_BROKER_KEY"])}
+
+    return {"message_queue": url}
+
+
+def _parse(url):
+    parsed = urlparse(url)
+    return parsed.hostname or "127.0.0.1", parsed.port or 5099
+
+
+# ---------------------------------------------------------
+# Client side — one per worker
+# ---------------------------------------------------------
+class LocalBrokerManager(PubSubManager):
+    """
+    Newline-delimited JSON over a plain TCP socket to the local broker.
+    Plain sockets are used (not multiprocessing) so eventlet/gevent
+    monkey-patching keeps the listener cooperative.
+    """
+    name = "local"
+
+    def __init__(self, url, key, channel="socketio", write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.host, self.port = _parse(url)
+        self.key = key
+        self._pub = None
+        self._pub_lock = threading.Lock()
+
+    def _connect(self, role):
+        sock = socket.create_connection((self.host, self.port))
+        sock.sendall(f"{role} {self.key}\n".encode())
+        return sock
+
+    def _publish(self, data):
+        line = (json.dumps(data) + "\n").encode()
+        with self._pub_lock:
+            for attempt in range(2):
+                try:
+                    if self._pub is None:
+                        self._pub = self._connect("pub")
+                    self._pub.sendall(line)
+                    return
+                except OSError:
+                    self._pub = None
+                    if attempt:
+                        self._get_logger().error("local broker unreachable, event dropped")
+
+    def _listen(self):
+        while True:
+            try:
+                sock = self._connect("sub")
+                with sock.makefile("rb") as stream:
+                    for line in stream:
+                        yield line.decode()
+            except OSError:
+                self._get_logger().warning("local broker connection lost, retrying")
+            time.sleep(1)
+
+
+# ---------------------------------------------------------
+# Broker — run once per host:  python -m app.utils.socket_bus
+# ---------------------------------------------------------
+def run_broker(host="127.0.0.1", port=5099, key=""):
+    # subscriber socket -> its write lock: publishers each run in their
+    # own thread, and a backpressured sendall writes in pieces, so two
+    # lines sent at once would interleave without it
+    subscribers = {}
+    lock = threading.Lock()
+
+    def serve(conn):
+        stream = conn.makefile("rb")
+        try:
+            role, _, given = stream.readline().strip().partition(b" ")
+            if not hmac.compare_digest(given, key.encode()):
+                return
+
+            # Publishers never read, so only "sub" connections get fan-out
+            if role == b"sub":
+                with lock:
+                    subscribers[conn] = threading.Lock()
+
+            for line in stream:
+                with lock:
+                    targets = list(subscribers.items())
+                for s, write_lock in targets:
+                    try:
+                        with write_lock:
+                            s.sendall(line)
+                    except OSError:
+                        with lock:
+                            subscribers.pop(s, None)
+        finally:
+            with lock:
+                subscribers.pop(conn, None)
+            conn.close()
+
+    server = socket.create_server((host, port))
+    print(f"[BUS] 📡 Socket.IO broker listening on {host}:{port}")
+
+    while True:
+        conn, _ = server.accept()
+        threading.Thread(target=serve, args=(conn,), daemon=True).start()
+
+
+if __name__ == "__main__":
+    from app.config import Config
+
+    url = os.environ.get("SOCKETIO_MESSAGE_QUEUE") or "local://127.0.0.1:5099"
+    bind_host, bind_port = _parse(url)
+    run_broker(bind_host, bind_port, Config.SOCKETIO_BROKER_KEY)
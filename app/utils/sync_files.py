@@ -0,0 +1,186 @@
+# app/utils/sync_files.py
+
+import gzip
+import hashlib
+import hmac
+import os
+import time
+
+from flask import current_app, send_file, url_for
+from werkzeug.utils import secure_filename
+
+
+# =========================================================
+# SYNC BUNDLES AS STATIC FILES
+# =========================================================
+# Every time a device's snapshot is rebuilt (sync_snapshot), its
+# bundle is written to
+#
+#   SYNC_FILE_DIR/<device_code>/bundle.<codec>.<version>.json     (+ .json.gz)
+#
+# with tmp + os.replace, and the previous version's files are removed.
+# A dirty device's heartbeat carries a signed, expiring URL naming the
+# content version it was issued for (only while the snapshot is
+# current):
+#
+#   /api/device/sync_file/<device_code>?v=…&expires=…&sig=…
+#
+# so a link always serves exactly that version; once the data has
+# moved on, the old file is gone and the link answers 410 (heartbeat
+# again). Checking the URL is one HMAC, with no DB query. The file itself is
+# then handed to the front server (SYNC_FILE_SERVING):
+#
+#   x-accel     nginx: X-Accel-Redirect to SYNC_FILE_ACCEL_PREFIX, e.g.
+#                 location /_sync_data/ { internal; alias …/sync_data/; gzip_static on; }
+#   x-sendfile  Apache mod_xsendfile / lighttpd: X-Sendfile with the path
+#   send_file   the WSGI server's file wrapper (sendfile() where supported)
+#
+# SYNC_FILE_DIR is deliberately not under app/static: Flask serves that
+# directory to anyone, which would bypass the signature.
+#
+# A static file can't be reordered for the device's clock, so its
+# "files" list is in order from midnight; every dosage clip carries its
+# window, and firmware that cares rotates it. The sync_token inside
+# still lets sync_done spot a bundle that went stale mid-download.
+
+PREFIX = "bundle."
+SUFFIX = ".json"
+
+
+def _folder(device_code):
+    # Device codes are plain IDs; anything else keeps the dynamic route
+    if not device_code or secure_filename(device_code) != device_code:
+        return None
+    return os.path.join(current_app.config["SYNC_FILE_DIR"], device_code)
+
+
+def bundle_file(device_code, codec, version):
+    folder = _folder(device_code)
+    return os.path.join(folder, f"{PREFIX}{codec}.{version}{SUFFIX}") if folder else None
+
+
+def _write_atomic(path, data):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def written_codecs(device_code):
+    folder = _folder(device_code)
+    if not folder or not os.path.isdir(folder):
+        return set()
+    return {
+        name[len(PREFIX):-len(SUFFIX)].split(".")[0]
+        for name in os.listdir(folder)
+        if name.startswith(PREFIX) and name.endswith(SUFFIX)
+    }
+
+
+def _remove_other_versions(folder, version):
+    keep = (f".{version}{SUFFIX}", f".{version}{SUFFIX}.gz")
+    for name in os.listdir(folder):
+        if name.startswith(PREFIX) and not name.endswith(keep) and not name.endswith(".tmp"):
+            try:
+                os.remove(os.path.join(folder, name))
+            except FileNotFoundError:
+                pass
+
+
+def write_bundle_files(device, snapshot, codecs=None):
+    """
+    Materialize DEVICE's bundle for CODECS (default: pcm16 plus every
+    variant already on disk) at the snapshot's version. A full write
+    removes the older versions' files.
+    """
+    from app.utils.audio_codecs import PCM16
+    from app.utils.sync_snapshot import bundle_body
+
+    folder = _folder(device.device_code)
+    if folder is None:
+        return []
+
+    os.makedirs(folder, exist_ok=True)
+    full = codecs is None
+    if full:
+        codecs = written_codecs(device.device_code) | {PCM16}
+
+    written = []
+    for codec in sorted(codecs):
+        body = bundle_body(device, snapshot, codec, 0, hold=False)
+        path = bundle_file(device.device_code, codec, snapshot.content_version)
+        _write_atomic(path + ".gz", gzip.compress(body, compresslevel=9))
+        _write_atomic(path, body)
+        written.append(path)
+
+    if full:
+        _remove_other_versions(folder, snapshot.content_version)
+    return written
+
+
+# ---------------------------------------------------------
+# Signed URLs
+# ---------------------------------------------------------
+def _signature(device_code, version, expires):
+    key = current_app.config["SECRET_KEY"].encode()
+    msg = f"sync-file:{device_code}:{version}:{expires}".encode()
+    return hmac.new(key, msg, hashlib.sha256).hexdigest()[:32]
+
+
+def signed_bundle_url(device_code, version):
+    expires = int(time.time()) + current_app.config["SYNC_URL_TTL"]
+    return url_for("device_api.download_sync_file", device_code=device_code, v=version,
+                   expires=expires, sig=_signature(device_code, version, expires))
+
+
+def verify_bundle_url(device_code, version, expires, sig):
+    try:
+        expires = int(expires)
+    except (TypeError, ValueError):
+        return False
+    if expires < time.time() or not version or not version.isalnum():
+        return False
+    return hmac.compare_digest(_signature(device_code, version, expires), sig or "")
+
+
+# ---------------------------------------------------------
+# Serving
+# ---------------------------------------------------------
+def send_bundle_file(path, accepts_gzip):
+    """
+    Response for a bundle file, or None if it is gone: a rebuild can
+    remove the version between the caller's check and here, which
+    the route answers like any replaced link.
+    """
+    mode = current_app.config["SYNC_FILE_SERVING"]
+    folder = current_app.config["SYNC_FILE_DIR"]
+
+    if mode == "x-accel":
+        # nginx picks the .gz itself (gzip_static)
+        if not os.path.isfile(path):
+            return None
+        rel = os.path.relpath(path, folder).replace(os.sep, "/")
+        response = current_app.response_class(mimetype="application/json")
+        response.headers["X-Accel-Redirect"] = current_app.config["SYNC_FILE_ACCEL_PREFIX"] + rel
+        return response
+
+    gz = accepts_gzip and os.path.isfile(path + ".gz")
+    target = path + ".gz" if gz else path
+
+    try:
+        if mode == "x-sendfile":
+            if not os.path.isfile(target):
+                return None
+            response = current_app.response_class(mimetype="application/json")
+            response.headers["X-Sendfile"] = os.path.abspath(target)
+        else:
+            # Opened here, so a removal after this point can't hurt
+            response = send_file(os.path.abspath(target), mimetype="application/json",
+                                 conditional=True, max_age=0)
+    except FileNotFoundError:
+        return None
+
+    if gz:
+        response.headers["Content-Encoding"] = "gzip"
+    response.vary.add("Accept-Encoding")
+    return response
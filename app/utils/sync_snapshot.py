@@ -0,0 +1,247 @@
+# app/utils/sync_snapshot.py
+
+import hashlib
+import json
+import os
+from datetime import datetime
+
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeSerializer
+from sqlalchemy.exc import IntegrityError
+
+from app.extensions import db
+from app.models import Dosage, DeviceSyncSnapshot, Medication
+from app.utils.device_sync import (
+    BASE_AUDIO_DIR,
+    build_audio_manifest_cached,
+    build_config_json,
+    build_schedule_json,
+    encode_manifest,
+    normalize_lang,
+)
+
+
+# =========================================================
+# STORED SYNC PAYLOADS (one row per device)
+# =========================================================
+# Config, schedule and audio manifest are built once per change and
+# kept in device_sync_snapshot together with the content version they
+# were built from. The content version hashes the device, medication
+# and dosage rows behind the payloads — two small queries, no audio
+# work — so anyone can tell whether the stored snapshot is current.
+#
+# Only the pre-generation job (pregen) rebuilds a snapshot, after an
+# edit. A device download that finds it out of date is still served
+# the stored one (flagged served_stale) and asks pregen for a rebuild;
+# sync_done then keeps the device dirty, so it syncs again and picks
+# up the new one.
+# Only a device with no snapshot yet, or with pre-generation off,
+# waits for an inline build. Each rebuild also rewrites the device's
+# static bundle (sync_files). The device page just reads it (and asks
+# for a rebuild when stale), so viewing it never synthesizes audio or
+# touches the audio packs.
+#
+# The snapshot's pack is held as "snapshot" (audio_packs), so the
+# stored manifest always points at files that exist.
+
+SNAPSHOT_FORMAT = "2"              # bump when a payload builder changes
+HOLDER = "snapshot"
+
+
+def _hash(value):
+    raw = json.dumps(value, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+
+def _without_timestamp(payload):
+    return {k: v for k, v in payload.items() if k != "timestamp"}
+
+
+def content_version(device):
+    """Hash of everything the device's payloads are built from."""
+    user = device.owner
+    meds = Medication.query.filter_by(patient_id=user.id).order_by(Medication.id).all()
+    dosages = Dosage.query.filter(
+        Dosage.medication_id.in_([m.id for m in meds])
+    ).order_by(Dosage.id).all() if meds else []
+
+    return _hash([
+        SNAPSHOT_FORMAT,
+        current_app.config.get("TTS_BACKEND"),
+        device.device_code, user.id, user.name,
+        device.language, device.total_compartments,
+        [(m.id, m.name, m.critical, m.compartment, m.expiry) for m in meds],
+        [(d.id, d.medication_id, d.time_range_start, d.time_range_end, d.food_status, d.remark)
+         for d in dosages],
+    ])
+
+
+def get_snapshot(device):
+    return DeviceSyncSnapshot.query.filter_by(device_id=device.id).first()
+
+
+def is_current(device, snapshot):
+    return snapshot is not None and snapshot.content_version == content_version(device)
+
+
+# ---------------------------------------------------------
+# Rebuild (sync pipeline only)
+# ---------------------------------------------------------
+def refresh_snapshot(device):
+    """Rebuild DEVICE's snapshot, building its audio pack if needed."""
+    # Versioned before reading: an edit landing mid-build leaves the
+    # snapshot stale, so the next check rebuilds it again
+    version = content_version(device)
+    user = device.owner
+
+    config = build_config_json(user)
+    schedule = build_schedule_json(user)
+    manifest = build_audio_manifest_cached(user, holder=HOLDER)
+
+    values = dict(
+        content_version=version,
+        language=normalize_lang(device.language or "en"),
+        config=config,
+        schedule=schedule,
+        manifest=manifest,
+        config_hash=_hash(_without_timestamp(config["config"])),
+        schedule_hash=_hash(_without_timestamp(schedule["schedule"])),
+        manifest_hash=_hash(manifest["audio_files"]),
+        built_at=datetime.utcnow(),
+    )
+
+    for attempt in range(2):
+        snapshot = get_snapshot(device)
+        if snapshot is None:
+            snapshot = DeviceSyncSnapshot(device_id=device.id)
+            db.session.add(snapshot)
+        for key, value in values.items():
+            setattr(snapshot, key, value)
+        try:
+            db.session.commit()
+            break
+        except IntegrityError:
+            # Another worker inserted the row first: update theirs
+            db.session.rollback()
+            if attempt:
+                raise
+
+    print(f"[SYNC] 📸 {device.device_code} snapshot {version} (pack {manifest['pack']})")
+
+    # Static copy for signed-URL downloads; the dynamic routes still
+    # work if this fails
+    from app.utils.sync_files import write_bundle_files
+    try:
+        write_bundle_files(device, snapshot)
+    except OSError as e:
+        print(f"[SYNC] ⚠️ {device.device_code}: bundle file not written: {e}")
+    return snapshot
+
+
+def current_snapshot(device):
+    """
+    The device's stored snapshot. A stale one is served as is while
+    pregen rebuilds it; see the note at the top.
+    """
+    from app.utils.pregen import request_pregen
+
+    snapshot = get_snapshot(device)
+    if snapshot is None:
+        return refresh_snapshot(device)
+    if not is_current(device, snapshot):
+        if not request_pregen(device.owner_id, device.language):
+            return refresh_snapshot(device)
+        if not snapshot.served_stale:
+            snapshot.served_stale = True
+            db.session.commit()
+    return snapshot
+
+
+# ---------------------------------------------------------
+# Serving
+# ---------------------------------------------------------
+def _hold(device, snapshot):
+    """Move the device's pack reference onto the snapshot's pack. Lock held."""
+    from app.utils import audio_packs
+
+    patient_dir = os.path.join(BASE_AUDIO_DIR, str(device.owner_id))
+    audio_packs.hold_pack(patient_dir, f"{snapshot.language}/{snapshot.manifest['pack']}",
+                          device.device_code)
+
+
+def device_manifest(device, snapshot, codec, now_minutes, hold=True):
+    """
+    The stored manifest for a device download: moves the device's
+    pack reference onto the snapshot's pack (unless hold=False),
+    encodes clips for CODEC where needed and adds the download order
+    (manifest_priority) for a device clock of NOW_MINUTES past midnight.
+    """
+    from app.utils import audio_packs
+    from app.utils.manifest_priority import ordered_files
+
+    manifest = snapshot.manifest
+    patient_dir = os.path.join(BASE_AUDIO_DIR, str(device.owner_id))
+
+    with audio_packs.patient_lock(patient_dir):
+        if hold:
+            _hold(device, snapshot)
+        audio_files = encode_manifest(manifest["audio_files"], codec)
+
+    files = ordered_files(audio_files, manifest.get("windows"), now_minutes)
+    return dict(manifest, audio_files=audio_files, files=files)
+
+
+def bundle_body(device, snapshot, codec, now_minutes, hold=True):
+    """Config + schedule + manifest + sync token, as compact JSON bytes."""
+    return json.dumps({
+        "version": snapshot.content_version,
+        "config": snapshot.config["config"],
+        "schedule": snapshot.schedule["schedule"],
+        "audio_manifest": device_manifest(device, snapshot, codec, now_minutes, hold),
+        "sync_token": sync_token(device, snapshot),   # hand back to sync_done
+    }, sort_keys=True, separators=(",", ":")).encode()
+
+
+# ---------------------------------------------------------
+# Sync tokens (download/bundle → sync_done)
+# ---------------------------------------------------------
+# A bundle carries a signed token naming the device and the content
+# version it contains. Handing it back to sync_done proves which
+# version the device finished with: if the data changed while it
+# was downloading, the device stays dirty and syncs again.
+
+def _token_serializer():
+    return URLSafeSerializer(current_app.config["SECRET_KEY"], salt="sync-bundle")
+
+
+def sync_token(device, snapshot):
+    return _token_serializer().dumps({"device": device.device_code, "version": snapshot.content_version})
+
+
+def token_version(device, token):
+    """Content version a sync token vouches for; None if it isn't valid for DEVICE."""
+    try:
+        data = _token_serializer().loads(token)
+    except BadSignature:
+        return None
+    if not isinstance(data, dict) or data.get("device") != device.device_code:
+        return None
+    return data.get("version")
+
+
+def mark_synced(device):
+    """sync_done: the device now has what its snapshot describes."""
+    snapshot = get_snapshot(device)
+    if snapshot is None:
+        return
+    snapshot.synced_config_hash = snapshot.config_hash
+    snapshot.synced_schedule_hash = snapshot.schedule_hash
+    snapshot.synced_manifest_hash = snapshot.manifest_hash
+    snapshot.synced_at = datetime.utcnow()
+    snapshot.served_stale = False
+
+    # The device now has this pack; its older one can be collected.
+    # (Bundles served as static files never took the reference.)
+    from app.utils import audio_packs
+    with audio_packs.patient_lock(os.path.join(BASE_AUDIO_DIR, str(device.owner_id))):
+        _hold(device, snapshot)
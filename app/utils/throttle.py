@@ -0,0 +1,67 @@
+# app/utils/throttle.py
+
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+# =========================================================
+# SLIDING-WINDOW RATE LIMITER (per process)
+# =========================================================
+class SlidingWindowLimiter:
+    """
+    Allow at most `limit` hits per `window` seconds for each key.
+    Keys are evicted LRU-style so a flood of distinct keys
+    can't grow memory without bound.
+    """
+
+    def __init__(self, limit, window, max_keys=50000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._hits = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _recent(self, key, now):
+        hits = self._hits.get(key)
+        if hits is None:
+            return None
+        while hits and hits[0] <= now - self.window:
+            hits.popleft()
+        return hits
+
+    def blocked(self, key):
+        now = time.monotonic()
+        with self._lock:
+            hits = self._recent(key, now)
+            return bool(hits) and len(hits) >= self.limit
+
+    def hit(self, key):
+        now = time.monotonic()
+        with self._lock:
+            hits = self._recent(key, now)
+            if hits is None:
+                hits = self._hits[key] = deque()
+            hits.append(now)
+            self._hits.move_to_end(key)
+
+            while len(self._hits) > self.max_keys:
+                self._hits.popitem(last=False)
+
+    def reset(self, key):
+        with self._lock:
+            self._hits.pop(key, None)
+
+
+# ---------------------------------------------------------
+# Login / signup limiters, sized from Config at start-up
+# ---------------------------------------------------------
+ip_limiter = SlidingWindowLimiter(limit=30, window=60)
+username_limiter = SlidingWindowLimiter(limit=5, window=300)
+
+
+def configure_login_throttle(app):
+    ip_limiter.limit = app.config["LOGIN_MAX_PER_IP"]
+    ip_limiter.window = app.config["LOGIN_IP_WINDOW"]
+    username_limiter.limit = app.config["LOGIN_MAX_FAILURES_PER_USER"]
+    username_limiter.window = app.config["LOGIN_USER_WINDOW"]
@@ -0,0 +1,246 @@
+# bench.py
+"""
+Analytics / dashboard benchmark at several data scales.
+
+    python bench.py run --scales small,medium --label before
+    # … change code …
+    python bench.py run --scales small,medium --label after
+    python bench.py compare bench_results/before.json bench_results/after.json
+
+Each scale is generated once with synth_data.py into bench_data/<scale>.db
+and reused; every run works on a fresh copy, so write paths
+(detect_missed_doses) start from the same state each time.
+Each scale runs in its own process so per-process caches don't leak
+between databases.
+
+Timed targets:
+    compute_patient_analytics   (a typical patient)
+    doctor.dashboard            (the doctor with the most patients)
+    doctor.view_alerts          (same doctor)
+    patient.history             (a typical patient, first page)
+    detect_missed_doses         (a typical patient)
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(ROOT, "bench_data")
+RESULTS_DIR = os.path.join(ROOT, "bench_results")
+
+SCALES = {
+    "small":  dict(doctors=10, patients=100, days=30),
+    "medium": dict(doctors=50, patients=1000, days=180),
+    "large":  dict(doctors=200, patients=5000, days=365),
+}
+
+
+# =========================================================
+# ONE SCALE (runs in a child process)
+# =========================================================
+def _timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+
+    ordered = sorted(samples)
+    return {
+        "first_ms": round(samples[0], 2),
+        "median_ms": round(statistics.median(samples), 2),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+        "min_ms": round(ordered[0], 2),
+        "runs": repeat,
+    }
+
+
+def bench_scale(scale, repeat):
+    source = os.path.join(DATA_DIR, f"{scale}.db")
+    work = os.path.join(DATA_DIR, f"{scale}.work.db")
+
+    from sqlalchemy import func
+    from app import create_app, db
+    from app.config import Config
+    from app.models import User, DoctorPatientLink, Log, Medication
+
+    Config.SOCKETIO_ASYNC_MODE = "threading"
+
+    if not os.path.exists(source):
+        Config.SQLALCHEMY_DATABASE_URI = "sqlite:///" + source
+        from synth_data import generate
+        from app.commands import init_db
+
+        app = create_app()
+        print(f"🧪 Generating '{scale}' dataset {SCALES[scale]}...", file=sys.stderr)
+        with app.app_context():
+            init_db()
+            counts = generate(**SCALES[scale])
+            db.engine.dispose()
+        print(f"   {counts}", file=sys.stderr)
+
+    shutil.copyfile(source, work)
+    Config.SQLALCHEMY_DATABASE_URI = "sqlite:///" + work
+    app = create_app()
+
+    from app.utils.analytics import compute_patient_analytics
+    from app.utils.dose_checker import detect_missed_doses
+
+    results = {}
+    with app.app_context():
+        doctor_id, n_patients = db.session.query(
+            DoctorPatientLink.doctor_id, func.count()
+        ).filter(DoctorPatientLink.active.is_(True)).group_by(
+            DoctorPatientLink.doctor_id
+        ).order_by(func.count().desc()).first()
+
+        patient_ids = [
+            pid for (pid,) in db.session.query(User.id).filter_by(role="patient").order_by(User.id)
+        ]
+        patient_id = patient_ids[len(patient_ids) // 2]
+        patient = db.session.get(User, patient_id)
+
+        results["_dataset"] = {
+            "users": db.session.query(func.count(User.id)).scalar(),
+            "medications": db.session.query(func.count(Medication.id)).scalar(),
+            "logs": db.session.query(func.count(Log.id)).scalar(),
+            "doctor_patients": n_patients,
+        }
+
+        results["compute_patient_analytics"] = _timed(
+            lambda: compute_patient_analytics(patient), repeat
+        )
+
+        # A different patient each run so every call has real work to do
+        pool = iter(patient_ids[len(patient_ids) // 3:])
+        results["detect_missed_doses"] = _timed(
+            lambda: detect_missed_doses(next(pool)), repeat
+        )
+        db.session.remove()
+
+    def page(user_id, url):
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess["_user_id"] = str(user_id)
+            sess["_fresh"] = True
+
+        def hit():
+            resp = client.get(url)
+            assert resp.status_code == 200, f"{url} → {resp.status_code}"
+        return hit
+
+    results["doctor.dashboard"] = _timed(page(doctor_id, "/doctor/dashboard"), repeat)
+    results["doctor.view_alerts"] = _timed(page(doctor_id, "/doctor/alerts"), repeat)
+    results["patient.history"] = _timed(page(patient_id, "/patient/history"), repeat)
+
+    os.remove(work)
+    return results
+
+
+# =========================================================
+# DRIVER
+# =========================================================
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(scales, repeat, label):
+    os.makedirs(DATA_DIR, exist_ok=True)
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+
+    report = {
+        "label": label,
+        "revision": git_revision(),
+        "created_at": datetime.utcnow().isoformat(),
+        "repeat": repeat,
+        "scales": {},
+    }
+
+    for scale in scales:
+        print(f"⏱  {scale} …", flush=True)
+        out = subprocess.run(
+            [sys.executable, __file__, "_scale", scale, "--repeat", str(repeat)],
+            cwd=ROOT, stdout=subprocess.PIPE, text=True, check=True
+        ).stdout
+        # The app prints start-up chatter; the result is the last line
+        report["scales"][scale] = json.loads(out.strip().splitlines()[-1])
+        print_scale(scale, report["scales"][scale])
+
+    path = os.path.join(RESULTS_DIR, f"{label}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"💾 Saved {path}")
+
+
+def print_scale(scale, results):
+    ds = results.get("_dataset", {})
+    print(f"\n[{scale}] logs={ds.get('logs')} users={ds.get('users')} "
+          f"doctor_patients={ds.get('doctor_patients')}")
+    print(f"  {'target':<28}{'first':>10}{'median':>10}{'p95':>10}")
+    for name, r in results.items():
+        if name.startswith("_"):
+            continue
+        print(f"  {name:<28}{r['first_ms']:>10.1f}{r['median_ms']:>10.1f}{r['p95_ms']:>10.1f}")
+
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+
+    print(f"{before['label']} ({before['revision']})  →  {after['label']} ({after['revision']})")
+    for scale, b_results in before["scales"].items():
+        a_results = after["scales"].get(scale)
+        if not a_results:
+            continue
+        print(f"\n[{scale}]  {'target':<28}{'before':>10}{'after':>10}{'speedup':>10}")
+        for name, b in b_results.items():
+            a = a_results.get(name)
+            if name.startswith("_") or not a:
+                continue
+            speedup = b["median_ms"] / a["median_ms"] if a["median_ms"] else float("inf")
+            print(f"          {name:<28}{b['median_ms']:>10.1f}{a['median_ms']:>10.1f}{speedup:>9.1f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Portal benchmarks")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_run = sub.add_parser("run")
+    p_run.add_argument("--scales", default="small,medium", help=f"comma list of {', '.join(SCALES)}")
+    p_run.add_argument("--repeat", type=int, default=5)
+    p_run.add_argument("--label", default=datetime.utcnow().strftime("%Y%m%d-%H%M%S"))
+
+    p_cmp = sub.add_parser("compare")
+    p_cmp.add_argument("before")
+    p_cmp.add_argument("after")
+
+    p_one = sub.add_parser("_scale")
+    p_one.add_argument("scale", choices=SCALES)
+    p_one.add_argument("--repeat", type=int, default=10)
+
+    opts = parser.parse_args(argv)
+
+    if opts.cmd == "run":
+        run([s.strip() for s in opts.scales.split(",")], opts.repeat, opts.label)
+    elif opts.cmd == "compare":
+        compare(opts.before, opts.after)
+    else:
+        print(json.dumps(bench_scale(opts.scale, opts.repeat)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,550 @@
+# fleet_sim.py
+"""
+Device fleet simulator / load test.
+
+    # 1) fixtures: N patients, each with a device, medications, dosages
+    python fleet_sim.py seed --devices 200
+
+    # 2) start the portal with the stub TTS backend (no gTTS / ffmpeg)
+    TTS_BACKEND=stub python serve.py
+
+    # 3) run N virtual ESP32 dispensers against it
+    python fleet_sim.py run --devices 200 --duration 300 --speed 10
+
+Each virtual device speaks the real protocol: heartbeat → commands,
+config / schedule / manifest downloads (or one bundle, --bundle),
+audio fetch, notify, upload_state, sync_done and upload_logs.
+--speed compresses device time (a 30 s heartbeat at --speed 10
+fires every 3 s).
+
+Failure injection: flaky Wi-Fi (--offline-rate), connections cut
+mid-upload (--abort-rate), reboots (--reboot-rate) and client
+timeouts (--timeout). Failed requests are retried like the firmware
+does (2 retries, backoff).
+
+The report gives p50 / p95 / p99 latency and error rate per endpoint;
+--json stores it for before/after comparison.
+"""
+
+import argparse
+import http.client
+import json
+import random
+import sys
+import threading
+import time
+from datetime import datetime, time as dtime, timedelta, date
+from urllib.parse import urlparse
+
+
+DEVICE_PREFIX = "SIM"
+PATIENT_PREFIX = "sim_patient_"
+DOCTOR_PREFIX = "sim_doctor_"
+
+MED_NAMES = [
+    ("Paracetamol", "Acetaminophen 500mg"),
+    ("Vitamin C", "Ascorbic Acid 1000mg"),
+    ("Amoxicillin", "Amoxicillin 250mg"),
+    ("Pantoprazole", "Pantoprazole 40mg"),
+    ("Metformin", "Metformin 500mg"),
+    ("Atorvastatin", "Atorvastatin 10mg"),
+    ("Amlodipine", "Amlodipine 5mg"),
+]
+
+DOSE_SLOTS = [
+    (dtime(8, 0), dtime(9, 0), "After Food", "Morning dose"),
+    (dtime(13, 0), dtime(14, 0), "Before Food", "Afternoon dose"),
+    (dtime(20, 0), dtime(21, 0), "After Food", "Evening dose"),
+]
+
+DEVICE_COMMANDS = ["dispense_now", "snooze", "play_audio", "set_led", "force_sync", "reboot"]
+
+
+def device_code(i):
+    return f"{DEVICE_PREFIX}{i:05d}"
+
+
+def portal_app():
+    """The portal app for direct DB work (never serves, so plain threading)."""
+    from app import create_app
+    from app.commands import init_db
+    from app.config import Config
+
+    Config.SOCKETIO_ASYNC_MODE = "threading"
+    app = create_app()
+    with app.app_context():
+        init_db()
+    return app
+
+
+# =========================================================
+# FIXTURES (seed_data.py style, but for a whole fleet)
+# =========================================================
+def seed_fleet(devices, meds_per_patient=3, patients_per_doctor=25):
+    from werkzeug.security import generate_password_hash
+    from app import db
+    from app.models import User, Device, Medication, Dosage, DoctorPatientLink
+
+    app = portal_app()
+
+    with app.app_context():
+        print(f"🚀 Seeding a fleet of {devices} simulated devices...")
+
+        # One hash for every fixture account (password: "sim")
+        password_hash = generate_password_hash("sim", app.config["PASSWORD_HASH_METHOD"])
+
+        existing = {
+            code for (code,) in db.session.query(Device.device_code).filter(
+                Device.device_code.like(f"{DEVICE_PREFIX}%")
+            )
+        }
+
+        doctors = {}
+
+        def doctor_for(i):
+            n = i // patients_per_doctor
+            if n not in doctors:
+                username = f"{DOCTOR_PREFIX}{n}"
+                doc = User.query.filter_by(username=username).first()
+                if not doc:
+                    doc = User(
+                        username=username, name=f"Sim Doctor {n}",
+                        password_hash=password_hash, role="doctor", approved=True
+                    )
+                    db.session.add(doc)
+                    db.session.flush()
+                doctors[n] = doc
+            return doctors[n]
+
+        created = 0
+        for i in range(devices):
+            code = device_code(i)
+            if code in existing:
+                continue
+
+            doctor = doctor_for(i)
+            patient = User(
+                username=f"{PATIENT_PREFIX}{i}", name=f"Sim Patient {i}",
+                password_hash=password_hash, role="patient", approved=True
+            )
+            db.session.add(patient)
+            db.session.flush()
+
+            db.session.add(Device(
+                device_code=code, owner_id=patient.id, language="en",
+                alarm_tone="default", total_compartments=8, data_dirty=True
+            ))
+            db.session.add(DoctorPatientLink(
+                doctor_id=doctor.id, patient_id=patient.id, active=True,
+                allow_alerts=True, allow_analytics=True, allow_med_update=True,
+                approved_at=datetime.utcnow()
+            ))
+
+            for n, (name, comp) in enumerate(random.sample(MED_NAMES, meds_per_patient), start=1):
+                med = Medication(
+                    patient_id=patient.id, doctor_id=doctor.id, name=name,
+                    composition=comp, quantity=random.randint(5, 30),
+                    expiry=date.today() + timedelta(days=random.randint(15, 365)),
+                    critical=random.random() < 0.3, compartment=n
+                )
+                db.session.add(med)
+                db.session.flush()
+
+                for start, end, food, remark in random.sample(DOSE_SLOTS, random.randint(1, 3)):
+                    db.session.add(Dosage(
+                        medication_id=med.id, time_range_start=start,
+                        time_range_end=end, food_status=food, remark=remark
+                    ))
+
+            created += 1
+            if created % 100 == 0:
+                db.session.commit()
+                print(f"   … {created} devices")
+
+        db.session.commit()
+        print(f"✅ Fleet ready: {created} new, {len(existing)} already present")
+
+
+# =========================================================
+# COMMAND INJECTION (what dashboard clicks would queue)
+# =========================================================
+def inject_commands(devices, per_minute, stop):
+    from app import db
+    from app.models import DeviceCommandQueue
+
+    app = portal_app()
+    interval = 60.0 / per_minute
+
+    with app.app_context():
+        while not stop.wait(random.expovariate(1 / interval)):
+            cmd = random.choice(DEVICE_COMMANDS)
+            db.session.add(DeviceCommandQueue(
+                device_code=device_code(random.randrange(devices)),
+                command=cmd,
+                data={"minutes": 10} if cmd == "snooze" else {}
+            ))
+            db.session.commit()
+
+
+# =========================================================
+# STATS
+# =========================================================
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = {}
+        self.errors = {}
+        self.aborted = {}
+
+    def record(self, endpoint, seconds, ok):
+        with self.lock:
+            self.latency.setdefault(endpoint, []).append(seconds)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def abort(self, endpoint):
+        with self.lock:
+            self.aborted[endpoint] = self.aborted.get(endpoint, 0) + 1
+
+    def report(self, elapsed):
+        def pct(values, p):
+            return values[min(len(values) - 1, int(len(values) * p))] * 1000
+
+        rows = {}
+        with self.lock:
+            for endpoint, values in sorted(self.latency.items()):
+                values = sorted(values)
+                errors = self.errors.get(endpoint, 0)
+                rows[endpoint] = {
+                    "requests": len(values),
+                    "errors": errors,
+                    "error_rate": errors / len(values),
+                    "aborted": self.aborted.get(endpoint, 0),
+                    "p50_ms": round(pct(values, 0.50), 1),
+                    "p95_ms": round(pct(values, 0.95), 1),
+                    "p99_ms": round(pct(values, 0.99), 1),
+                }
+
+        total = sum(r["requests"] for r in rows.values())
+        return {"elapsed_s": round(elapsed, 1), "requests": total,
+                "req_per_s": round(total / elapsed, 1) if elapsed else 0,
+                "endpoints": rows}
+
+
+def print_report(report):
+    print()
+    print(f"{'endpoint':<14}{'reqs':>8}{'err%':>8}{'cut':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, r in report["endpoints"].items():
+        print(f"{name:<14}{r['requests']:>8}{r['error_rate'] * 100:>7.1f}%{r['aborted']:>6}"
+              f"{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}")
+    print(f"\n{report['requests']} requests in {report['elapsed_s']} s "
+          f"({report['req_per_s']} req/s)")
+
+
+# =========================================================
+# VIRTUAL DEVICE
+# =========================================================
+class VirtualDevice(threading.Thread):
+    """
+    One dispenser. Mirrors the firmware loop: heartbeat every
+    HEARTBEAT seconds, act on commands, full sync when the portal
+    says data is dirty, upload dose logs and storage state.
+    """
+
+    def __init__(self, code, opts, stats, stop):
+        super().__init__(daemon=True)
+        self.code = code
+        self.opts = opts
+        self.stats = stats
+        self.stop = stop
+        self.rng = random.Random(code)
+
+        url = urlparse(opts.url)
+        self.host, self.port = url.hostname, url.port or 80
+
+        self.files = {}          # path → size (the SD card)
+        self.schedule = []
+        self.pending_logs = []
+
+    # ---------------- transport ----------------
+    def request(self, endpoint, method, path, body=None):
+        """Returns (status, body bytes) or (None, None) after retries."""
+        payload = json.dumps(body).encode() if body is not None else None
+
+        for attempt in range(3):
+            if payload and self.rng.random() < self.opts.abort_rate:
+                self._cut_upload(method, path, payload)
+                self.stats.abort(endpoint)
+                self.sleep(2 ** attempt)
+                continue
+
+            started = time.perf_counter()
+            try:
+                conn = http.client.HTTPConnection(self.host, self.port, timeout=self.opts.timeout)
+                headers = {"Content-Type": "application/json"} if payload else {}
+                conn.request(method, path, body=payload, headers=headers)
+                resp = conn.getresponse()
+                data = resp.read()
+                conn.close()
+                status = resp.status
+            except (OSError, http.client.HTTPException):
+                status, data = None, None
+
+            ok = status is not None and status < 400
+            self.stats.record(endpoint, time.perf_counter() - started, ok)
+            if ok or (status is not None and status < 500):
+                return status, data
+            self.sleep(2 ** attempt)
+
+        return None, None
+
+    def _cut_upload(self, method, path, payload):
+        """Send headers and half the body, then drop the connection."""
+        try:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.opts.timeout)
+            conn.putrequest(method, path)
+            conn.putheader("Content-Type", "application/json")
+            conn.putheader("Content-Length", str(len(payload)))
+            conn.endheaders()
+            conn.send(payload[: len(payload) // 2])
+            conn.close()
+        except OSError:
+            pass
+
+    def get_json(self, endpoint, path):
+        status, data = self.request(endpoint, "GET", path)
+        if status == 200:
+            return json.loads(data)
+        return None
+
+    def sleep(self, device_seconds):
+        return self.stop.wait(device_seconds / self.opts.speed)
+
+    # ---------------- protocol ----------------
+    def heartbeat(self):
+        status, data = self.request("heartbeat", "POST", f"/api/device/heartbeat/{self.code}", {})
+        if status != 200:
+            return
+        reply = json.loads(data)
+
+        for cmd in reply.get("commands", []):
+            self.handle_command(cmd["command"], cmd.get("data") or {})
+
+        if reply.get("sync", {}).get("all"):
+            self.full_sync(reply["sync"].get("bundle_url"))
+
+    def handle_command(self, command, data):
+        if command in ("dispense_now", "dispense_med"):
+            self.take_dose(late=False)
+        elif command == "force_sync":
+            self.full_sync()
+        elif command == "reboot":
+            self.sleep(10)
+            self.full_sync()
+        # snooze / play_audio / set_led / alarms: local only
+
+    def notify(self, msg, pct):
+        self.request("notify", "POST", f"/api/device/notify/{self.code}", {"msg": msg, "pct": pct})
+
+    def full_sync(self, bundle_url=None):
+        self.notify("sync started", 0)
+
+        query = f"?codecs={self.opts.codecs}" if self.opts.codecs else ""
+        done = {}
+
+        if self.opts.bundle:
+            # One request for config + schedule + manifest: the pre-written
+            # file from the heartbeat's signed URL, else the dynamic route
+            if bundle_url:
+                sep = "&" if "?" in bundle_url else "?"
+                url = bundle_url + (f"{sep}codecs={self.opts.codecs}" if self.opts.codecs else "")
+                bundle = self.get_json("bundle_file", url)
+            else:
+                bundle = self.get_json("bundle", f"/api/device/download/bundle/{self.code}{query}")
+            if bundle is None:
+                return
+            config = {"config": bundle["config"]}
+            schedule = {"schedule": bundle["schedule"]}
+            manifest = bundle["audio_manifest"]
+            done["sync_token"] = bundle["sync_token"]
+        else:
+            config = self.get_json("config", f"/api/device/download/config/{self.code}")
+            schedule = self.get_json("schedule", f"/api/device/download/schedule/{self.code}")
+            manifest = self.get_json("manifest", f"/api/device/download/audio_manifest/{self.code}{query}")
+            if config is None or schedule is None or manifest is None:
+                return
+
+        self.schedule = schedule["schedule"]["schedule"]
+        self.files["config.json"] = len(json.dumps(config))
+        self.files["schedule.json"] = len(json.dumps(schedule))
+
+        # Newer portals list clips in download order (globals, then
+        # the soonest doses); fall back to walking audio_files
+        if "files" in manifest:
+            paths = [f["path"] for f in manifest["files"]]
+        else:
+            audio = manifest.get("audio_files", {})
+            entries = list(audio.get("global", {}).values())
+            for clips in audio.get("medicines", {}).values():
+                entries.extend(clips.values())
+            paths = [e["path"] if isinstance(e, dict) else e for e in entries]
+
+        for n, path in enumerate(paths, start=1):
+            status, data = self.request("audio", "GET", f"/api/device/{path}")
+            if status == 200:
+                self.files[path] = len(data)
+            if n % 4 == 0:
+                self.notify("downloading audio", int(100 * n / len(paths)))
+
+        self.upload_state()
+        self.request("sync_done", "POST", f"/api/device/sync_done/{self.code}", done)
+
+    def upload_state(self):
+        files = {"audio": [], "json": []}
+        for path, size in self.files.items():
+            files["json" if path.endswith(".json") else "audio"].append({"path": path, "size": size})
+
+        self.request("upload_state", "POST", f"/api/device/upload_state/{self.code}", {
+            "files": files,
+            "storage_used": sum(self.files.values()),
+            "storage_total": 4 * 1024 * 1024 * 1024,
+        })
+
+    def take_dose(self, late):
+        """Queue a dose event from the synced schedule."""
+        if not self.schedule:
+            return
+        med = self.rng.choice(self.schedule)
+        if not med["dosages"]:
+            return
+        dose = self.rng.choice(med["dosages"])
+
+        roll = self.rng.random()
+        status = "missed" if roll < self.opts.missed_rate else "taken"
+        delay = self.rng.randint(5, 45) if late and status == "taken" else 0
+
+        self.pending_logs.append({
+            "med_name": med["name"], "med_id": med["id"], "dose_id": dose["id"],
+            "status": status, "taken_time": datetime.utcnow().isoformat(),
+            "mode": "device", "delay": delay,
+            "pill_sensor": status == "taken", "dustbin_sensor": status == "taken",
+        })
+
+    def upload_logs(self):
+        if not self.pending_logs:
+            return
+        status, _ = self.request("upload_logs", "POST", f"/api/device/upload_logs/{self.code}",
+                                 self.pending_logs)
+        if status == 200:
+            self.pending_logs = []
+
+    # ---------------- main loop ----------------
+    def run(self):
+        # Devices power up spread over the ramp window
+        if self.stop.wait(self.rng.uniform(0, self.opts.ramp)):
+            return
+
+        beats = 0
+        while not self.stop.is_set():
+            if self.rng.random() < self.opts.offline_rate:
+                # Wi-Fi drop: skip a few heartbeats, keep logging doses
+                if self.sleep(self.opts.heartbeat * self.rng.randint(2, 6)):
+                    return
+            elif self.rng.random() < self.opts.reboot_rate:
+                self.sleep(10)
+                self.full_sync()
+
+            self.heartbeat()
+
+            if self.rng.random() < self.opts.dose_rate:
+                self.take_dose(late=self.rng.random() < self.opts.late_rate)
+            self.upload_logs()
+
+            beats += 1
+            if beats % self.opts.state_every == 0:
+                self.upload_state()
+
+            jitter = self.rng.uniform(0.9, 1.1)
+            if self.sleep(self.opts.heartbeat * jitter):
+                return
+
+
+def run_fleet(opts):
+    stats = Stats()
+    stop = threading.Event()
+
+    fleet = [VirtualDevice(device_code(i), opts, stats, stop) for i in range(opts.devices)]
+
+    if opts.commands_per_min:
+        threading.Thread(
+            target=inject_commands, args=(opts.devices, opts.commands_per_min, stop), daemon=True
+        ).start()
+
+    print(f"📟 Starting {opts.devices} virtual devices against {opts.url} "
+          f"for {opts.duration} s (speed x{opts.speed})")
+    started = time.perf_counter()
+    for d in fleet:
+        d.start()
+
+    try:
+        stop.wait(opts.duration)
+    except KeyboardInterrupt:
+        pass
+    stop.set()
+    for d in fleet:
+        d.join(timeout=opts.timeout + 1)
+
+    report = stats.report(time.perf_counter() - started)
+    report["options"] = vars(opts)
+    print_report(report)
+
+    if opts.json:
+        with open(opts.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Saved {opts.json}")
+
+    return report
+
+
+# =========================================================
+# CLI
+# =========================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulated dispenser fleet")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    seed = sub.add_parser("seed", help="create fleet fixtures in the portal database")
+    seed.add_argument("--devices", type=int, default=100)
+    seed.add_argument("--meds", type=int, default=3, help="medications per patient")
+
+    run = sub.add_parser("run", help="run the fleet against a portal")
+    run.add_argument("--devices", type=int, default=100)
+    run.add_argument("--url", default="http://127.0.0.1:5000")
+    run.add_argument("--duration", type=float, default=120, help="wall-clock seconds")
+    run.add_argument("--speed", type=float, default=1.0, help="device-time compression")
+    run.add_argument("--ramp", type=float, default=10, help="seconds over which devices boot")
+    run.add_argument("--heartbeat", type=float, default=30, help="device seconds between heartbeats")
+    run.add_argument("--state-every", type=int, default=10, help="heartbeats between state uploads")
+    run.add_argument("--dose-rate", type=float, default=0.05, help="chance of a dose event per heartbeat")
+    run.add_argument("--missed-rate", type=float, default=0.15)
+    run.add_argument("--late-rate", type=float, default=0.2)
+    run.add_argument("--commands-per-min", type=float, default=0,
+                     help="queue random dashboard commands (needs the portal DB locally)")
+    run.add_argument("--timeout", type=float, default=10)
+    run.add_argument("--offline-rate", type=float, default=0.01, help="chance of a Wi-Fi drop per heartbeat")
+    run.add_argument("--abort-rate", type=float, default=0.01, help="chance an upload is cut mid-body")
+    run.add_argument("--reboot-rate", type=float, default=0.002, help="chance of a reboot per heartbeat")
+    run.add_argument("--codecs", default="", help="declared audio codecs, e.g. ima_adpcm,mulaw")
+    run.add_argument("--bundle", action="store_true", help="sync through download/bundle")
+    run.add_argument("--json", help="write the report here")
+
+    opts = parser.parse_args(argv)
+
+    if opts.cmd == "seed":
+        seed_fleet(opts.devices, opts.meds)
+    else:
+        run_fleet(opts)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
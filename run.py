@@ -4,4 +4,11 @@ from app import create_app
 app = create_app()
 
 if __name__ == "__main__":
+    from app.commands import init_db
+    from app.utils.realtime import start_presence_watcher
+
+    # Dev server: one process, so set the database up here
+    with app.app_context():
+        init_db()
+    start_presence_watcher(app)
     app.run(host="0.0.0.0", port=5000, debug=True)
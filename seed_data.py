@@ -6,6 +6,9 @@ from app.models import User, Device, Medication, Dosage, Log, Alert, DoctorPatie
 app = create_app()
 
 with app.app_context():
+    from app.commands import init_db
+    init_db()
+
     print("🚀 Adding data for existing patient 'anku'...")
 
     # ----------------------------------------------------------------
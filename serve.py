@@ -0,0 +1,250 @@
+# serve.py
+"""
+Production entry point.
+
+    python serve.py                 # SERVER_WORKERS processes on SERVER_PORT, SERVER_PORT+1, …
+    python serve.py --worker 0      # (internal) a single worker
+
+Each worker runs an async (gevent / eventlet) or threaded Socket.IO
+server. With more than one worker, put nginx (ip_hash) or another
+sticky load balancer in front and set SOCKETIO_MESSAGE_QUEUE so
+events cross workers; a local:// bus broker is started automatically.
+
+On SIGTERM / SIGINT every worker stops accepting, lets in-flight
+HTTP requests (device uploads, downloads…) finish for up to
+SERVER_SHUTDOWN_GRACE seconds, then exits.
+"""
+
+import os
+import sys
+import signal
+import subprocess
+import threading
+import time
+
+
+# =========================================================
+# ASYNC MODE — must be settled before the app is imported
+# =========================================================
+def pick_async_mode(requested):
+    if requested and requested != "auto":
+        return requested
+
+    for mode in ("gevent", "eventlet"):
+        try:
+            __import__(mode)
+            return mode
+        except ImportError:
+            pass
+    return "threading"
+
+
+def monkey_patch(mode):
+    if mode == "gevent":
+        from gevent import monkey
+        monkey.patch_all()
+    elif mode == "eventlet":
+        import eventlet
+        eventlet.monkey_patch()
+
+
+# =========================================================
+# IN-FLIGHT REQUEST TRACKING (for draining)
+# =========================================================
+class InFlight:
+    """
+    WSGI middleware counting plain HTTP requests in progress.
+    Socket.IO connections are long-lived and are not counted.
+    """
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+        self.active = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        if environ.get("PATH_INFO", "").startswith("/socket.io"):
+            return self.wsgi_app(environ, start_response)
+        return self._tracked(environ, start_response)
+
+    def _tracked(self, environ, start_response):
+        with self.lock:
+            self.active += 1
+        try:
+            for chunk in self.wsgi_app(environ, start_response):
+                yield chunk
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    def wait_idle(self, timeout, sleep):
+        deadline = time.monotonic() + timeout
+        while self.active and time.monotonic() < deadline:
+            sleep(0.1)
+        return self.active
+
+
+# =========================================================
+# WORKER
+# =========================================================
+def run_worker(index):
+    mode = pick_async_mode(os.environ.get("SOCKETIO_ASYNC_MODE"))
+    monkey_patch(mode)
+    os.environ["SOCKETIO_ASYNC_MODE"] = mode
+
+    from app import create_app
+    from app.utils.realtime import start_presence_watcher
+
+    app = create_app()
+    cfg = app.config
+
+    host = cfg["SERVER_HOST"]
+    port = cfg["SERVER_PORT"] + index
+    grace = cfg["SERVER_SHUTDOWN_GRACE"]
+
+    inflight = InFlight(app.wsgi_app)
+    app.wsgi_app = inflight
+
+    # Offline sweeps must run in exactly one worker
+    if index == 0:
+        start_presence_watcher(app)
+
+    print(f"🚀 Worker {index} ({mode}) listening on {host}:{port}")
+
+    if mode == "gevent":
+        from gevent import signal_handler
+        from gevent.pool import Pool
+        from gevent.pywsgi import WSGIServer
+        from geventwebsocket.handler import WebSocketHandler
+
+        server = WSGIServer(
+            (host, port), app,
+            spawn=Pool(cfg["SERVER_MAX_CONNECTIONS"]),
+            handler_class=WebSocketHandler,
+            log=None
+        )
+
+        def stop():
+            print(f"⏳ Worker {index} draining ({inflight.active} in flight)…")
+            server.close()
+
+        # close() only stops accepting; serve_forever() then waits up
+        # to stop_timeout for the pool before killing what is left.
+        signal_handler(signal.SIGTERM, stop)
+        signal_handler(signal.SIGINT, stop)
+        server.serve_forever(stop_timeout=grace)
+
+    elif mode == "eventlet":
+        import eventlet
+        from eventlet import wsgi
+
+        server = eventlet.spawn(
+            wsgi.server,
+            eventlet.listen((host, port)), app,
+            max_size=cfg["SERVER_MAX_CONNECTIONS"],
+            keepalive=cfg["SERVER_KEEPALIVE"],
+            log_output=False
+        )
+        stopping = []
+
+        def stop(signum, frame):
+            stopping.append(signum)
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        while not stopping and not server.dead:
+            eventlet.sleep(0.5)
+
+        print(f"⏳ Worker {index} draining ({inflight.active} in flight)…")
+        # wsgi.server treats SystemExit as "stop accepting", then waits
+        # for open connections; sockets may never finish, hence the cap.
+        server.kill(SystemExit)
+        with eventlet.Timeout(grace, False):
+            server.wait()
+
+    else:
+        from werkzeug.serving import make_server
+
+        server = make_server(host, port, app, threaded=True)
+
+        def stop(signum, frame):
+            print(f"⏳ Worker {index} draining ({inflight.active} in flight)…")
+            threading.Thread(target=server.shutdown, daemon=True).start()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        server.serve_forever()
+        inflight.wait_idle(grace, time.sleep)
+
+    # Alerts raised by the last requests still need to go out
+    from app.utils.mailer import drain_notifications
+    if not drain_notifications(grace):
+        print(f"⚠️ Worker {index}: notifications still queued at shutdown")
+
+    print(f"✅ Worker {index} stopped")
+
+
+# =========================================================
+# MASTER — spawns workers (and the local bus broker)
+# =========================================================
+def run_master():
+    from app.config import Config
+
+    workers = Config.SERVER_WORKERS
+    bus = Config.SOCKETIO_MESSAGE_QUEUE
+
+    if workers > 1 and not bus:
+        sys.exit("❌ SERVER_WORKERS > 1 needs SOCKETIO_MESSAGE_QUEUE "
+                 "(e.g. local://127.0.0.1:5099) so events reach every worker.")
+
+    # flask init-db once, before workers start
+    # (threading mode here: the master never serves)
+    from app import create_app
+    from app.commands import init_db
+    Config.SOCKETIO_ASYNC_MODE = "threading"
+    with create_app().app_context():
+        init_db()
+
+    broker = None
+    if bus and bus.startswith("local://"):
+        broker = subprocess.Popen([sys.executable, "-m", "app.utils.socket_bus"])
+        time.sleep(0.5)
+
+    procs = [
+        subprocess.Popen([sys.executable, __file__, "--worker", str(i)])
+        for i in range(workers)
+    ]
+    deadline = []
+
+    def stop_workers(signum=None, frame=None):
+        if not deadline:
+            deadline.append(time.monotonic() + Config.SERVER_SHUTDOWN_GRACE + 5)
+        for p in procs:
+            if p.poll() is None:
+                p.send_signal(signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop_workers)
+    signal.signal(signal.SIGINT, stop_workers)
+
+    while any(p.poll() is None for p in procs):
+        # One worker gone (signal or crash) → drain the rest too
+        if not deadline and any(p.poll() is not None for p in procs):
+            stop_workers()
+        if deadline and time.monotonic() > deadline[0]:
+            for p in procs:
+                if p.poll() is None:
+                    p.kill()
+        time.sleep(0.5)
+
+    # The bus goes last so draining workers can still publish
+    if broker:
+        broker.terminate()
+        broker.wait()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--worker":
+        run_worker(int(sys.argv[2]))
+    else:
+        run_master()
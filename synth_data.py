@@ -0,0 +1,265 @@
+# synth_data.py
+"""
+Large synthetic dataset for load / analytics benchmarks.
+
+    DATABASE_URL=sqlite:////tmp/synth.db python synth_data.py \\
+        --doctors 100 --patients 2000 --days 365
+
+Builds doctors, patients (each with a device), doctor–patient link
+graphs (a primary doctor plus extra and pending links), medications
+with 1–3 dosages, and DAYS of dose logs. Adherence is drawn per
+patient, so some patients are reliable and some are not:
+on-time, late (delay > 30 min), not eaten (device saw the pill but
+not the wrapper) and missed (scheduled, no device event).
+
+Rows are written with bulk inserts in chunks; never point this at
+the production database.
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime, date, time as dtime, timedelta
+
+from sqlalchemy import func, insert
+
+
+MED_NAMES = [
+    ("Paracetamol", "Acetaminophen 500mg"),
+    ("Vitamin C", "Ascorbic Acid 1000mg"),
+    ("Amoxicillin", "Amoxicillin 250mg"),
+    ("Pantoprazole", "Pantoprazole 40mg"),
+    ("Metformin", "Metformin 500mg"),
+    ("Atorvastatin", "Atorvastatin 10mg"),
+    ("Amlodipine", "Amlodipine 5mg"),
+    ("Losartan", "Losartan 50mg"),
+    ("Levothyroxine", "Levothyroxine 50mcg"),
+    ("Aspirin", "Aspirin 75mg"),
+]
+
+DOSE_SLOTS = [
+    (dtime(8, 0), dtime(9, 0), "After Food", "Morning dose"),
+    (dtime(13, 0), dtime(14, 0), "Before Food", "Afternoon dose"),
+    (dtime(20, 0), dtime(21, 0), "After Food", "Evening dose"),
+    (dtime(22, 30), dtime(23, 0), None, "Bedtime"),
+]
+
+CHUNK = 20000
+
+
+def _next_id(model):
+    from app import db
+    return (db.session.query(func.max(model.id)).scalar() or 0) + 1
+
+
+def _bulk(model, rows):
+    from app import db
+    for i in range(0, len(rows), CHUNK):
+        db.session.execute(insert(model), rows[i:i + CHUNK])
+
+
+# =========================================================
+# GENERATOR
+# =========================================================
+def generate(doctors=50, patients=500, days=90, meds=(2, 5),
+             extra_links=1, pending_rate=0.05, seed=42, prefix="synth"):
+    """
+    Fill the current app's database. Must run inside an app context.
+    Returns row counts.
+    """
+    from werkzeug.security import generate_password_hash
+    from flask import current_app
+    from app import db
+    from app.models import (
+        User, Device, Medication, Dosage, Log, Alert, DoctorPatientLink
+    )
+
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    today = now.date()
+
+    # One hash for every synthetic account (password: "synth")
+    password_hash = generate_password_hash("synth", current_app.config["PASSWORD_HASH_METHOD"])
+
+    # ---------------- users + devices ----------------
+    uid = _next_id(User)
+    doctor_ids = list(range(uid, uid + doctors))
+    patient_ids = list(range(uid + doctors, uid + doctors + patients))
+
+    def joined():
+        return now - timedelta(days=days + rng.randint(0, 60), minutes=rng.randint(0, 1440))
+
+    _bulk(User, [
+        dict(id=i, username=f"{prefix}_doctor_{n}", name=f"Dr. Synthetic {n}",
+             password_hash=password_hash, role="doctor", approved=True, created_at=joined())
+        for n, i in enumerate(doctor_ids)
+    ] + [
+        dict(id=i, username=f"{prefix}_patient_{n}", name=f"Patient {n}",
+             password_hash=password_hash, role="patient",
+             approved=rng.random() > 0.02, created_at=joined())
+        for n, i in enumerate(patient_ids)
+    ])
+
+    did = _next_id(Device)
+    device_of = {pid: did + n for n, pid in enumerate(patient_ids)}
+    _bulk(Device, [
+        dict(id=device_of[pid], device_code=f"{prefix.upper()}{n:06d}", owner_id=pid,
+             language=rng.choice(["en"] * 6 + ["hi", "mr", "ta", "bn"]),
+             alarm_tone="default", total_compartments=8, data_dirty=False,
+             last_heartbeat=now - timedelta(seconds=rng.randint(0, 7200)),
+             created_at=joined())
+        for n, pid in enumerate(patient_ids)
+    ])
+
+    # ---------------- doctor–patient graph ----------------
+    # Doctor popularity is skewed: a few doctors carry many patients
+    weights = [1 / (k + 1) ** 0.8 for k in range(doctors)]
+    links = []
+    primary_of = {}
+    for pid in patient_ids:
+        chosen = {rng.choices(doctor_ids, weights)[0]}
+        primary_of[pid] = next(iter(chosen))
+        for _ in range(rng.randint(0, extra_links)):
+            chosen.add(rng.choice(doctor_ids))
+
+        for doc in chosen:
+            pending = doc != primary_of[pid] and rng.random() < pending_rate
+            requested = now - timedelta(days=rng.randint(0, days))
+            links.append(dict(
+                doctor_id=doc, patient_id=pid, active=not pending,
+                requested_at=requested, approved_at=None if pending else requested,
+                allow_alerts=True, allow_analytics=True,
+                allow_med_update=rng.random() < 0.7
+            ))
+    _bulk(DoctorPatientLink, links)
+
+    # ---------------- medications + dosages ----------------
+    mid = _next_id(Medication)
+    dose_id = _next_id(Dosage)
+    med_rows, dose_rows = [], []
+    schedule = {}   # pid → [(med_id, name, dose_id, start, end)]
+
+    for pid in patient_ids:
+        picked = rng.sample(MED_NAMES, rng.randint(*meds))
+        for compartment, (name, comp) in enumerate(picked, start=1):
+            med_rows.append(dict(
+                id=mid, patient_id=pid, doctor_id=primary_of[pid], name=name,
+                composition=comp, quantity=rng.randint(0, 60),
+                expiry=today + timedelta(days=rng.randint(-10, 400)),
+                critical=rng.random() < 0.25, compartment=compartment,
+                created_at=now - timedelta(days=days)
+            ))
+            for start, end, food, remark in rng.sample(DOSE_SLOTS, rng.randint(1, 3)):
+                dose_rows.append(dict(
+                    id=dose_id, medication_id=mid, time_range_start=start,
+                    time_range_end=end, food_status=food, remark=remark
+                ))
+                schedule.setdefault(pid, []).append((mid, name, dose_id, start, end))
+                dose_id += 1
+            mid += 1
+
+    _bulk(Medication, med_rows)
+    _bulk(Dosage, dose_rows)
+    db.session.commit()
+
+    # ---------------- logs + alerts ----------------
+    log_count = alert_count = 0
+    alert_since = now - timedelta(days=30)
+
+    for pid in patient_ids:
+        # Per-patient behaviour: mostly adherent, long tail of poor adherence
+        adherence = rng.betavariate(8, 2)
+        late_rate = rng.uniform(0.02, 0.25)
+        not_eaten_rate = rng.uniform(0.0, 0.05)
+
+        logs, alerts = [], []
+        for day_offset in range(days, -1, -1):
+            day = today - timedelta(days=day_offset)
+            for med_id, name, d_id, start, end in schedule.get(pid, []):
+                window_start = datetime.combine(day, start)
+                window_end = datetime.combine(day, end)
+                if window_end > now:
+                    continue
+
+                roll = rng.random()
+                if roll < adherence:
+                    late = rng.random() < late_rate
+                    delay = rng.randint(31, 150) if late else rng.randint(0, 30)
+                    eaten = rng.random() >= not_eaten_rate
+                    logs.append(dict(
+                        device_id=device_of[pid], med_name=name, med_id=med_id, dose_id=d_id,
+                        taken_time=window_start + timedelta(minutes=delay),
+                        status="taken" if eaten else "missed", mode="device",
+                        delay_minutes=delay, pill_sensor=True, dustbin_sensor=eaten
+                    ))
+                    if late and window_start >= alert_since:
+                        alerts.append(dict(
+                            user_id=pid, title="Late Dose",
+                            message=f"You took {name} {delay} minutes late.",
+                            read=True, created_at=window_start + timedelta(minutes=delay)
+                        ))
+                else:
+                    logs.append(dict(
+                        device_id=None, med_name=name, med_id=med_id, dose_id=d_id,
+                        taken_time=window_end, status="missed", mode="scheduled",
+                        delay_minutes=0, pill_sensor=False, dustbin_sensor=False
+                    ))
+                    if window_end >= alert_since:
+                        alerts.append(dict(
+                            user_id=pid, title="Missed Dose",
+                            message=f"You missed your {name} dose scheduled at {start.strftime('%I:%M %p')}.",
+                            read=day_offset > 2, created_at=window_end
+                        ))
+
+        _bulk(Log, logs)
+        _bulk(Alert, alerts)
+        log_count += len(logs)
+        alert_count += len(alerts)
+        db.session.commit()
+
+    return {
+        "doctors": doctors,
+        "patients": patients,
+        "links": len(links),
+        "medications": len(med_rows),
+        "dosages": len(dose_rows),
+        "logs": log_count,
+        "alerts": alert_count,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a large synthetic dataset")
+    parser.add_argument("--doctors", type=int, default=50)
+    parser.add_argument("--patients", type=int, default=500)
+    parser.add_argument("--days", type=int, default=90, help="days of dose history")
+    parser.add_argument("--min-meds", type=int, default=2)
+    parser.add_argument("--max-meds", type=int, default=5)
+    parser.add_argument("--extra-links", type=int, default=1, help="max extra doctors per patient")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--prefix", default="synth", help="username / device-code prefix")
+    opts = parser.parse_args(argv)
+
+    from app import create_app
+    from app.commands import init_db
+    from app.config import Config
+
+    Config.SOCKETIO_ASYNC_MODE = "threading"
+    app = create_app()
+
+    print(f"🧪 Generating {opts.doctors} doctors, {opts.patients} patients, {opts.days} days...")
+    started = time.perf_counter()
+    with app.app_context():
+        init_db()
+        counts = generate(
+            doctors=opts.doctors, patients=opts.patients, days=opts.days,
+            meds=(opts.min_meds, opts.max_meds), extra_links=opts.extra_links,
+            seed=opts.seed, prefix=opts.prefix
+        )
+
+    print(f"✅ Done in {time.perf_counter() - started:.1f}s: " +
+          ", ".join(f"{k}={v}" for k, v in counts.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# tests/test_schedule_codec.py
+
+import struct
+
+import pytest
+
+from app.utils.schedule_codec import (
+    HEADER,
+    MEDICATION,
+    DOSAGE,
+    ScheduleFormatError,
+    decode_schedule,
+    encode_schedule,
+)
+
+
+def dose(dose_id, start="08:00", end="09:00", food="after", remark=None):
+    return {"id": dose_id, "start": start, "end": end, "food": food, "remark": remark}
+
+
+def med(med_id, name="Aspirin", critical=False, compartment=1, expiry="2027-06-30", dosages=()):
+    return {
+        "id": med_id,
+        "name": name,
+        "critical": critical,
+        "compartment": compartment,
+        "expiry": expiry,
+        "dosages": list(dosages),
+    }
+
+
+def payload(*meds, timestamp="2026-10-19T07:30:15"):
+    return {"schedule": list(meds), "timestamp": timestamp}
+
+
+def round_trip(value):
+    return decode_schedule(encode_schedule(value))
+
+
+# ---------------------------------------------------------
+# Round trips
+# ---------------------------------------------------------
+def test_representative_schedule_round_trips():
+    value = payload(
+        med(1, "Aspirin", critical=True, compartment=1, dosages=[
+            dose(10, "08:00", "09:30", "after", "with water"),
+            dose(11, "20:00", "21:00", "before", None),
+        ]),
+        med(2, "Metformin", compartment=8, expiry="2030-01-01", dosages=[
+            dose(12, "00:00", "23:59", "with"),
+        ]),
+        med(3, "Vitamin D", compartment=None, expiry=None),
+    )
+    assert round_trip(value) == value
+
+
+def test_none_fields_round_trip():
+    value = payload(
+        med(1, compartment=None, expiry=None, dosages=[dose(2, food=None, remark=None)]),
+        timestamp=None,
+    )
+    assert round_trip(value) == value
+
+
+def test_empty_schedule():
+    data = encode_schedule(payload())
+    assert len(data) == HEADER.size
+    assert decode_schedule(data) == payload()
+
+
+def test_shared_strings_are_stored_once():
+    value = payload(
+        med(1, "Aspirin", dosages=[dose(1, remark="after food"), dose(2, remark="after food")]),
+        med(2, "Aspirin", dosages=[dose(3, remark="after food")]),
+    )
+    data = encode_schedule(value)
+
+    strings = data[HEADER.size + 2 * MEDICATION.size + 3 * DOSAGE.size:]
+    assert strings.count(b"Aspirin\0") == 1
+    assert strings.count(b"after food\0") == 1
+    assert strings.count(b"after\0") == 1
+    assert round_trip(value) == value
+
+
+def test_unicode_strings():
+    value = payload(med(1, "पैरासिटामोल", dosages=[dose(1, remark="खाने के बाद")]))
+    assert round_trip(value) == value
+
+
+def test_edge_values_round_trip():
+    value = payload(
+        med(0xFFFFFFFF, compartment=255, expiry="2000-01-01", dosages=[
+            dose(0xFFFFFFFF, "00:00", "23:59"),
+        ]),
+        med(2, compartment=None, expiry="2179-06-05"),    # last representable day
+    )
+    assert round_trip(value) == value
+
+
+def test_timestamp_is_kept_to_the_second():
+    value = payload(timestamp="2026-10-19T07:30:15.123456")
+    assert round_trip(value)["timestamp"] == "2026-10-19T07:30:15"
+
+
+# ---------------------------------------------------------
+# Fields the layout can't carry
+# ---------------------------------------------------------
+@pytest.mark.parametrize("bad", [
+    med(1, expiry="1999-12-31"),
+    med(1, expiry="2179-06-06"),
+    med(1, expiry="2400-01-01"),
+    med(1, compartment=256),
+    med(1, compartment=-1),
+    med(-1),
+    med(0x100000000),
+    med(1, dosages=[dose(0x100000000)]),
+    med(1, dosages=[dose(1, start="24:00")]),
+    med(1, dosages=[dose(1, end="99:99")]),
+    med(1, dosages=[dose(i) for i in range(256)]),
+])
+def test_overflow_is_rejected(bad):
+    with pytest.raises(ScheduleFormatError):
+        encode_schedule(payload(bad))
+
+
+def test_string_table_overflow_is_rejected():
+    meds = [med(i, name=f"{i:05d}" + "x" * 1000) for i in range(70)]
+    with pytest.raises(ScheduleFormatError):
+        encode_schedule(payload(*meds))
+
+
+def test_errors_are_value_errors_not_struct_errors():
+    with pytest.raises(ValueError) as info:
+        encode_schedule(payload(med(1, compartment=300)))
+    assert not isinstance(info.value, struct.error)
+
+
+# ---------------------------------------------------------
+# Decoder guards
+# ---------------------------------------------------------
+def test_decode_rejects_bad_input():
+    data = encode_schedule(payload(med(1, dosages=[dose(1)])))
+
+    with pytest.raises(ScheduleFormatError):
+        decode_schedule(data[:HEADER.size - 1])
+    with pytest.raises(ScheduleFormatError):
+        decode_schedule(b"XXXX" + data[4:])
+    with pytest.raises(ScheduleFormatError):
+        decode_schedule(data[:4] + b"\x02" + data[5:])
+    with pytest.raises(ScheduleFormatError):
+        decode_schedule(data[:-1])
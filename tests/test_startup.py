@@ -0,0 +1,21 @@
+# tests/test_startup.py
+
+from app.commands import APP_BOOT_BUDGET, LAZY_MODULES, framework_floor, profile_startup
+
+
+def test_worker_boot(tmp_path, monkeypatch):
+    # Boots touch no schema, but keep them off the bundled database
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'boot.db'}")
+
+    profiles = [profile_startup() for _ in range(3)]
+    seconds = min(p[0] for p in profiles)
+
+    # Audio toolchain stays lazy (first use, not import)
+    for _, _, loaded in profiles:
+        assert not loaded, f"loaded at start-up: {loaded} (should be lazy: {LAZY_MODULES})"
+
+    # What the app adds on top of importing the framework itself
+    share = seconds - framework_floor(3)
+    assert share < APP_BOOT_BUDGET, (
+        f"app adds {share:.3f}s to boot ({seconds:.3f}s total), budget {APP_BOOT_BUDGET}s"
+    )